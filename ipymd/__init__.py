@@ -14,6 +14,7 @@ from . import plotting
 from . import shared
 from .shared.colors import available_colors
 from .shared import get_data_path 
+from .shared.atoms import Atoms
 
 from ._version import __version__
 
@@ -8,15 +8,21 @@ functions based on nearest neighbour calculations
 
 """
 import math
+import itertools
 import pandas as pd
 import numpy as np
 from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from collections import Counter
 from IPython.core.display import clear_output
 import matplotlib.patches as mpatches
 
 from .. import shared
+from ..shared import colors
 from ..atom_manipulation import Atom_Manipulation
+from ..shared.transformations import Cell
+from ..shared.atoms import as_dataframe, as_positions
 from ..plotting import Plotter
 
 def _createTreeFromEdges(edges):
@@ -60,10 +66,11 @@ def guess_bonds(atoms_df, covalent_radii=None, threshold=0.1, max_length=5.,
     
     Parameters
     ----------
-    atoms_df : pandas.Dataframe
-        all atoms, requires colums ['x','y','z','type', 'color']
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z','type'] and colors (see shared.colors.get_rgba)
     covalent_radii : dict or None
         a dict of covalent radii for each atom type, if None then taken from ipymd.shared.atom_data
+        (atoms of types without a radius are not bonded)
     threshold : float
         include bonds with distance +/- threshold of guessed bond length (Angstrom)
     max_length : float
@@ -81,6 +88,8 @@ def guess_bonds(atoms_df, covalent_radii=None, threshold=0.1, max_length=5.,
         a dataframe with start/end indexes relating to atoms in atoms_df
     
     """
+    r_array = as_positions(atoms_df)
+    atoms_df = as_dataframe(atoms_df)
     if atoms_df.index.tolist() != [_ for _ in range(atoms_df.shape[0])]:
         raise ValueError('the index for atoms_df must be in order, i.e. [0,1,2,...]')
         
@@ -88,40 +97,35 @@ def guess_bonds(atoms_df, covalent_radii=None, threshold=0.1, max_length=5.,
         df = shared.atom_data()  
         covalent_radii = df.RCov.to_dict()
         
-    r_array = atoms_df[['x','y','z']].values
+    # lookup the radius of each atom, by its type code
+    atom_radii = shared.type_lookup(atoms_df['type'], covalent_radii).astype(float)
     
     ck = cKDTree(r_array)
-    pairs = ck.query_pairs(max_length)
+    pairs = ck.query_pairs(max_length, output_type='ndarray').reshape(-1, 2)
+    i, j = pairs[:,0], pairs[:,1]
     
-    bonds = []
-    for i,j in pairs:
-        a, b = covalent_radii[atoms_df.iloc[i].type], covalent_radii[atoms_df.iloc[j].type]
-        rval = a + b
-        
-        thr_a = rval - threshold
-        thr_b = rval + threshold 
-        
-        #thr_a2 = thr_a * thr_a
-        thr_b2 = thr_b * thr_b
-        dr2  = ((r_array[i] - r_array[j])**2).sum()
-        
-        # print(dr2)
-        
-        if dr2 < thr_b2:
-            if color is None:
-                bonds.append((i, j,math.sqrt(dr2),radius,
-                              atoms_df.iloc[i].color,atoms_df.iloc[j].color,transparency))
-            else:
-                bonds.append((i, j,math.sqrt(dr2),radius,
-                              color,color,transparency))
+    thr_b = atom_radii[i] + atom_radii[j] + threshold 
+    dr2 = ((r_array[i] - r_array[j])**2).sum(axis=1)
+    bonded = dr2 < thr_b * thr_b
+    i, j, dr2 = i[bonded], j[bonded], dr2[bonded]
+    
+    if color is None:
+        atom_colors = np.empty(r_array.shape[0], dtype=object)
+        atom_colors[:] = [tuple(rgba) for rgba in colors.get_rgba(atoms_df).tolist()]
+        color_start, color_end = atom_colors[i], atom_colors[j]
+    else:
+        color_start = color_end = [color] * i.shape[0]
                 
-    return pd.DataFrame(bonds, columns=['start','end','length','radius','color_start','color_end','transparency'])
+    return pd.DataFrame({'start':i, 'end':j, 'length':np.sqrt(dr2), 'radius':radius, 
+                         'color_start':color_start, 'color_end':color_end, 
+                         'transparency':transparency},
+                        columns=['start','end','length','radius','color_start','color_end','transparency'])
 
 def bond_lengths(atoms_df, coord_type, lattice_type, max_dist=4, max_coord=16,
                       repeat_meta=None, rounded=2, min_dist=0.01, leafsize=100):
     """ calculate the unique bond lengths atoms in coords_atoms, w.r.t lattice_atoms
     
-    atoms_df : pandas.Dataframe
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
         all atoms
     coord_type : string
         atoms to calcualte coordination of
@@ -144,6 +148,7 @@ def bond_lengths(atoms_df, coord_type, lattice_type, max_dist=4, max_coord=16,
         list of unique distances
     
     """        
+    atoms_df = as_dataframe(atoms_df)
     if not coord_type in atoms_df.type.values or not lattice_type in atoms_df.type.values:
         return set([])
     
@@ -156,8 +161,8 @@ def bond_lengths(atoms_df, coord_type, lattice_type, max_dist=4, max_coord=16,
     if repeat_meta is not None:
         lattice_df.repeat_cell((-1,1),(-1,1),(-1,1))
 
-    lattice_tree = cKDTree(lattice_df.df[['x','y','z']].values, leafsize=leafsize)
-    all_dists,all_ids = lattice_tree.query(coord_df.df[['x','y','z']].values, k=max_coord, distance_upper_bound=max_dist)
+    lattice_tree = cKDTree(as_positions(lattice_df.df), leafsize=leafsize)
+    all_dists,all_ids = lattice_tree.query(as_positions(coord_df.df), k=max_coord, distance_upper_bound=max_dist)
     
     distances = []
     for dists in all_dists:
@@ -173,7 +178,7 @@ def coordination(coord_atoms_df, lattice_atoms_df, max_dist=4, max_coord=16,
     
     coords_atoms_df : pandas.Dataframe
         atoms to calcualte coordination of
-    lattice_atoms_df : pandas.Dataframe
+    lattice_atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
         atoms to act as lattice for coordination
     max_dist : float
         maximum distance for coordination consideration
@@ -192,18 +197,18 @@ def coordination(coord_atoms_df, lattice_atoms_df, max_dist=4, max_coord=16,
         list of coordination numbers
     
     """
-    lattice_df = Atom_Manipulation(lattice_atoms_df,repeat_meta)
-    
+    coord_atoms_df = as_dataframe(coord_atoms_df)
+    lattice_atoms_df = as_dataframe(lattice_atoms_df)
     if repeat_meta is not None:
+        lattice_df = Atom_Manipulation(lattice_atoms_df,repeat_meta)
         lattice_df.repeat_cell((-1,1),(-1,1),(-1,1))
+        lattice_atoms_df = lattice_df.df
 
-    lattice_tree = cKDTree(lattice_df.df[['x','y','z']].values, leafsize=leafsize)
-    all_dists,all_ids = lattice_tree.query(coord_atoms_df[['x','y','z']].values, k=max_coord, distance_upper_bound=max_dist)
+    lattice_tree = cKDTree(as_positions(lattice_atoms_df), leafsize=leafsize)
+    all_dists,all_ids = lattice_tree.query(as_positions(coord_atoms_df), k=max_coord, distance_upper_bound=max_dist)
     
-    coords = []
-    for dists in all_dists:
-        coords.append(np.count_nonzero(np.logical_and(dists>min_dist, dists<np.inf)))
-    return coords
+    coords = np.count_nonzero(np.logical_and(all_dists>min_dist, all_dists<np.inf), axis=1)
+    return coords.tolist()
 
 def coordination_bytype(atoms_df, coord_type, lattice_type, max_dist=4, max_coord=16,
                       repeat_meta=None, min_dist=0.01, leafsize=100):
@@ -212,7 +217,7 @@ def coordination_bytype(atoms_df, coord_type, lattice_type, max_dist=4, max_coor
     
     effectively an extension of calc_df_coordination
     
-    atoms_df : pandas.Dataframe
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
         all atoms
     coord_type : string
         atoms to calcualte coordination of
@@ -235,32 +240,32 @@ def coordination_bytype(atoms_df, coord_type, lattice_type, max_dist=4, max_coor
         copy of atoms_df with new column named coord_{coord_type}_{lattice_type}
     
     """
-    df = atoms_df.copy()
-    df['coord_{0}_{1}'.format(coord_type, lattice_type)] = np.nan      
+    atoms_df = as_dataframe(atoms_df)
+    # only a column is added, so a shallow copy is sufficient
+    df = atoms_df.copy(deep=False)
+    coord_col = 'coord_{0}_{1}'.format(coord_type, lattice_type)
+    df[coord_col] = np.nan      
 
     if not coord_type in df.type.values or not lattice_type in df.type.values:
         return df
     
-    coord_df = Atom_Manipulation(df)
-    coord_df.filter_variables(coord_type)
-   
-    lattice_df = Atom_Manipulation(df)
-    lattice_df.filter_variables(lattice_type)
-            
-    coords = coordination(coord_df.df,lattice_df.df,max_dist, max_coord,
+    is_coord = (df['type']==coord_type).values
+    is_lattice = (df['type']==lattice_type).values
+    coords = coordination(df[is_coord],df[is_lattice],max_dist, max_coord,
                                     repeat_meta, min_dist, leafsize)
                                     
-
-    df.loc[df['type']==coord_type,'coord_{0}_{1}'.format(coord_type, lattice_type)] = coords
+    values = df[coord_col].values.copy()
+    values[is_coord] = coords
+    df[coord_col] = values
     
     return df
         
 def compare_to_lattice(atoms_df, lattice_atoms_df, max_dist=10,leafsize=100):
     """ calculate the minimum distance of each atom in atoms_df from a lattice point in lattice_atoms_df
     
-    atoms_df : pandas.Dataframe
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
         atoms to calculate for
-    lattice_atoms_df : pandas.Dataframe
+    lattice_atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
         atoms to act as lattice points
     max_dist : float
         maximum distance for consideration in computation
@@ -273,8 +278,10 @@ def compare_to_lattice(atoms_df, lattice_atoms_df, max_dist=10,leafsize=100):
         list of distances to nearest atom in lattice
     
     """
-    lattice_tree = cKDTree(lattice_atoms_df[['x','y','z']].values, leafsize=leafsize)
-    dists,idnums = lattice_tree.query(atoms_df[['x','y','z']].values, k=1, distance_upper_bound=max_dist)
+    atoms_df = as_dataframe(atoms_df)
+    lattice_atoms_df = as_dataframe(lattice_atoms_df)
+    lattice_tree = cKDTree(as_positions(lattice_atoms_df), leafsize=leafsize)
+    dists,idnums = lattice_tree.query(as_positions(atoms_df), k=1, distance_upper_bound=max_dist)
     return dists
 
 def vacancy_identification(atoms_df, res=0.2, nn_dist=2., repeat_meta=None, remove_dups=True,
@@ -282,7 +289,7 @@ def vacancy_identification(atoms_df, res=0.2, nn_dist=2., repeat_meta=None, remo
              n_jobs=1, ipython_progress=False, ):
         """ identify vacancies
         
-        atoms_df : pandas.Dataframe
+        atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
             atoms to calculate for
         res : float
             resolution of vacancy identification, i.e. spacing of reference lattice
@@ -305,6 +312,7 @@ def vacancy_identification(atoms_df, res=0.2, nn_dist=2., repeat_meta=None, remo
             new atom dataframe of vacancy sites as atoms
         
         """
+        atoms_df = as_dataframe(atoms_df)
         xmin, xmax = atoms_df.x.min(),atoms_df.x.max()
         ymin, ymax = atoms_df.y.min(),atoms_df.y.max()
         zmin, zmax = atoms_df.z.min(),atoms_df.z.max()
@@ -321,7 +329,7 @@ def vacancy_identification(atoms_df, res=0.2, nn_dist=2., repeat_meta=None, remo
             clear_output()
             print('creating nearest neighbour tree')
         
-        lattice_tree = cKDTree(lattice_df[['x','y','z']].values, leafsize=leafsize)
+        lattice_tree = cKDTree(as_positions(lattice_df), leafsize=leafsize)
 
         if ipython_progress:
             clear_output()
@@ -349,12 +357,6 @@ def vacancy_identification(atoms_df, res=0.2, nn_dist=2., repeat_meta=None, remo
         
         return df
     
-#TODO group atoms into specified molecules e.g. S2 or CaCO3
-# http://chemwiki.ucdavis.edu/Textbook_Maps/Inorganic_Chemistry_Textbook_Maps/Map%3A_Inorganic_Chemistry_(Wikibook)/Chapter_08%3A_Ionic_and_Covalent_Solids_-_Structures/8.2%3A_Structures_related_to_NaCl_and_NiAs
-# maybe supply central atom type(s) and 'other' atoms type(s), filter df by required atom types, 
-# then find nearest neighbours of central (removing molecule each time)
-# create molecule x,y,z from average of central atoms
-        
 #http://www.ovito.org/manual/particles.modifiers.common_neighbor_analysis.html
 #https://www.quora.com/Given-a-set-of-atomic-types-and-coordinates-from-an-MD-simulation-is-there-a-good-algorithm-for-determining-its-likely-crystal-structure?__filter__=all&__nsrc__=2&__snid3__=179254150
 # http://iopscience.iop.org/article/10.1088/0965-0393/20/4/045021/pdf            
@@ -385,7 +387,9 @@ def common_neighbour_analysis(atoms_df, upper_bound=4, max_neighbours=24,
         copy of atoms_df with new column named cna
 
     """
-    df = atoms_df.copy()
+    atoms_df = as_dataframe(atoms_df)
+    # only a column is added, so a shallow copy is sufficient
+    df = atoms_df.copy(deep=False)
     max_id = df.shape[0] - 1 # starts at 0
     
     if repeat_meta is not None:
@@ -399,8 +403,9 @@ def common_neighbour_analysis(atoms_df, upper_bound=4, max_neighbours=24,
         print('creating nearest neighbours dictionary')
     
     # create nearest neighbours dictionary
-    lattice_tree = cKDTree(lattice_df[['x','y','z']].values, leafsize=leafsize)
-    all_dists,all_ids = lattice_tree.query(lattice_df[['x','y','z']].values, k=max_neighbours+1, distance_upper_bound=upper_bound)
+    lattice_xyz = as_positions(lattice_df)
+    lattice_tree = cKDTree(lattice_xyz, leafsize=leafsize)
+    all_dists,all_ids = lattice_tree.query(lattice_xyz, k=max_neighbours+1, distance_upper_bound=upper_bound)
     
     nn_ids = {}
     #nn_dists = {}
@@ -413,7 +418,7 @@ def common_neighbour_analysis(atoms_df, upper_bound=4, max_neighbours=24,
         #nn_dists[ids[0]] = dists[mask]
         
     jkls = {}
-    for lid, nns in nn_ids.iteritems():
+    for lid, nns in nn_ids.items():
         if lid > max_id:
             continue
         if ipython_progress:
@@ -434,7 +439,7 @@ def common_neighbour_analysis(atoms_df, upper_bound=4, max_neighbours=24,
             # l is longest chain of nearest neighbour bonds
             tree = _createTreeFromEdges(nn_bonds)
             chain_lengths = [0]
-            for node in tree.iterkeys():
+            for node in tree.keys():
                 chain_lengths.append(len(_longest_path(node, tree))-1)
             l = max(chain_lengths)
 
@@ -608,60 +613,774 @@ def cna_plot(atoms_df, upper_bound=4, max_neighbours=24,
     
     return plot
 
-#TODO _group_molecules needs work
-def _group_molecules(atom_df,moltypes,maxdist=3,repeat_meta=None,
-                    mean_xyz=True,remove_atoms=True,
-                    color='red',transparency=1.,radius=1.,
-                    leafsize=100):
-    molname = ''.join(['{}_{}'.format(k,v) 
-                    for k,v in Counter(moltypes).iteritems()])
+def _cell_matrix(repeat_meta):
+    """ return the a,b,c vectors of the meta data as the rows of a (3,3) array """
+    return Cell.from_meta(repeat_meta).matrix
 
-    search_df = atom_df[atom_df.type.isin([moltypes[0]])].copy()
-    #old_index = search_df.index
-    search_df.reset_index(inplace=True)
+def _periodic_images(xyz, repeat_meta):
+    """ create the 26 surrounding periodic images of the points 
+    
+    Returns
+    -------
+    images : numpy.array((27*N,3))
+        the points and their images, the original points are the 14th block
+        i.e. images[13*N:14*N]
+    source : numpy.array((27*N,))
+        the index of the original point for each image
+    
+    """
+    shifts = np.array(list(itertools.product([-1,0,1],repeat=3)))
+    shifts = shifts.dot(_cell_matrix(repeat_meta))
+    images = (xyz[np.newaxis,:,:] + shifts[:,np.newaxis,:]).reshape(-1,3)
+    source = np.tile(np.arange(xyz.shape[0]), shifts.shape[0])
+    return images, source
 
-    if repeat_meta is not None:
-        manip = Atom_Manipulation(search_df,repeat_meta)
-        manip.repeat_cell((-1,1), (-1,1), (-1, 1),original_first=True)
-        lattice_df = manip.df
-        lattice_df.reset_index(inplace=True,drop=True)
-        rep_map = dict(zip(range(lattice_df.shape[0]),list(search_df.index)*27))
+def _neighbour_pairs(xyz, max_dist, repeat_meta=None, leafsize=100, dtype=float):
+    """ compute all (directed) pairs of points within max_dist of each other
+
+    Parameters
+    ----------
+    xyz : numpy.array((N,3))
+        coordinates of the points
+    max_dist : float
+        maximum distance between points of a pair
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    dtype : numpy.dtype
+        float type of the returned vectors and distances
+
+    Returns
+    -------
+    i : numpy.array((M,))
+        index of first point of each pair (sorted in ascending order)
+    j : numpy.array((M,))
+        index of second point of each pair
+    vectors : numpy.array((M,3))
+        vector from point i to (the nearest periodic image of) point j
+    dists : numpy.array((M,))
+        length of each vector
+
+    """
+    xyz = np.asarray(xyz, dtype=float)
+    num_pts = xyz.shape[0]
+    tree = cKDTree(xyz, leafsize=leafsize)
+
+    if repeat_meta is None:
+        pairs = tree.query_pairs(max_dist, output_type='ndarray')
+        i = np.concatenate([pairs[:,0], pairs[:,1]])
+        j = np.concatenate([pairs[:,1], pairs[:,0]])
+        vectors = xyz[j] - xyz[i]
     else:
-        lattice_df = search_df.copy()    
-        rep_map = dict(zip(range(search_df.shape[0]),list(search_df.index)))
-
-    lattice_tree = cKDTree(lattice_df[['x','y','z']].values, leafsize=leafsize)
-    dists,idnums = lattice_tree.query(search_df[['x','y','z']].values, k=len(moltypes), distance_upper_bound=maxdist)
-
-    mol_data = []
-    used_repeat = []
-    for i,dist,idnum in zip(search_df.index, dists,idnums):
-        #print i, old_index[i], dist, [rep_map[m] for m in idnum]
-        if i in used_repeat:
-            continue    
-        mol = [i]
-        for j, d in zip(idnum[1:],dist[1:]):
-            if not j in mol and not np.isinf(d) and not rep_map.get(j) in used_repeat:
-                #used_repeat.append(rep_map[j])
-                mol.append(j)
-            else:
-                print('warning incomplete molecule')#, idnum, dist, j, rep_map.get(j)
+        images, source = _periodic_images(xyz, repeat_meta)
+        image_tree = cKDTree(images, leafsize=leafsize)
+        pairs = tree.sparse_distance_matrix(image_tree, max_dist, 
+                                            output_type='ndarray')
+        i, k = pairs['i'], pairs['j']
+        # remove self-interaction
+        mask = k != i + 13*num_pts
+        i, k = i[mask], k[mask]
+        j = source[k]
+        vectors = images[k] - xyz[i]
+
+    order = np.argsort(i, kind='mergesort')
+    i, j, vectors = i[order], j[order], vectors[order].astype(dtype, copy=False)
+    dists = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    
+    return i, j, vectors, dists
+
+def _nearest_neighbours(xyz, k, max_dist=np.inf, repeat_meta=None, leafsize=100, dtype=float):
+    """ compute the k nearest neighbours of each point
+    
+    Parameters
+    ----------
+    xyz : numpy.array((N,3))
+        coordinates of the points
+    k : int
+        number of nearest neighbours
+    max_dist : float
+        maximum distance for nearest neighbour consideration
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    dtype : numpy.dtype
+        float type of the returned vectors and distances
+
+    Returns
+    -------
+    ids : numpy.array((N,k))
+        index of each neighbour (-1 if no neighbour found within max_dist)
+    vectors : numpy.array((N,k,3))
+        vector from point to (the nearest periodic image of) each neighbour
+        (nan if no neighbour found)
+    dists : numpy.array((N,k))
+        length of each vector (inf if no neighbour found)
         
-        repeat_mol = [rep_map[m] for m in mol]
-        if len(mol) == len(moltypes):
-            
-            used_repeat.extend(repeat_mol)
-            if mean_xyz:
-                x,y,z = search_df.loc[repeat_mol,['x','y','z']].mean().values
-            else:
-                x,y,z = search_df.loc[i,['x','y','z']].values
-            mol_data.append([molname,x,y,z,radius,color,transparency])
-        #print i, repeat_mol
+    """
+    xyz = np.asarray(xyz, dtype=float)
+    num_pts = xyz.shape[0]
+    
+    if repeat_meta is None:
+        images, source = xyz, np.arange(num_pts)
+        self_ids = np.arange(num_pts)
+    else:
+        images, source = _periodic_images(xyz, repeat_meta)
+        self_ids = np.arange(num_pts) + 13*num_pts
+    
+    tree = cKDTree(images, leafsize=leafsize)
+    dists, image_ids = tree.query(xyz, k=k+1, distance_upper_bound=max_dist)
+    
+    # remove self-interaction, maintaining the order of the remaining neighbours
+    not_self = image_ids != self_ids[:,np.newaxis]
+    order = np.argsort(~not_self, axis=1, kind='mergesort')[:,:k]
+    dists = np.take_along_axis(dists, order, axis=1)
+    image_ids = np.take_along_axis(image_ids, order, axis=1)
+    
+    found = image_ids < images.shape[0]
+    image_ids = np.where(found, image_ids, 0)
+    ids = np.where(found, source[image_ids], -1)
+    vectors = (images[image_ids] - xyz[:,np.newaxis,:]).astype(dtype, copy=False)
+    vectors[~found] = np.nan
+    
+    return ids, vectors, dists.astype(dtype, copy=False)
+
+def _formulas(type_codes, type_names, groups, num_groups):
+    """ return a formula string for each group, e.g. 'Ca_1C_1O_3'
+    
+    type_codes : numpy.array((N,))
+        integer code of each atom's type
+    type_names : list
+        the type name for each code
+    groups : numpy.array((N,))
+        group id of each atom (0 to num_groups-1)
+    """
+    num_types = len(type_names)
+    counts = np.bincount(groups*num_types + type_codes, 
+                         minlength=num_groups*num_types).reshape(num_groups, num_types)
+    # only create the strings for each unique composition
+    compositions, inverse = np.unique(counts, axis=0, return_inverse=True)
+    names = np.array([''.join(['{}_{}'.format(type_names[t], n) 
+                               for t, n in enumerate(comp) if n > 0])
+                      for comp in compositions], dtype=object)
+    return names[inverse.reshape(-1)]
+
+def _molformula(moltypes):
+    """ return the formula string of a list of atom types, e.g. ['S','S'] -> 'S_2' """
+    counter = Counter(moltypes)
+    return ''.join(['{}_{}'.format(k, counter[k]) for k in sorted(counter)])
+
+def cluster_atoms(atoms_df, max_dist=2., types=None, repeat_meta=None, 
+                  mass_col=None, leafsize=100):
+    """ group atoms into clusters (e.g. molecules) of bonded atoms
+    
+    atoms are considered bonded if they are within max_dist of each other,
+    and the clusters are the connected components of the resulting bond graph
+
+    Parameters
+    ----------
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z','type']
+    max_dist : float
+        maximum bond length between atoms of a cluster
+    types : list or None
+        the atom types to consider, if None then all atoms are considered
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    mass_col : str or None
+        column containing the atom masses, used to compute the cluster centres, 
+        if None then all atoms are weighted equally
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        copy of atoms_df with new column named cluster (-1 for atoms not considered)
+    clusters_df : pandas.Dataframe
+        a table of the clusters with columns; cluster, natoms, formula, x, y, z
+        (where x, y, z is the centre of mass, wrapped into the cell if repeat_meta is given)
+    
+    """
+    xyz = as_positions(atoms_df)
+    df = as_dataframe(atoms_df, copy=True)
+    df['cluster'] = -1
+    
+    if types is None:
+        select = np.ones(df.shape[0], dtype=bool)
+    else:
+        select = df.type.isin(list(types)).values
+    num_atoms = np.count_nonzero(select)
+    
+    xyz = xyz[select]
+    i, j, vectors, dists = _neighbour_pairs(xyz, max_dist, repeat_meta, leafsize)
+    
+    graph = coo_matrix((np.ones(i.shape[0], dtype=bool), (i, j)), 
+                       shape=(num_atoms, num_atoms))
+    num_clusters, labels = connected_components(graph, directed=False)
+    df.loc[select, 'cluster'] = labels
+    
+    if mass_col is None:
+        weights = np.ones(num_atoms)
+    else:
+        weights = df[mass_col].values[select].astype(float)
+    total_weight = np.bincount(labels, weights=weights, minlength=num_clusters)
+    natoms = np.bincount(labels, minlength=num_clusters)
+    
+    # compute positions relative to the first atom of each cluster,
+    # taking the nearest periodic image of the other atoms
+    first = np.unique(labels, return_index=True)[1]
+    rel_xyz = xyz - xyz[first][labels]
+    if repeat_meta is not None:
+        rel_xyz = Cell.from_meta(repeat_meta).minimum_image(rel_xyz)
+    centres = np.empty((num_clusters, 3))
+    for dim in range(3):
+        centres[:,dim] = np.bincount(labels, weights=weights*rel_xyz[:,dim], 
+                                     minlength=num_clusters) / total_weight
+    centres += xyz[first]
+    if repeat_meta is not None:
+        # wrap the centres back into the cell
+        cell = Cell.from_meta(repeat_meta)
+        frac = cell.to_fractional(centres)
+        centres = cell.to_cartesian(frac - np.floor(frac))
+        
+    type_codes, type_names = pd.factorize(df.type.values[select], sort=True)
+    formulas = _formulas(type_codes, list(type_names), labels, num_clusters)
+    
+    clusters_df = pd.DataFrame({'cluster':np.arange(num_clusters), 'natoms':natoms,
+                                'formula':formulas, 'x':centres[:,0],
+                                'y':centres[:,1], 'z':centres[:,2]},
+                                columns=['cluster','natoms','formula','x','y','z'])
+    
+    return df, clusters_df
+
+def group_molecules(atom_df, moltypes, maxdist=3, repeat_meta=None,
+                    mean_xyz=True, remove_atoms=True,
+                    color='red', transparency=1., radius=1.,
+                    leafsize=100):
+    """ group atoms into specified molecules, e.g. S2 or CaCO3
+    
+    molecules are the clusters of bonded atoms (of the required types), 
+    with the same composition as moltypes
+    
+    Parameters
+    ----------
+    atom_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z','type']
+    moltypes : list
+        the atom types of the molecule, e.g. ['S','S'] or ['Ca','C','O','O','O']
+    maxdist : float
+        maximum bond length between atoms of a molecule
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    mean_xyz : bool
+        use the mean coordinate of atoms for molecule, otherwise use coordinate of first atom
+    remove_atoms : bool
+        remove the grouped atoms from the dataframe
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    
+    Returns
+    -------
+    df : pandas.Dataframe
+        copy of atom_df with the molecules added as new atoms (of type molname)
+    
+    """
+    atom_df = as_dataframe(atom_df)
+    molname = _molformula(moltypes)
+
+    df, clusters_df = cluster_atoms(atom_df, maxdist, set(moltypes), repeat_meta, 
+                                    leafsize=leafsize)
+    mol_clusters = clusters_df[clusters_df.formula == molname]
+    
+    if mean_xyz:
+        mol_xyz = mol_clusters[['x','y','z']].values
+    else:
+        in_mol = df.cluster.isin(mol_clusters.cluster.values).values
+        first_atoms = df[in_mol].drop_duplicates('cluster').set_index('cluster')
+        mol_xyz = first_atoms.loc[mol_clusters.cluster.values, ['x','y','z']].values
 
-    df = atom_df.copy()
     if remove_atoms:
-        df.drop(used_repeat, inplace=True)
-    if mol_data:
-        moldf = pd.DataFrame(mol_data,columns=['type','x','y','z','radius','color','transparency'])
+        df = df[~df.cluster.isin(mol_clusters.cluster.values).values]
+    df = df.drop('cluster', axis=1)
+    
+    if mol_clusters.shape[0] > 0:
+        moldf = pd.DataFrame({'type':molname, 'x':mol_xyz[:,0], 'y':mol_xyz[:,1],
+                              'z':mol_xyz[:,2], 'radius':radius, 'color':[color]*mol_xyz.shape[0],
+                              'transparency':transparency},
+                             columns=['type','x','y','z','radius','color','transparency'])
         df = pd.concat([df,moldf])
     return df
+
+def _sph_harm(l, vectors):
+    """ compute the spherical harmonics, Y_lm, of each vector, for m >= 0
+    
+    (since Y_l(-m) = (-1)^m Y_lm^*)
+    
+    l : int
+        degree of the spherical harmonics
+    vectors : numpy.array((N,3))
+    
+    Returns
+    -------
+    ylm : numpy.array((l+1,N),dtype=complex)
+        with rows ordered m = 0, ..., l
+    
+    """
+    x, y, z = vectors.T
+    rho_sqr = x*x + y*y
+    r = np.sqrt(rho_sqr + z*z)
+    rho = np.sqrt(rho_sqr)
+    cos_theta = z / r
+    sin_theta = rho / r
+    # exp(i*phi), with phi = 0 for vectors along the z-axis
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eiphi = np.where(rho > 0, (x + 1j*y) / rho, 1.)
+    
+    ylm = np.empty((l+1, vectors.shape[0]), dtype=np.result_type(vectors.dtype, np.complex64))
+    # associated Legendre polynomials (including Condon-Shortley phase), 
+    # computed by upward recurrence in degree, starting from P_m^m
+    pmm = np.ones_like(cos_theta)
+    eimphi = np.ones_like(eiphi)
+    for m in range(l+1):
+        if m > 0:
+            pmm = -(2*m-1) * sin_theta * pmm
+            eimphi = eimphi * eiphi
+        plm_2, plm_1 = None, pmm
+        for ll in range(m+1, l+1):
+            if plm_2 is None:
+                plm = (2*m+1) * cos_theta * plm_1
+            else:
+                plm = ((2*ll-1)*cos_theta*plm_1 - (ll+m-1)*plm_2) / (ll-m)
+            plm_2, plm_1 = plm_1, plm
+        norm = math.sqrt((2*l+1) / (4*math.pi) * 
+                         math.factorial(l-m) / float(math.factorial(l+m)))
+        np.multiply(norm * plm_1, eimphi, out=ylm[m])
+    
+    return ylm
+
+def _expand_negative_m(qlm):
+    """ expand an array (l+1,N) for m = 0, ..., l to (2l+1,N) for m = -l, ..., l
+    
+    using q_l(-m) = (-1)^m q_lm^*
+    """
+    l = qlm.shape[0] - 1
+    signs = (-1.)**np.arange(l, 0, -1)
+    return np.concatenate([signs[:,np.newaxis] * np.conj(qlm[:0:-1]), qlm])
+
+def _wigner_3j(j1, j2, j3, m1, m2, m3):
+    """ compute the Wigner 3-j symbol (for integer arguments) via the Racah formula """
+    if m1 + m2 + m3 != 0 or abs(m1) > j1 or abs(m2) > j2 or abs(m3) > j3:
+        return 0.
+    if j3 < abs(j1-j2) or j3 > j1+j2:
+        return 0.
+    f = math.factorial
+    triangle = (f(j1+j2-j3) * f(j1-j2+j3) * f(-j1+j2+j3)) / float(f(j1+j2+j3+1))
+    prefactor = (-1)**(j1-j2-m3) * math.sqrt(triangle * f(j1+m1) * f(j1-m1) * 
+                                 f(j2+m2) * f(j2-m2) * f(j3+m3) * f(j3-m3))
+    kmin = max(0, j2-j3-m1, j1-j3+m2)
+    kmax = min(j1+j2-j3, j1-m1, j2+m2)
+    total = 0.
+    for k in range(kmin, kmax+1):
+        total += (-1)**k / float(f(k) * f(j3-j2+k+m1) * f(j3-j1+k-m2) * 
+                                 f(j1+j2-j3-k) * f(j1-k-m1) * f(j2-k+m2))
+    return prefactor * total
+
+def _reduce_per_atom(values, i, num_atoms):
+    """ sum the bond values (last axis) for each atom, 
+    where i (sorted) gives the atom of each bond 
+    """
+    counts = np.bincount(i, minlength=num_atoms)
+    has_bonds = counts > 0
+    starts = np.cumsum(counts) - counts
+    
+    summed = np.zeros(values.shape[:-1] + (num_atoms,), dtype=values.dtype)
+    if values.shape[-1] > 0:
+        summed[...,has_bonds] = np.add.reduceat(values, starts[has_bonds], axis=-1)
+    return summed, counts
+
+def _steinhardt_ql(qlm, l):
+    """ compute the rotationally invariant q_l, from q_lm (2l+1,N) """
+    return np.sqrt(4*math.pi/(2*l+1) * 
+                   np.sum(qlm.real**2 + qlm.imag**2, axis=0))
+
+def _steinhardt_wl(qlm, l):
+    """ compute the rotationally invariant (normalised) w_l, from q_lm (2l+1,N) """
+    wl = np.zeros(qlm.shape[1])
+    for m1 in range(-l, l+1):
+        for m2 in range(max(-l, -l-m1), min(l, l-m1)+1):
+            m3 = -m1-m2
+            coeff = _wigner_3j(l, l, l, m1, m2, m3)
+            if coeff == 0.:
+                continue
+            wl += coeff * np.real(qlm[l+m1] * qlm[l+m2] * qlm[l+m3])
+    norm = np.sum(qlm.real**2 + qlm.imag**2, axis=0)**1.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return wl / norm
+
+def steinhardt_order(atoms_df, l_values=(4,6), w_values=(6,), max_dist=3.5, 
+                     repeat_meta=None, averaged=False, leafsize=100, precision='double'):
+    r""" compute the local Steinhardt bond-orientational order parameters of each atom
+    
+    Based on Steinhardt, Paul J., Nelson, David R. and Ronchetti, Marco,
+    'Bond-orientational order in liquids and glasses', 
+    July 1983, DOI: 10.1103/PhysRevB.28.784
+    
+    and the neighbour averaged variants of Lechner, Wolfgang and Dellago, Christoph,
+    'Accurate determination of crystal structures based on averaged local 
+    bond order parameters', 2008, DOI: 10.1063/1.2977970
+
+    ideally:
+    - FCC = q4 0.191, q6 0.575, w6 -0.013
+    - HCP = q4 0.097, q6 0.485, w6 -0.012
+    - BCC (8 neighbours) = q4 0.509, q6 0.629, w6 0.013
+    - Icosahedral = q4 0.000, q6 0.663, w6 -0.170
+
+    Parameters
+    ----------
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z']
+    l_values : list of int
+        the degrees of q_l to compute
+    w_values : list of int
+        the degrees of w_l to compute
+    max_dist : float
+        maximum distance for nearest neighbour consideration
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    averaged : bool
+        also compute the neighbour averaged parameters
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    precision : str
+        'single' or 'double' precision of the bond vector computations 
+        (single precision parameters are within ~1e-5 of double)
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        copy of atoms_df with new columns named q{l} and w{l} 
+        (and q{l}_avg and w{l}_avg if averaged), which are nan for atoms 
+        with no neighbours
+
+    Notes
+    -----
+    
+    .. math::
+
+        q_{lm}(i) = \frac{1}{N_b(i)} \sum_{j=1}^{N_b(i)} Y_{lm}(\mathbf{r}_{ij})
+        
+        q_l(i) = \sqrt{\frac{4\pi}{2l+1} \sum_{m=-l}^{l} \left| q_{lm}(i) \right|^2 }
+        
+        w_l(i) = \frac{\sum_{m_1+m_2+m_3=0} 
+        \begin{pmatrix}l & l & l\\m_1 & m_2 & m_3\end{pmatrix} 
+        q_{lm_1}(i) q_{lm_2}(i) q_{lm_3}(i)}{\left(\sum_{m=-l}^{l} \left| q_{lm}(i) \right|^2\right)^{3/2}}
+        
+    and the averaged variants use:
+
+    .. math::
+
+        \bar{q}_{lm}(i) = \frac{1}{N_b(i)+1} \sum_{k=0}^{N_b(i)} q_{lm}(k)
+
+    """
+    xyz = as_positions(atoms_df)
+    df = as_dataframe(atoms_df, copy=True)
+    num_atoms = xyz.shape[0]
+
+    i, j, vectors, dists = _neighbour_pairs(xyz, max_dist, repeat_meta, leafsize,
+                                            shared.get_float_dtype(precision))
+    
+    for l in sorted(set(l_values).union(w_values)):
+        summed, counts = _reduce_per_atom(_sph_harm(l, vectors), i, num_atoms)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            qlm = summed / counts
+        if averaged:
+            nn_summed, _ = _reduce_per_atom(qlm[:,j], i, num_atoms)
+            avg_qlm = _expand_negative_m((qlm + nn_summed) / (counts + 1))
+        qlm = _expand_negative_m(qlm)
+
+        if l in l_values:
+            df['q{}'.format(l)] = _steinhardt_ql(qlm, l)
+        if l in w_values:
+            df['w{}'.format(l)] = _steinhardt_wl(qlm, l)
+        
+        if averaged:
+            if l in l_values:
+                df['q{}_avg'.format(l)] = _steinhardt_ql(avg_qlm, l)
+            if l in w_values:
+                df['w{}_avg'.format(l)] = _steinhardt_wl(avg_qlm, l)
+                
+    return df
+
+def _centrosymmetry(vectors):
+    """ compute the centrosymmetry parameter from the nearest neighbour vectors (N,k,3) """
+    num_nns = vectors.shape[1]
+    jj, kk = np.triu_indices(num_nns, 1)
+    pair_sums = vectors[:,jj,:] + vectors[:,kk,:]
+    pair_sums = np.einsum('ijk,ijk->ij', pair_sums, pair_sums)
+    # sum of the N/2 smallest pair values
+    half = num_nns//2
+    return np.partition(pair_sums, half-1, axis=1)[:,:half].sum(axis=1)
+
+def centrosymmetry(atoms_df, num_neighbours=12, repeat_meta=None, 
+                   chunk_size=100000, leafsize=100, precision='double'):
+    r""" compute the centrosymmetry parameter of each atom
+    
+    Based on Kelchner, Cynthia L., Plimpton, Steve J. and Hamilton, J. C.,
+    'Dislocation nucleation and defect structure during surface indentation',
+    1998, DOI: 10.1103/PhysRevB.58.11085
+    
+    .. math::
+    
+        CSP = \sum_{i=1}^{N/2} \left| \mathbf{R}_i + \mathbf{R}_{i+N/2} \right|^2
+
+    where the N/2 pairs of opposite neighbours are those with the smallest 
+    contributions. CSP is ~0 for atoms in a perfect centrosymmetric lattice, 
+    and larger for atoms near defects (e.g. dislocations and surfaces).
+    
+    Parameters
+    ----------
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z']
+    num_neighbours : int
+        number of nearest neighbours to consider, 
+        e.g. 12 for FCC and 8 for BCC lattices
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    chunk_size : int
+        number of atoms to compute at once (to limit memory use)
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    precision : str
+        'single' or 'double' precision of the neighbour vector computations
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        copy of atoms_df with new column named csp 
+        
+    """
+    xyz = as_positions(atoms_df)
+    df = as_dataframe(atoms_df, copy=True)
+    ids, vectors, dists = _nearest_neighbours(xyz, num_neighbours, 
+                                              repeat_meta=repeat_meta, leafsize=leafsize,
+                                              dtype=shared.get_float_dtype(precision))
+    csp = np.empty(df.shape[0], dtype=vectors.dtype)
+    for start in range(0, df.shape[0], chunk_size):
+        csp[start:start+chunk_size] = _centrosymmetry(vectors[start:start+chunk_size])
+    df['csp'] = csp
+    return df
+
+def _match_ids(ids, ref_ids):
+    """ return the index in ref_ids of each id (-1 if not present) """
+    ref_order = np.argsort(ref_ids, kind='mergesort')
+    sorted_ref = ref_ids[ref_order]
+    pos = np.clip(np.searchsorted(sorted_ref, ids), 0, max(sorted_ref.shape[0]-1, 0))
+    found = sorted_ref[pos] == ids if sorted_ref.shape[0] > 0 else np.zeros(ids.shape, bool)
+    return np.where(found, ref_order[pos], -1)
+
+def _minimum_image(vectors, repeat_meta):
+    """ return the minimum image of each vector (N,3) """
+    return Cell.from_meta(repeat_meta).minimum_image(vectors)
+
+def displacements(atoms_df, ref_atoms_df, repeat_meta=None, id_col='id'):
+    """ compute the displacement of each atom from a reference configuration
+
+    Parameters
+    ----------
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        atoms to calculate for, requires colums ['x','y','z', id_col]
+    ref_atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        atoms of the reference configuration, requires colums ['x','y','z', id_col]
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data,
+        i.e. displacements are computed with the minimum image convention
+    id_col : str
+        column by which to match atoms to the reference configuration
+        
+    Returns
+    -------
+    df : pandas.Dataframe
+        copy of atoms_df with new columns named dx, dy, dz and displacement 
+        (nan for atoms not in the reference configuration)
+
+    """
+    xyz, ref_xyz = as_positions(atoms_df), as_positions(ref_atoms_df)
+    df = as_dataframe(atoms_df, copy=True)
+    ref_atoms_df = as_dataframe(ref_atoms_df)
+    ref_pos = _match_ids(df[id_col].values, ref_atoms_df[id_col].values)
+    found = ref_pos >= 0
+    
+    vectors = np.full((df.shape[0],3), np.nan)
+    vectors[found] = xyz[found] - ref_xyz[ref_pos[found]]
+    if repeat_meta is not None:
+        vectors[found] = _minimum_image(vectors[found], repeat_meta)
+    
+    df['dx'], df['dy'], df['dz'] = vectors.T
+    df['displacement'] = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    return df
+
+def displacement_trajectory(data_input, ref_config=1, configs=None, 
+                            num_neighbours=12, periodic=True, id_col='id',
+                            chunk_size=100000, leafsize=100, precision='double'):
+    """ compute the displacement and centrosymmetry of each atom, 
+    for each configuration in a trajectory 
+    
+    the reference configuration data (and nearest neighbour tree) 
+    is only computed once, and reused for each configuration. 
+    Displacements are of atoms matched by id_col (see displacements), 
+    the tree of reference sites is only used for ref_site and ref_dist
+    
+    Parameters
+    ----------
+    data_input : ipymd.data_input.base.DataInput
+        the (setup) trajectory data
+    ref_config : int
+        the reference configuration
+    configs : list of int or None
+        the configurations to compute, if None then all configurations are computed
+    num_neighbours : int
+        number of nearest neighbours to consider for the centrosymmetry parameter, 
+        e.g. 12 for FCC and 8 for BCC lattices
+    periodic : bool
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    id_col : str
+        column by which to match atoms to the reference configuration
+    chunk_size : int
+        number of atoms to compute at once (to limit memory use)
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    precision : str
+        'single' or 'double' precision of the centrosymmetry computation
+        
+    Yields
+    ------
+    config : int
+        the configuration
+    df : pandas.Dataframe
+        the atom data with new columns; csp, dx, dy, dz, displacement, 
+        ref_site (the id of the nearest reference atom site) and 
+        ref_dist (the distance to the nearest reference atom site)
+
+    """
+    if configs is None:
+        configs = range(1, data_input.count_configs()+1)
+        
+    ref_df = data_input.get_atom_data(ref_config)
+    ref_meta = data_input.get_meta_data(ref_config) if periodic else None
+    ref_xyz = ref_df[['x','y','z']].values
+    ref_ids = ref_df[id_col].values
+    
+    if periodic:
+        ref_images, ref_source = _periodic_images(ref_xyz, ref_meta)
+    else:
+        ref_images, ref_source = ref_xyz, np.arange(ref_xyz.shape[0])
+    ref_tree = cKDTree(ref_images, leafsize=leafsize)
+    
+    for config in configs:
+        meta = data_input.get_meta_data(config) if periodic else None
+        df = data_input.get_atom_data(config)
+        df = centrosymmetry(df, num_neighbours, meta, chunk_size, leafsize, precision)
+        df = displacements(df, ref_df, meta, id_col)
+
+        site_dists, site_ids = ref_tree.query(df[['x','y','z']].values, k=1)
+        df['ref_site'] = ref_ids[ref_source[site_ids]]
+        df['ref_dist'] = site_dists
+        
+        yield config, df
+
+def bond_angle_distribution(atoms_df, max_dist=3., max_neighbours=16, 
+                            repeat_meta=None, bins=180, accumulate=None,
+                            chunk_size=10000, leafsize=100, precision='double'):
+    """ compute the distribution of bond angles, j-i-k, for each type triplet
+    
+    angles are computed between the bonds of each central atom, i, 
+    to each pair of its nearest neighbours, j and k, within max_dist
+    
+    Parameters
+    ----------
+    atoms_df : pandas.Dataframe or ipymd.shared.atoms.Atoms
+        all atoms, requires colums ['x','y','z','type']
+    max_dist : float
+        maximum bond length
+    max_neighbours : int
+        maximum number of bonds per atom
+    repeat_meta : pandas.Series
+        include consideration of repeating boundary idenfined by a,b,c in the meta data
+    bins : int
+        number of histogram bins, between 0 and 180 degrees
+    accumulate : dict or None
+        histograms from a previous computation (e.g. of another configuration), 
+        to which the counts will be added (in place)
+    chunk_size : int
+        number of central atoms to compute at once (to limit memory use)
+    leafsize : int
+        points at which the algorithm switches to brute-force (kdtree specific)
+    precision : str
+        'single' or 'double' precision of the bond vector computations
+        
+    Returns
+    -------
+    edges : numpy.array((bins+1,))
+        the angle bin edges (degrees)
+    hists : dict
+        the count of angles in each bin, for each type triplet key (type_j, type_i, type_k), 
+        where type_i is the central atom type, and type_j <= type_k
+        
+    Example
+    -------
+    To accumulate the distribution over a trajectory:
+    
+    >>> hists = {}
+    >>> for config in range(1, data.count_configs()+1):
+    ...     edges, hists = bond_angle_distribution(data.get_atom_data(config), 
+    ...                                            accumulate=hists)
+    >>> plt.plot(edges[:-1], hists[('S','Fe','S')])
+    
+    """
+    xyz = as_positions(atoms_df)
+    atoms_df = as_dataframe(atoms_df)
+    hists = {} if accumulate is None else accumulate
+    edges = np.linspace(0., 180., bins+1)
+    
+    ids, vectors, dists = _nearest_neighbours(xyz, 
+                                              max_neighbours, max_dist,
+                                              repeat_meta, leafsize, 
+                                              shared.get_float_dtype(precision))
+    type_codes, type_names = pd.factorize(atoms_df.type.values, sort=True)
+    num_types = len(type_names)
+    
+    # all pairs of neighbours for each central atom 
+    jj, kk = np.triu_indices(max_neighbours, 1)
+    with np.errstate(invalid='ignore'):
+        unit_vectors = vectors / dists[:,:,np.newaxis]
+    
+    counts = np.zeros(num_types**3 * bins, dtype=int)
+    for start in range(0, atoms_df.shape[0], chunk_size):
+        chunk = slice(start, start+chunk_size)
+        found = ids[chunk] >= 0
+        mask = np.logical_and(found[:,jj], found[:,kk])
+        
+        cos_theta = np.einsum('ijk,ijk->ij', unit_vectors[chunk][:,jj,:], 
+                                            unit_vectors[chunk][:,kk,:])[mask]
+        theta = np.degrees(np.arccos(np.clip(cos_theta, -1, 1)))
+        theta_bin = np.minimum((theta * bins / 180.).astype(int), bins-1)
+        
+        type_i = np.repeat(type_codes[chunk], mask.sum(axis=1))
+        type_j = type_codes[ids[chunk][:,jj][mask]]
+        type_k = type_codes[ids[chunk][:,kk][mask]]
+        triplet = ((np.minimum(type_j, type_k)*num_types + type_i)*num_types + 
+                   np.maximum(type_j, type_k))
+        
+        counts += np.bincount(triplet*bins + theta_bin, minlength=counts.shape[0])
+
+    counts = counts.reshape(num_types, num_types, num_types, bins)
+    for tj, ti, tk in zip(*np.nonzero(counts.sum(axis=3))):
+        key = (type_names[tj], type_names[ti], type_names[tk])
+        if key in hists:
+            hists[key] += counts[tj, ti, tk]
+        else:
+            hists[key] = counts[tj, ti, tk].copy()
+    
+    return edges, hists
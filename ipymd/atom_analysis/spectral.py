@@ -35,19 +35,23 @@ doi:10.1145/2616498.2616552
 
 @author: chris sewell
 """
-#TODO Averaging over (thermal) phase space
 #TODO Analysis of triclinic cells
 #TODO Calculation of structure factor coefficients from atom charge & type (rather than pre-defining ionic state)
-#TODO fast fourier transform?
-#TODO parallelization of fourier summation (http://ipyparallel.readthedocs.io/en/latest/intro.html#getting-started)
 
 import math
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from multiprocessing import cpu_count, Pool
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import pandas as pd
 
-from ..shared import get_data_path
+from ..shared import get_data_path, get_float_dtype, type_codes, type_groups
+from ..shared.atoms import as_dataframe
+from ..data_input.spacegroup.spacegroup import Spacegroup
 from . import data
-from . import basic
 from .. import plotting
 
 def _set_thetas(min2theta=1.,max2theta=179.):
@@ -73,193 +77,271 @@ def _set_thetas(min2theta=1.,max2theta=179.):
     max_theta = math.radians(max2theta) / 2.
     return min_theta, max_theta
 
-def _original_compute_rmesh(sim_abc, wlambda, min_theta, max_theta,
-                  rspace=[1,1,1], periodic=[True,True,True], manual=False):
-    """Compute full reciprocal lattice mesh, here for prosperity
+def _friedel_mask(imesh):
+    """ mask of the half-space of integer mesh points, h > 0, or h = 0 and k > 0, 
+    or h = k = 0 and l >= 0 (i.e. each Friedel pair K, -K once, plus the origin) """
+    h, k, l = imesh.T
+    return (h > 0) | ((h == 0) & ((k > 0) | ((k == 0) & (l >= 0))))
+
+def _symmetry_weights(imesh, spacegroup=None):
+    """ compute the multiplicity of each integer mesh point in a Friedel half-space, 
+    and optionally reduce them to the symmetry-unique reflections of a point group 
     
-    Properties
+    Parameters
     ----------
-    sim_abc : numpy.array((3,3))
-        a,b,c cell vectors (length units)
-    wlambda : float
-        radiation wavelength (length units)
-        x-rays usually in the range 0.1 to 100 Angstroms
-    min_theta : float
-        minimum theta range to explore (radians)
-    max_theta : float
-        maximum theta range to explore (radians)
-    rspace : list of floats
-        parameters to multiply the spacing of the reciprocal lattice nodes 
-        in the h, k, and l directions respectively
-    periodic : list of bools
-        whether periodic boundary in the h, k, and l directions respectively
-    manual : bool
-        use manual spacing of reciprocal lattice points based on the values of the rspac parameters 
-        (good for comparing diffraction results from multiple simulations, but small rspace required).
+    imesh : np.array((N,3),dtype=int)
+        integer indices of the k-points, in the half-space defined by _friedel_mask
+    spacegroup : None or ipymd.data_input.spacegroup.spacegroup.Spacegroup
+        if not None, the reflections are reduced by the rotations of the spacegroup
         
     Returns
     -------
-    rmesh : np.array((N,3))
-        mesh of k points defining reciprocal lattice
+    mask : np.array((N,),dtype=bool)
+        retained k-points
+    weights : np.array((M,))
+        multiplicity of each retained k-point
     
     """
-    # get cell parameters
-    a,b,c,alpha,beta,gamma = basic.lattparams_bb(sim_abc)
-    cell_lenghts = (a,b,c)
-    if not np.allclose([alpha,beta,gamma],[90,90,90]):
-        raise ValueError("Compute XRD does not work with triclinic structures")
-    
-    # maximum reciprocal lattice vector |K|, 
-    # calculated from Bragg's law 
-    Kmax = 2 * math.sin(max_theta) / wlambda 
-        
-    # Calculate spacing between reciprocal lattice points
-    # Using distance based on periodic repeating distance
-    if manual:
-        inv_cell_lengths = [1.0,1.0,1.0]
-    else:
-        if not np.any(periodic):
-            raise ValueError("Compute XRD must have at least one periodic boundary unless manual spacing specified")
-        
-        # calc inverse dimension for periodic directions
-        inv_cell_lengths = [1./cell_lenghts[i] if periodic[i] else np.nan for i in range(3)]
-        ave_inv = np.nanmean(inv_cell_lengths)
-
-        # Use the average inverse dimensions for non-periodic directions
-        inv_cell_lengths = [icl if periodic[i] else ave_inv for i,icl in enumerate(inv_cell_lengths)]
-        
-    # resolution (i.e. spacing) of reciprocal space points
-    dK = [inv_cell_lengths[i] * rspace[i] for i in range(3)]
-    # maximum integer value for K points in each dimension
-    Knmax = [math.ceil(Kmax / dK[i]) for i in range(3)]
+    origin = ~np.any(imesh, axis=1)
+    if spacegroup is None:
+        return np.ones(imesh.shape[0], dtype=bool), np.where(origin, 1., 2.)
     
-    # create the full reprocal lattice indices grid
-    rmesh = np.mgrid[-Knmax[0]:Knmax[0]+1:1, 
-               -Knmax[1]:Knmax[1]+1:1, 
-               -Knmax[1]:Knmax[1]+1:1].reshape(3,-1).T
+    # reflections are equivalent under the rotations and Friedel's law
+    R = spacegroup.get_rotations().transpose(0, 2, 1)
+    R = np.concatenate((R, -R))
+    gsym = np.einsum('jkl,il->ijk', R, imesh)
+    # rank the equivalent reflections (in lexsort order, last index primary)
+    shifted = gsym - gsym.min()
+    base = np.int64(shifted.max() + 1)
+    rank = (shifted[..., 2]*base + shifted[..., 1])*base + shifted[..., 0]
     
-    # resize reciprocal mesh to correct spacing
-    for i in range(3):
-        rmesh[:,i] *= dK[i]
-    
-    return rmesh
+    # the representative of each set is its lowest member, or its Friedel 
+    # pair if that is not in the half-space, and its multiplicity is the set size
+    rep = gsym[np.arange(imesh.shape[0]), rank.argmin(axis=1)]
+    rep[~_friedel_mask(rep)] *= -1
+    mask = np.all(rep == imesh, axis=1)
+    rank = np.sort(rank[mask], axis=1)
+    weights = 1. + np.count_nonzero(np.diff(rank, axis=1), axis=1)
+    return mask, weights
 
-def _compute_rmesh_triclinic(sim_abc, wlambda, min_theta, max_theta,
-                              rspace=[1.,1.,1.],manual=False,periodic=[True,True,True]):
-    """Compute full reciprocal lattice mesh
+def _mesh_basis(sim_abc, rspace=[1.,1.,1.], manual=False, periodic=[True,True,True]):
+    """ compute the vectors spanning the reciprocal lattice mesh, 
+    such that each k-point is K = imesh.basis, for integer imesh
     
     Properties
     ----------
     sim_abc : numpy.array((3,3))
         a,b,c cell vectors (length units)
-    wlambda : float
-        radiation wavelength (length units)
-        x-rays usually in the range 0.1 to 100 Angstroms
-    min_theta : float
-        minimum theta range to explore (radians)
-    max_theta : float
-        maximum theta range to explore (radians)
     rspace : list of floats
         parameters to multiply the spacing of the reciprocal lattice nodes 
         in the h, k, and l directions respectively
     manual : bool
         use manual spacing of reciprocal lattice points based on the values of the rspace parameters 
-        (good for comparing diffraction results from multiple simulations, but small rspace required).
     periodic : list of bools
         whether periodic boundary in the h, k, and l directions respectively
-        
+
     Returns
     -------
-    rmesh : np.array((N,3))
-        mesh of k points defining reciprocal lattice
-    
-    """        
-    if not np.any(periodic):
-        raise ValueError('at least one direction must be periodic')
+    basis : numpy.array((3,3))
+        mesh vectors (rows) in the h, k, and l directions respectively
+    recip_lengths : list of floats
+        lengths of the reciprocal lattice vectors, 
+        with non-periodic directions set as the mean length of periodic ones
     
-    # maximum reciprocal lattice vector |K|, 
-    # calculated from Bragg's law 
-    Kmax = 2 * math.sin(max_theta) / wlambda 
-        
+    """
     # Calculate the rimitive reciprocal lattice vectors
     a,b,c = sim_abc
     a_recip = np.cross(b,c)/(np.dot(a,np.cross(b,c)))
     b_recip = np.cross(c,a)/(np.dot(a,np.cross(b,c)))
     c_recip = np.cross(a,b)/(np.dot(a,np.cross(b,c)))
     
-    recip_lengths = map(np.linalg.norm, [a_recip,b_recip,c_recip])
+    recip_lengths = list(map(np.linalg.norm, [a_recip,b_recip,c_recip]))
     
     # get mean length of periodic directions
     mean_length = np.mean(np.array(recip_lengths)[np.array(periodic)])
     # set non-periodic directions as the mean length of periodic ones
     recip_lengths = [r if p else mean_length for r,p in zip(recip_lengths,periodic)]
-        
-    # maximum integer value for K points in each dimension
-    Knmax = [math.ceil(Kmax / (recip_lengths[i]*rspace[i])) for i in range(3)]
-    
-    # create the full reciprocal lattice indices grid
-    imesh = np.mgrid[-Knmax[0]:Knmax[0]+1:1, 
-               -Knmax[1]:Knmax[1]+1:1, 
-               -Knmax[1]:Knmax[1]+1:1].reshape(3,-1).T
-
-    if not manual:
-        # calulate reciprocal lattice
-        rmesh = (np.einsum('j,i->ji',imesh[:,0],a_recip)*rspace[0] + 
-                 np.einsum('j,i->ji',imesh[:,1],b_recip)*rspace[1] + 
-                 np.einsum('j,i->ji',imesh[:,2],c_recip)*rspace[2])     
+
+    if manual:
+        basis = np.diag(np.asarray(rspace, dtype=float))
     else:
-        # calulate reciprocal lattice
-        rmesh = (imesh[:,0]*rspace[0] + 
-                 imesh[:,1]*rspace[1] + 
-                 imesh[:,2]*rspace[2]) 
+        basis = np.array([a_recip,b_recip,c_recip])
+        basis *= (np.asarray(recip_lengths) * np.asarray(rspace, dtype=float) 
+                  / np.linalg.norm(basis, axis=1))[:,None]
     
-    return rmesh
+    return basis, recip_lengths
     
-def _restrict_rmesh(rmesh, wlambda, min_theta, max_theta):
-    """filter mesh points to only those in Eswald's sphere 
-    (and angular limits)
+def _iter_rmesh_sphere(sim_abc, wlambda, min_theta, max_theta,
+                       rspace=[1.,1.,1.],manual=False,periodic=[True,True,True],
+                       friedel=False, chunk_size=2**14):
+    """ generate the reciprocal lattice mesh points within the Eswald's sphere 
+    (and angular limits), in chunks
     
-    Parameters
+    rather than creating the full mesh, the (h,k,l) points are enumerated 
+    slab by slab (in h) and row by row (in k), computing the range of l 
+    within the sphere, so that only the retained points are created
+    
+    Properties
     ----------
-    rmesh : np.array((N,3))
-        mesh of k points defining reciprocal lattice
+    sim_abc : numpy.array((3,3))
+        a,b,c cell vectors (length units)
     wlambda : float
         radiation wavelength (length units)
-        x-rays usually in the range 0.1 to 100 Angstroms
     min_theta : float
         minimum theta range to explore (radians)
     max_theta : float
         maximum theta range to explore (radians)
-
-    Returns
-    -------
+    rspace : list of floats
+        parameters to multiply the spacing of the reciprocal lattice nodes 
+        in the h, k, and l directions respectively
+    manual : bool
+        use manual spacing of reciprocal lattice points based on the values of the rspace parameters 
+    periodic : list of bools
+        whether periodic boundary in the h, k, and l directions respectively
+    friedel : bool
+        only generate the half-space of the mesh (see _friedel_mask)
+    chunk_size : int
+        maximum number of mesh points in each chunk
+        
+    Yields
+    ------
+    imesh : np.array((N,3),dtype=int)
+        integer indices of the k-points
     rmesh_sphere : np.array((N,3))
         mesh of k points defining reciprocal lattice, 
         retricted to Eswald's shere (and angular limits)
-    k_mods : np.array((N,1))
+    k_mods : np.array((N,))
          modulus for each k-point
-    thetas : np.array((N,1))
+    thetas : np.array((N,))
         angles for each k-point (radians)
 
     """
+    if not np.any(periodic):
+        raise ValueError('at least one direction must be periodic')
+    
+    basis, _ = _mesh_basis(sim_abc, rspace, manual, periodic)
+    # maximum reciprocal lattice vector |K|, calculated from Bragg's law 
+    Kmax = 2 * math.sin(max_theta) / wlambda 
+    # maximum integer value for K points in each dimension, 
+    # since each index is K.inv(basis)[:,i]
+    Knmax = np.floor(Kmax * np.linalg.norm(np.linalg.inv(basis), axis=0) + 1e-9).astype(int)
+    
+    kvals = np.arange(-Knmax[1], Knmax[1]+1)
+    hmin = 0 if friedel else -Knmax[0]
+    
+    def slabs():
+        for h in range(hmin, Knmax[0]+1):
+            k = kvals[kvals >= 0] if friedel and h == 0 else kvals
+            # solve |p + l.c|^2 <= Kmax^2 for the range of l in each row
+            lmin, lmax, row = _line_sphere(h * basis[0] + np.outer(k, basis[1]), 
+                                           basis[2], np.zeros(3), Kmax)
+            lmin = np.ceil(lmin - 1e-9).astype(int)
+            lmax = np.floor(lmax + 1e-9).astype(int)
+            if friedel and h == 0:
+                lmin[k == 0] = np.maximum(lmin[k == 0], 0)
+            imesh = _expand_rows(h, k[row], lmin[row], lmax[row])
+            
+            rmesh = imesh.dot(basis)
+            mask, k_mods, thetas = _restrict_mask(rmesh, wlambda, min_theta, max_theta)
+            yield imesh[mask], rmesh[mask], k_mods, thetas
+    
+    return _rechunk(slabs(), chunk_size)
+
+def _line_sphere(p, c, centre, radius):
+    """ solve |p + l.c - centre| <= radius for the range of l, 
+    for each row of points p and a direction c 
+    
+    Returns
+    -------
+    lmin : np.array((N,))
+    lmax : np.array((N,))
+    intersect : np.array((N,),dtype=bool)
+        whether the line intersects the sphere
+        
+    """
+    d = p - centre
+    c_sqr = c.dot(c)
+    dc = d.dot(c)
+    disc = dc**2 - c_sqr * (np.einsum('ij,ij->i', d, d) - radius**2)
+    intersect = disc >= 0
+    root = np.sqrt(np.where(intersect, disc, 0.))
+    return (-dc - root) / c_sqr, (-dc + root) / c_sqr, intersect
+
+def _expand_rows(h, k, lmin, lmax):
+    """ create the integer mesh points (h, k[i], lmin[i]..lmax[i]) for each row i """
+    counts = np.maximum(lmax - lmin + 1, 0)
+    num = counts.sum()
+    # the l values of each row, as an offset from the start of the row
+    offsets = np.arange(num) - np.repeat(np.cumsum(counts) - counts, counts)
+    imesh = np.empty((num, 3), dtype=int)
+    imesh[:,0] = h
+    imesh[:,1] = np.repeat(k, counts)
+    imesh[:,2] = np.repeat(lmin, counts) + offsets
+    return imesh
+
+def _rechunk(iterable, chunk_size):
+    """ regroup an iterable of tuples of arrays (of equal length) 
+    into tuples of arrays of length chunk_size (apart from the last) """
+    chunks, num_pending = [], 0
+    for arrays in iterable:
+        if arrays[0].shape[0] == 0:
+            continue
+        chunks.append(arrays)
+        num_pending += arrays[0].shape[0]
+        while num_pending >= chunk_size:
+            merged = [np.concatenate(a) for a in zip(*chunks)]
+            yield tuple(a[:chunk_size] for a in merged)
+            chunks = [tuple(a[chunk_size:] for a in merged)]
+            num_pending -= chunk_size
+    
+    if num_pending > 0:
+        yield tuple(np.concatenate(a) for a in zip(*chunks))
+
+def _restrict_mask(rmesh, wlambda, min_theta, max_theta):
+    """ mask of mesh points in Eswald's sphere (and angular limits),
+    with the modulus and angle of the retained points """
     # calculate the length (squared) of each mesh vector
-    K_sqr = np.sum(np.square(rmesh),axis=1)
+    K_sqr = np.einsum('ij,ij->i', rmesh, rmesh)
     # select only mesh points within the Eswald sphere radius
-    radius_mask = K_sqr * wlambda**2 <= 2**2 # i.e. (2sin(pi))^2
+    mask = K_sqr * wlambda**2 <= 2**2 # i.e. (2sin(pi))^2
     # calculate the angle of each remaining mesh vector
-    K = np.sqrt(K_sqr[radius_mask])
-    theta = np.arcsin(wlambda * np.sqrt(K_sqr[radius_mask]) * 0.5)
+    K = np.sqrt(K_sqr[mask])
+    theta = np.arcsin(wlambda * K * 0.5)
     # select only mesh points within the angular limits
     angle_mask = np.logical_and(theta <= max_theta, theta >= min_theta)
-    # return remaining mesh points
-    return rmesh[radius_mask][angle_mask], K[angle_mask], theta[angle_mask]
+    mask[mask] = angle_mask
+    return mask, K[angle_mask], theta[angle_mask]
+
+_sf_coeffs_cache = {}
 
-def get_sf_coeffs():
-    datapath = get_data_path('xray_scattering_factors_coefficients.csv',
-                             module=data)
-    return pd.read_csv(datapath, index_col=0,comment='#')
+def _read_sf_coeffs(radiation='xray'):
+    """ read the atomic scattering factor coefficients, 
+    which are cached after the first read (and should not be modified) """
+    if radiation not in _sf_coeffs_cache:
+        if radiation not in ['xray', 'electron']:
+            raise ValueError("radiation must be 'xray' or 'electron'")
+        datapath = get_data_path('{}_scattering_factors_coefficients.csv'.format(radiation),
+                                 module=data)
+        _sf_coeffs_cache[radiation] = pd.read_csv(datapath, index_col=0,comment='#')
+    return _sf_coeffs_cache[radiation]
 
-def _calc_struct_factors(atoms_df,rmesh_sphere,k_mods):
+def get_sf_coeffs(radiation='xray'):
+    """ get the atomic scattering factor coefficients 
+    
+    Parameters
+    ----------
+    radiation : str
+        'xray' or 'electron'
+    
+    Returns
+    -------
+    sf_coeffs_df : pandas.DataFrame
+        coefficients (columns) for each atom type (index)
+        
+    """
+    return _read_sf_coeffs(radiation).copy()
+
+def _calc_struct_factors(atoms_df,rmesh_sphere,k_mods,radiation='xray'):
     """ calculate atomic scattering factors, fj, 
     for each atom at each reciprocal lattice point
 
@@ -272,6 +354,9 @@ def _calc_struct_factors(atoms_df,rmesh_sphere,k_mods):
         retricted to Eswald's shere (and angular limits)
     k_mods : np.array((N,1))
          modulus for each k-point, only required for calclating Lorentz-polarization factor
+    radiation : str
+        'xray' or 'electron', for electrons only neutral atom coefficients are available, 
+        so ionic types (e.g. Na1+) use those of the element
 
     Returns
     -------
@@ -284,22 +369,236 @@ def _calc_struct_factors(atoms_df,rmesh_sphere,k_mods):
     K_2_sqr = (0.5*k_mods)**2
 
     # get the structure factor coefficients
-    sf_coeffs_df = get_sf_coeffs()
+    sf_coeffs_df = _read_sf_coeffs(radiation)
+    num_gauss = sum(1 for col in sf_coeffs_df.columns if col.startswith('A'))
+    
+    # the coefficients of each atom type (by type code)
+    atypes = [atype for atype, _ in type_groups(atoms_df.type)]
+    coeff_types = []
+    for atype in atypes:
+        coeff_type = atype
+        if radiation == 'electron' and atype not in sf_coeffs_df.index:
+            # use the element of an ionic type
+            match = re.match('[A-Z][a-z]?', atype) if isinstance(atype, str) else None
+            coeff_type = None if match is None else match.group()
+        if coeff_type is None or coeff_type not in sf_coeffs_df.index:
+            raise ValueError('no {0} scattering factor coefficients for atom type: {1!r}'.format(
+                                radiation, atype))
+        coeff_types.append(coeff_type)
+    sfs = sf_coeffs_df.loc[coeff_types]
+    A = sfs[['A{}'.format(i) for i in range(1, num_gauss+1)]].values.astype(float)
+    B = sfs[['B{}'.format(i) for i in range(1, num_gauss+1)]].values.astype(float)
+    C = sfs['C'].values.astype(float) if 'C' in sfs.columns else np.zeros(len(atypes))
+    
+    # sum the gaussians for all types at once, f[type, k]
+    K_2_sqr = np.asarray(K_2_sqr, dtype=float)
+    factors = np.repeat(C[:,None], K_2_sqr.size, axis=1)
+    for i in range(num_gauss):
+        factors += A[:,i,None] * np.exp(-B[:,i,None] * K_2_sqr.ravel()[None,:])
+    
+    return dict([(atype, factors[t].reshape(K_2_sqr.shape)) for t, atype in enumerate(atypes)])
+
+def _structure_sum_tile(args):
+    """ compute the sum of phase factors for a single tile of k-points """
+    twopi_xyz, kpts, atom_tile = args
+    S = np.zeros(kpts.shape[1], dtype=complex)
+    for astart in range(0, twopi_xyz.shape[0], atom_tile):
+        inner_dot = np.dot(twopi_xyz[astart:astart+atom_tile], kpts)
+        # accumulate in double precision (also for single precision phases)
+        S.real += np.cos(inner_dot).sum(axis=0, dtype=float)
+        S.imag += np.sin(inner_dot, out=inner_dot).sum(axis=0, dtype=float)
+    return S
+
+def _structure_sum(xyz, rmesh_sphere, max_memory=2**27, pool=None, dtype=float, kpt_tile=256):
+    """ compute the sum of phase factors, exp(2 pi i K.r), of each atom at each 
+    reciprocal lattice point, in tiles of atoms x k-points
+    
+    Parameters
+    ----------
+    xyz : np.array((N,3))
+        atom coordinates (or fractional coordinates, for integer k-point indices)
+    rmesh_sphere : np.array((M,3))
+        mesh of k points defining reciprocal lattice (or their integer indices)
+    max_memory : int
+        approximate maximum memory (bytes) of the temporary arrays for each tile
+    pool : multiprocessing.pool.ThreadPool or None
+        if not None, the k-point tiles are computed in parallel by the pool
+    dtype : numpy.dtype
+        float type of the phase computations (the sums are always double precision)
+    kpt_tile : int
+        number of k-points in each tile, this is fixed (rather than set by the pool size), 
+        so that results are identical for any number of threads
+
+    Returns
+    -------
+    S : np.array((M,),dtype=complex)
+        sum of phase factors for each k-point
+    
+    """
+    num_atoms, num_kpts = xyz.shape[0], rmesh_sphere.shape[0]
+    if num_atoms == 0 or num_kpts == 0:
+        return np.zeros(num_kpts, dtype=complex)
+    
+    # three temporaries (phase, cos and sin) per atom/k-point pair,
+    # the tiling is independent of the pool, so that results are identical
+    itemsize = np.dtype(dtype).itemsize
+    kpt_tile = max(1, min(num_kpts, kpt_tile))
+    atom_tile = max(1, min(num_atoms, int(max_memory // (3*itemsize*kpt_tile))))
+    
+    twopi_xyz = (2 * np.pi * xyz).astype(dtype)
+    kpts = rmesh_sphere.astype(dtype)
+    tiles = [(twopi_xyz, kpts[kstart:kstart+kpt_tile].T, atom_tile) 
+             for kstart in range(0, num_kpts, kpt_tile)]
+    
+    if pool is None:
+        sums = map(_structure_sum_tile, tiles)
+    else:
+        sums = pool.map(_structure_sum_tile, tiles)
+    return np.concatenate(list(sums))
+
+def _fast_fft_length(n):
+    """ return the smallest integer >= n, with only prime factors 2, 3 and 5 """
+    n = int(n)
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+def _bspline_weights(w, order):
+    """ compute the cardinal B-spline weights, M_order(w+j) for j = 0..order-1
+    
+    Parameters
+    ----------
+    w : np.array((N,))
+        fractional offsets, in the range [0,1)
+    order : int
+        order of the B-spline (>= 2)
+        
+    Returns
+    -------
+    weights : np.array((order,N))
+    
+    """
+    weights = [w, 1-w]
+    for m in range(3, order+1):
+        new = []
+        for j in range(m):
+            upper = weights[j] if j < m-1 else 0.
+            lower = weights[j-1] if j > 0 else 0.
+            new.append(((w+j)*upper + (m-w-j)*lower)/(m-1))
+        weights = new
+    return np.array(weights)
+
+def _bspline_factors(num_points, order):
+    """ compute the factors which deconvolve the B-spline interpolation 
+    from the fourier transform of a gridded charge, for a grid dimension
+    
+    Parameters
+    ----------
+    num_points : int
+        number of points in the grid dimension
+    order : int
+        order of the B-spline (>= 2)
+        
+    Returns
+    -------
+    factors : np.array((num_points,),dtype=complex)
+    
+    """
+    m = np.arange(num_points)
+    # the B-spline at integer points, M_order(k+1) for k = 0..order-2
+    knots = _bspline_weights(np.zeros(1), order)[1:,0]
+    k = np.arange(order-1)
+    denom = np.exp(2j*np.pi*np.outer(k, m)/num_points).T.dot(knots)
+    return np.exp(2j*np.pi*(order-1)*m/num_points)/denom
+
+def _fft_grid_shape(nmax, order=8, oversample=2.):
+    """ compute the shape of the grid for the fast fourier transform, 
+    given the maximum (absolute) k-point indices in each dimension """
+    return tuple(_fast_fft_length(max(order, math.ceil(oversample*(2*n+1)))) for n in nmax)
+
+def _structure_grid_fft(xyz, basis, shape, order=8, max_memory=2**27, dtype=float):
+    """ compute the sum of phase factors, exp(2 pi i K.r), of each atom at each 
+    reciprocal lattice point, K = imesh.basis, by interpolating the atoms 
+    on to a regular grid with B-splines and taking its fast fourier transform
+    (as in the smooth particle mesh Ewald method)
+    
+    Parameters
+    ----------
+    xyz : np.array((N,3))
+        atom coordinates
+    basis : np.array((3,3))
+        mesh vectors (rows) of the k-points
+    shape : tuple of ints
+        shape of the grid, which must be larger than twice the k-point indices 
+        in each dimension (see _fft_grid_shape)
+    order : int
+        order of the B-spline interpolation (even numbers recommended)
+    max_memory : int
+        approximate maximum memory (bytes) of the temporary arrays used to interpolate the atoms
+    dtype : numpy.dtype
+        float type of the interpolation weights and returned grid
+        
+    Returns
+    -------
+    grid : np.array(shape,dtype=complex)
+        sum of phase factors, for each k-point at grid[imesh % shape]
+    
+    """
+    # fractional coordinates (periodic in the unit interval) scaled to the grid
+    grid_xyz = xyz.dot(basis.T) * shape
+    grid_pos = np.floor(grid_xyz).astype(int)
+    grid_off = (grid_xyz - grid_pos).astype(dtype)
     
-    struct_factors = {}
-    for atype in atoms_df.type.unique():
-        sfs = sf_coeffs_df.loc[atype]
-        struct_factors[atype] = 0
-        struct_factors[atype] += sfs.A1 * np.exp(-sfs.B1*K_2_sqr)
-        struct_factors[atype] += sfs.A2 * np.exp(-sfs.B2*K_2_sqr)
-        struct_factors[atype] += sfs.A3 * np.exp(-sfs.B3*K_2_sqr)
-        struct_factors[atype] += sfs.A4 * np.exp(-sfs.B4*K_2_sqr)
-        struct_factors[atype] += sfs.C
+    # spread the atoms on to the grid, in chunks
+    strides = (shape[1]*shape[2], shape[2], 1)
+    j = np.arange(order)[:,None]
+    chunk = max(1, int(max_memory // (order**3 * 16)))
+    grid = np.zeros(shape[0]*shape[1]*shape[2])
+    for start in range(0, xyz.shape[0], chunk):
+        weights = 1.
+        flat = 0
+        for d in range(3):
+            w = _bspline_weights(grid_off[start:start+chunk, d], order)
+            i = ((grid_pos[start:start+chunk, d] - j) % shape[d]) * strides[d]
+            expand = [None,None,None]
+            expand[d] = slice(None)
+            expand = tuple(expand) + (slice(None),)
+            weights = weights * w[expand]
+            flat = flat + i[expand]
+        grid += np.bincount(flat.ravel(), weights=weights.ravel(), minlength=grid.size)
     
-    return struct_factors
+    # transform, and deconvolve the B-spline interpolation
+    grid = np.fft.ifftn(grid.reshape(shape)) * grid.size
+    grid *= _bspline_factors(shape[0], order)[:,None,None]
+    grid *= _bspline_factors(shape[1], order)[None,:,None]
+    grid *= _bspline_factors(shape[2], order)[None,None,:]
+    return grid.astype(np.result_type(dtype, np.complex64), copy=False)
+
+def _lp_factor(thetas, k_mods, wlambda):
+    """ compute the Lorentz-polarization factor for each k-point """
+    sin_thetas = 0.5*k_mods*wlambda
+    return (1+np.cos(2*thetas)**2)/(np.cos(thetas)*sin_thetas**2)
+
+def _thread_pool(n_jobs):
+    """ return a ThreadPool with n_jobs threads (all processors if -1), 
+    or None for a single thread """
+    if n_jobs == -1:
+        n_jobs = cpu_count()
+    return ThreadPool(n_jobs) if n_jobs > 1 else None
+
+def _close_pool(pool):
+    if pool is not None:
+        pool.close()
+        pool.join()
 
 def _calc_intensities(atoms_df, rmesh_sphere, wlambda, struct_factors,
-                     thetas=None,k_mods=None,use_Lp=True):
+                     thetas=None,k_mods=None,use_Lp=True,max_memory=2**27,
+                     pool=None,fft_grids=None,imesh=None,basis=None,precision='double'):
     """ calculate diffraction intensities for each atom at each reciprocal lattice point
 
     Parameters
@@ -318,6 +617,21 @@ def _calc_intensities(atoms_df, rmesh_sphere, wlambda, struct_factors,
         angles for each k-point (radians), only required for calclating Lorentz-polarization factor
     use_Lp : bool
         switch to apply Lorentz-polarization factor
+    max_memory : int
+        approximate maximum memory (bytes) of temporary arrays in the fourier summation
+    pool : multiprocessing.pool.ThreadPool or None
+        if not None, the k-point tiles of the fourier summation are computed in parallel by the pool
+        (created once by the caller, see _thread_pool)
+    fft_grids : None or dict(np.array)
+        if not None, the fourier summation is taken from the fast fourier transform 
+        grid of each atom type (values, see _structure_grid_fft), for each atom type (keys)
+    imesh : np.array((N,3),dtype=int)
+        integer indices of the k-points, required for fft_grids
+    basis : np.array((3,3))
+        mesh vectors (rows) of the k-points, rmesh_sphere = imesh.basis, 
+        if given (with imesh) the phases are computed from the integer indices
+    precision : str
+        'single' or 'double' precision of the phase factor computations
 
     Returns
     -------
@@ -325,28 +639,41 @@ def _calc_intensities(atoms_df, rmesh_sphere, wlambda, struct_factors,
          intensity for each k-point
 
     """
-    # compute F(K)
-    F = np.zeros(rmesh_sphere.shape[0]) + 0*1j
-    for xyz,atype in zip(atoms_df[['x','y','z']].values, atoms_df.type):
-        inner_dot = 2 * np.pi * np.dot(xyz,rmesh_sphere.T)
-        F += struct_factors[atype] * (np.cos(inner_dot) + 1j*np.sin(inner_dot))
+    xyz = atoms_df[['x','y','z']].values
+    kpts = rmesh_sphere
+    if fft_grids is None and imesh is not None and basis is not None:
+        # K.r = imesh.(basis.r), with the fractional coordinates reduced (in double precision) 
+        # to [0,1), so the phase accuracy does not depend on the magnitude of the coordinates
+        xyz = xyz.dot(basis.T)
+        xyz -= np.floor(xyz)
+        kpts = imesh
+    
+    # compute F(K), summing the phase factors of each atom type, 
+    # then applying the structure factors for that type
+    F = np.zeros(rmesh_sphere.shape[0], dtype=complex)
+    for atype, type_index in type_groups(atoms_df.type):
+        if fft_grids is None:
+            S = _structure_sum(xyz[type_index], kpts, max_memory, pool,
+                               get_float_dtype(precision))
+        else:
+            grid = fft_grids[atype]
+            S = grid[tuple((imesh % grid.shape).T)]
+        F += struct_factors[atype] * S
     # compute Lp(theta)
-    if use_Lp:
-        sin_thetas = 0.5*k_mods*wlambda
-        Lp = (1+np.cos(2*thetas)**2)/(np.cos(thetas)*sin_thetas**2)
-    else:
-        Lp = 1.
+    Lp = _lp_factor(thetas, k_mods, wlambda) if use_Lp else 1.
     # calculate intensities
     return Lp*F*np.conjugate(F)/float(atoms_df.shape[0])
 
 
 def compute_xrd(atoms_df, meta_data,wlambda, min2theta=1.,max2theta=179., lp=True,
-                rspace=[1,1,1], manual=False,periodic=[True,True,True]):
+                rspace=[1,1,1], manual=False,periodic=[True,True,True],
+                max_memory=2**27, n_jobs=1, method='direct', fft_order=8, fft_oversample=2.,
+                symmetry=None, chunk_size=2**14, cache=False, precision='double'):
     r"""Compute predicted x-ray diffraction intensities for a given wavelength
     
     Properties
     ----------
-    atoms_df : pandas.DataFrame
+    atoms_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
         a dataframe of info for each atom, including columns; x,y,z,type
     meta_data : pandas.Series
         data of a,b,c crystal vectors (as tuples, e.g. meta_data.a = (0,0,1))
@@ -369,13 +696,49 @@ def compute_xrd(atoms_df, meta_data,wlambda, min2theta=1.,max2theta=179., lp=Tru
         (good for comparing diffraction results from multiple simulations, but small c required).
     periodic : list of bools
         whether periodic boundary in the h, k, and l directions respectively
+    max_memory : int
+        approximate maximum memory (bytes) of temporary arrays in the fourier summation, 
+        which is computed in tiles of atoms x k-points
+    n_jobs : int
+        number of threads over which to split the k-points in the fourier summation,
+        if -1 then all processors are used (results are identical to n_jobs=1)
+    method : str
+        'direct' to sum the phase factors of each atom at each k-point, 
+        or 'fft' to interpolate the atoms on to a grid and take its fast fourier transform 
+        (see notes)
+    fft_order : int
+        order of the B-spline interpolation, if method='fft'
+    fft_oversample : float
+        ratio of grid points to the range of k-point indices, in each dimension, if method='fft'
+    symmetry : None, str, int or ipymd.data_input.spacegroup.spacegroup.Spacegroup
+        if 'friedel', only half of the reciprocal mesh is computed, since I(K) = I(-K),
+        if a spacegroup (or its number), the mesh is further reduced to the 
+        symmetry-unique reflections of its point group. The latter requires the cell 
+        to be an equal repeat (in each direction) of the conventional cell of the spacegroup, 
+        with equal rspace and manual=False, and the atoms to possess the spacegroup symmetry
+    chunk_size : int
+        maximum number of reciprocal lattice points to compute at a time
+    cache : bool or ipymd.atom_analysis.spectral.XRDCache
+        if True use the default cache (xrd_cache), or a given cache, 
+        to store the results and return them for repeated calls 
+        on the same structure and parameters (see XRDCache). 
+        Note each call then also hashes all the atom positions, and the default cache 
+        holds up to xrd_cache.max_items (8) results in memory, 
+        each of two float arrays of length N k-points
+    precision : str
+        'single' or 'double' precision of the phase factor computations, 
+        single precision is several times faster for method='direct', with 
+        errors in the intensities typically < 1e-6 of the largest peak 
+        (growing with the k-point indices, i.e. the cell size, but not the 
+        absolute coordinates)
 
     Returns
     -------
     2thetas : np.array((N,1))
         2theta angles for each k-point (degrees)
     intensities : np.array((N,1))
-         intensity for each k-point
+         intensity for each k-point, 
+         multiplied by its multiplicity if symmetry is not None
     
     Notes
     -----
@@ -386,8 +749,9 @@ def compute_xrd(atoms_df, meta_data,wlambda, min2theta=1.,max2theta=179., lp=Tru
 
     1. Define a crystal structure by position (x,y,z) and atom/ion type.
     2. Define the x-ray wavelength to use
-    3. Compute the full reciprocal lattice mesh
-    4. Filter reciprocal lattice points by those in the Eswald's sphere
+    3. Compute the reciprocal lattice mesh, enumerating only (chunks of) 
+       the points in the Eswald's sphere
+    4. Filter reciprocal lattice points by the angular limits
     5. Compute the structure factor at each reciprocal lattice point, for each atom type
     6. Compute the x-ray diffraction intensity at each reciprocal lattice point
     7. Group and sum intensities by angle
@@ -450,24 +814,687 @@ def compute_xrd(atoms_df, meta_data,wlambda, min2theta=1.,max2theta=179., lp=Tru
 
         Lp(\theta) = \frac{1+\cos^2 (2\theta)}{\cos(\theta)\sin^2(\theta)}    
     
+    For real scattering factors :math:`I(\mathbf{K}) = I(-\mathbf{K})` (Friedel's law),
+    so with symmetry='friedel' only half the mesh is computed, and each k-point 
+    intensity is weighted by two. Given a spacegroup, the k-points are 
+    further reduced to one per set of symmetry-equivalent reflections, 
+    weighted by the size of the set (e.g. up to 48x fewer for cubic groups). 
+    
+    The direct summation of :math:`F(\mathbf{K})` scales as N atoms x M k-points.
+    With method='fft', the atoms of each type are instead interpolated on to 
+    a regular grid (in the fractional coordinates of the reciprocal mesh) with 
+    cardinal B-splines, as in the smooth particle mesh Ewald method [ref2]_, 
+    and the grid is fast fourier transformed, which scales as N + M log(M). 
+    With the default fft_order=8 and fft_oversample=2, intensities are accurate 
+    to within 1e-5 of the largest peak, fft_oversample=3 improves this to 2e-7, 
+    and fft_order=12 with fft_oversample=3 to 1e-9.
+    For a single process, the fft method becomes faster than direct summation 
+    at around 50-100 atoms, and is ~50x faster for 4,000 atoms.
+    
     References
     ----------
     
     .. [ref1] 1.Coleman, S. P., Sichani, M. M. & Spearot, D. E. 
         A Computational Algorithm to Produce Virtual X-ray and Electron Diffraction 
         Patterns from Atomistic Simulations. JOM 66, 408–416 (2014).
+    .. [ref2] Essmann, U. et al. A smooth particle mesh Ewald method. 
+        J. Chem. Phys. 103, 8577–8593 (1995).
+
+
+    """
+    atoms_df = as_dataframe(atoms_df)
+    sim_abc = np.asarray([meta_data.a,meta_data.b,meta_data.c])
+    if method not in ['direct', 'fft']:
+        raise ValueError("method must be 'direct' or 'fft'")
+    
+    if cache is True:
+        cache = xrd_cache
+    if cache:
+        sym_key = symmetry
+        if isinstance(symmetry, Spacegroup):
+            sym_key = symmetry.no, symmetry.setting
+        key = cache.hash_key(atoms_df, sim_abc, wlambda, lp, rspace, manual, periodic, 
+                             method, fft_order, fft_oversample, sym_key, precision)
+        result = cache.get(key, min2theta, max2theta)
+        if result is not None:
+            return result
+    
+    min_theta, max_theta = _set_thetas(min2theta,max2theta)    
+    kpoints = _xrd_kpoints(sim_abc,wlambda,min_theta, max_theta,rspace, manual, periodic,
+                           symmetry, chunk_size)
+    
+    fft_grids = None
+    basis, _ = _mesh_basis(sim_abc, rspace, manual, periodic)
+    if method == 'fft':
+        basis, shape = _fft_grid_setup(sim_abc, wlambda, max_theta, rspace, manual, periodic,
+                                       fft_order, fft_oversample)
+        fft_grids = _fft_grids(atoms_df, basis, shape, fft_order, max_memory, precision)
+    
+    # a single pool for all chunks of k-points
+    pool = _thread_pool(n_jobs) if method == 'direct' else None
+    all_thetas, all_I = [np.zeros(0)], [np.zeros(0, dtype=complex)]
+    try:
+        for imesh, rmesh_sphere, k_mods, thetas, weights in kpoints:
+            struct_factors = _calc_struct_factors(atoms_df,rmesh_sphere,k_mods)
+            I = _calc_intensities(atoms_df,rmesh_sphere,wlambda,struct_factors,thetas,k_mods,
+                                  use_Lp=lp,max_memory=max_memory,pool=pool,
+                                  fft_grids=fft_grids,imesh=imesh,basis=basis,
+                                  precision=precision)
+            if weights is not None:
+                I = I * weights
+            all_thetas.append(thetas)
+            all_I.append(I)
+    finally:
+        _close_pool(pool)
+    
+    ang2thetas, I = np.degrees(2*np.concatenate(all_thetas)), np.concatenate(all_I)
+    if cache:
+        cache.put(key, min2theta, max2theta, ang2thetas, I)
+    return ang2thetas, I
+
+class XRDCache(object):
+    """ a least recently used (LRU) cache of compute_xrd results, 
+    with optional persistence to disk
+    
+    results are keyed by a hash of the atom positions and types, cell, 
+    wavelength and computation parameters. Each stores the 2 theta window 
+    it was computed for, and a request for the same or a narrower window 
+    is returned from it (by selecting the k-points within the window)
+    
+    Parameters
+    ----------
+    max_items : int
+        maximum number of results to hold in memory 
+        (can be changed on an instance, e.g. xrd_cache.max_items = 2), 
+        each of (2thetas, intensities) arrays for every k-point in the window
+    cache_dir : str or None
+        if not None, results are also saved to (and loaded from) this directory, 
+        as compressed numpy files
+    
+    """
+    def __init__(self, max_items=8, cache_dir=None):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self._results = OrderedDict()
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+    
+    @staticmethod
+    def hash_key(atoms_df, *params):
+        """ compute a content-addressed key for a structure and parameters """
+        sha = hashlib.sha1()
+        sha.update(np.ascontiguousarray(atoms_df[['x','y','z']].values, dtype=float).tobytes())
+        codes, types = type_codes(atoms_df.type)
+        sha.update(np.ascontiguousarray(codes, dtype=np.int64).tobytes())
+        sha.update('\0'.join(map(str, types)).encode('utf8'))
+        sha.update(repr([np.asarray(p).tolist() for p in params]).encode('utf8'))
+        return sha.hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, 'xrd_{}.npz'.format(key))
+    
+    def get(self, key, min2theta, max2theta):
+        """ get (2thetas, intensities) for a key and window, 
+        or None if not available """
+        if key in self._results:
+            result = self._results.pop(key)
+        elif self.cache_dir is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as f:
+                result = tuple(f['window']), f['ang2thetas'], f['intensities']
+        else:
+            return None
+        self._store(key, result)
+        
+        (cached_min, cached_max), ang2thetas, intensities = result
+        if min2theta < cached_min or max2theta > cached_max:
+            return None
+        if (min2theta, max2theta) == (cached_min, cached_max):
+            return ang2thetas.copy(), intensities.copy()
+        min_theta, max_theta = _set_thetas(min2theta, max2theta)
+        thetas = np.radians(ang2thetas) / 2.
+        mask = (thetas >= min_theta) & (thetas <= max_theta)
+        return ang2thetas[mask], intensities[mask]
+    
+    def put(self, key, min2theta, max2theta, ang2thetas, intensities):
+        """ store (2thetas, intensities) for a key and window, 
+        replacing any existing result for the key """
+        if key in self._results:
+            cached_min, cached_max = self._results[key][0]
+            if cached_min <= min2theta and cached_max >= max2theta:
+                return
+        result = (min2theta, max2theta), ang2thetas.copy(), intensities.copy()
+        self._store(key, result)
+        if self.cache_dir is not None:
+            np.savez_compressed(self._path(key), window=np.array(result[0]),
+                                ang2thetas=result[1], intensities=result[2])
+    
+    def _store(self, key, result):
+        self._results.pop(key, None)
+        self._results[key] = result
+        while len(self._results) > self.max_items:
+            self._results.popitem(last=False)
+    
+    def clear(self, disk=False):
+        """ clear the results held in memory, and optionally on disk """
+        self._results.clear()
+        if disk and self.cache_dir is not None:
+            for fname in os.listdir(self.cache_dir):
+                if fname.startswith('xrd_') and fname.endswith('.npz'):
+                    os.remove(os.path.join(self.cache_dir, fname))
+
+xrd_cache = XRDCache()
+
+def _xrd_kpoints(sim_abc, wlambda, min_theta, max_theta, rspace=[1.,1.,1.], manual=False,
+                 periodic=[True,True,True], symmetry=None, chunk_size=2**14):
+    """ generate chunks of the reciprocal lattice mesh points within the Eswald's sphere 
+    (and angular limits), reduced by symmetry (see compute_xrd)
+    
+    Yields
+    ------
+    imesh : np.array((N,3),dtype=int)
+        integer indices of the k-points
+    rmesh_sphere : np.array((N,3))
+        mesh of k points defining reciprocal lattice, 
+        retricted to Eswald's shere (and angular limits)
+    k_mods : np.array((N,))
+         modulus for each k-point
+    thetas : np.array((N,))
+        angles for each k-point (radians)
+    weights : np.array((N,)) or None
+        multiplicity of each k-point, or None if symmetry is None
+    
+    """
+    spacegroup = None
+    if symmetry is not None and symmetry != 'friedel':
+        if manual or not np.allclose(rspace, rspace[0]):
+            raise ValueError('point group symmetry requires equal rspace and manual=False')
+        spacegroup = symmetry if isinstance(symmetry, Spacegroup) else Spacegroup(symmetry)
+    
+    for imesh, rmesh_sphere, k_mods, thetas in _iter_rmesh_sphere(
+            sim_abc,wlambda,min_theta, max_theta,rspace, manual, periodic,
+            friedel=symmetry is not None, chunk_size=chunk_size):
+        if symmetry is None:
+            yield imesh, rmesh_sphere, k_mods, thetas, None
+        else:
+            mask, weights = _symmetry_weights(imesh, spacegroup)
+            yield imesh[mask], rmesh_sphere[mask], k_mods[mask], thetas[mask], weights
+
+def _fft_grid_setup(sim_abc, wlambda, max_theta, rspace=[1.,1.,1.], manual=False,
+                    periodic=[True,True,True], fft_order=8, fft_oversample=2.):
+    """ compute the mesh basis and grid shape for the fast fourier transform """
+    basis, _ = _mesh_basis(sim_abc, rspace, manual, periodic)
+    Kmax = 2 * math.sin(max_theta) / wlambda 
+    nmax = np.floor(Kmax * np.linalg.norm(np.linalg.inv(basis), axis=0) + 1e-9).astype(int)
+    return basis, _fft_grid_shape(nmax, fft_order, fft_oversample)
+
+def _fft_grids(atoms_df, basis, shape, fft_order=8, max_memory=2**27, precision='double'):
+    """ compute the fast fourier transform grid for each atom type """
+    xyz = atoms_df[['x','y','z']].values
+    dtype = get_float_dtype(precision)
+    return {atype:_structure_grid_fft(xyz[type_index], basis, shape, fft_order, max_memory, dtype)
+            for atype, type_index in type_groups(atoms_df.type)}
+
+_xrd_worker_kwargs = {}
+
+def _xrd_frame(atoms_df, imesh, rmesh_sphere, wlambda, struct_factors, thetas, k_mods, weights, 
+               lp=True, max_memory=2**27, n_jobs=1, basis=None, fft_shape=None, fft_order=8,
+               precision='double'):
+    """ compute the (real) diffraction intensities of a single frame, 
+    for a precomputed reciprocal lattice mesh and structure factors 
+    (using the fast fourier transform method if fft_shape is given) """
+    fft_grids = None
+    if fft_shape is not None:
+        fft_grids = _fft_grids(atoms_df, basis, fft_shape, fft_order, max_memory, precision)
+    pool = _thread_pool(n_jobs) if fft_shape is None else None
+    try:
+        I = _calc_intensities(atoms_df,rmesh_sphere,wlambda,struct_factors,thetas,k_mods,
+                              use_Lp=lp,max_memory=max_memory,pool=pool,
+                              fft_grids=fft_grids,imesh=imesh,basis=basis,precision=precision)
+    finally:
+        _close_pool(pool)
+    if weights is not None:
+        I = I * weights
+    return np.real(I)
+
+def _xrd_worker_init(kwargs):
+    """ store the precomputed mesh data in a worker process """
+    _xrd_worker_kwargs.clear()
+    _xrd_worker_kwargs.update(kwargs)
 
+def _xrd_worker(atoms_df):
+    """ compute the diffraction intensities of a single frame in a worker process """
+    return _xrd_frame(atoms_df, **_xrd_worker_kwargs)
 
+def compute_xrd_trajectory(data_input, configs, wlambda, min2theta=1.,max2theta=179., lp=True,
+                           rspace=[1,1,1], manual=False,periodic=[True,True,True],
+                           max_memory=2**27, n_jobs=1, method='direct', fft_order=8, fft_oversample=2.,
+                           symmetry=None, chunk_size=2**14, processes=1, precision='double'):
+    """Compute predicted x-ray diffraction intensities for a given wavelength, 
+    averaged over the configurations of a trajectory (e.g. thermalised frames) 
+    
+    the cell (a,b,c) and atom types are taken from the first configuration, 
+    and so the reciprocal lattice mesh and structure factors are only computed once,
+    then the intensities of each frame are accumulated as a running mean and variance, 
+    such that only one frame (per process) is held in memory at a time
+    
+    Properties
+    ----------
+    data_input : ipymd.data_input.base.DataInput
+        the (setup) trajectory data, with a fixed cell
+    configs : list of int or None
+        the configurations to compute, if None then all configurations are computed
+    wlambda : float
+        radiation wavelength (length units)
+        typical values are Cu Ka = 1.54, Mo Ka = 0.71 Angstroms
+    processes : int
+        number of processes over which to split the frames, 
+        if -1 then all processors are used
+    
+    for the remaining parameters see compute_xrd
+    
+    Returns
+    -------
+    2thetas : np.array((N,1))
+        2theta angles for each k-point (degrees)
+    mean_intensities : np.array((N,1))
+         mean intensity for each k-point
+    var_intensities : np.array((N,1))
+         (sample) variance of the intensity for each k-point, 
+         zero if only one configuration is computed
+    
     """
+    if method not in ['direct', 'fft']:
+        raise ValueError("method must be 'direct' or 'fft'")
+    if configs is None:
+        configs = range(1, data_input.count_configs()+1)
+    configs = list(configs)
+    if not configs:
+        raise ValueError('no configurations to compute')
+    if processes == -1:
+        processes = cpu_count()
+    
+    meta_data = data_input.get_meta_data(configs[0])
     sim_abc = np.asarray([meta_data.a,meta_data.b,meta_data.c])
+    types_df = data_input.get_atom_data(configs[0])[['type']]
     
     min_theta, max_theta = _set_thetas(min2theta,max2theta)    
-    rmesh = _compute_rmesh_triclinic(sim_abc,wlambda,min_theta, max_theta,rspace, manual, periodic)
-    rmesh_sphere, k_mods, thetas = _restrict_rmesh(rmesh,wlambda,min_theta, max_theta)
-    struct_factors = _calc_struct_factors(atoms_df,rmesh_sphere,k_mods)
-    I = _calc_intensities(atoms_df,rmesh_sphere,wlambda,struct_factors,thetas,k_mods,use_Lp=lp)
+    kpoints = list(zip(*_xrd_kpoints(sim_abc,wlambda,min_theta, max_theta,rspace, manual, periodic,
+                                     symmetry, chunk_size)))
+    if kpoints:
+        imesh, rmesh_sphere, k_mods, thetas = [np.concatenate(a) for a in kpoints[:4]]
+        weights = None if symmetry is None else np.concatenate(kpoints[4])
+    else:
+        imesh, rmesh_sphere = np.zeros((0,3), dtype=int), np.zeros((0,3))
+        k_mods, thetas, weights = np.zeros(0), np.zeros(0), None if symmetry is None else np.zeros(0)
+    del kpoints
+    struct_factors = _calc_struct_factors(types_df,rmesh_sphere,k_mods)
+    
+    kwargs = dict(imesh=imesh, rmesh_sphere=rmesh_sphere, wlambda=wlambda, 
+                  struct_factors=struct_factors, thetas=thetas, k_mods=k_mods, weights=weights,
+                  lp=lp, max_memory=max_memory, n_jobs=n_jobs, fft_order=fft_order, 
+                  precision=precision)
+    kwargs['basis'], _ = _mesh_basis(sim_abc, rspace, manual, periodic)
+    if method == 'fft':
+        kwargs['basis'], kwargs['fft_shape'] = _fft_grid_setup(sim_abc, wlambda, max_theta, 
+                                       rspace, manual, periodic, fft_order, fft_oversample)
+    
+    # running mean and variance (Welford's algorithm)
+    mean = np.zeros(thetas.shape[0])
+    sum_sqr = np.zeros(thetas.shape[0])
+    count = 0
+    def accumulate(I):
+        delta = I - mean
+        mean[:] += delta / count
+        sum_sqr[:] += delta * (I - mean)
+    
+    if processes > 1:
+        pool = Pool(processes, initializer=_xrd_worker_init, initargs=(kwargs,))
+        try:
+            # read the frames in batches, so that only one per process is held in memory
+            for start in range(0, len(configs), processes):
+                frames = [data_input.get_atom_data(config) 
+                          for config in configs[start:start+processes]]
+                for I in pool.map(_xrd_worker, frames):
+                    count += 1
+                    accumulate(I)
+                del frames
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for config in configs:
+            I = _xrd_frame(data_input.get_atom_data(config), **kwargs)
+            count += 1
+            accumulate(I)
+    
+    variance = sum_sqr / (count - 1) if count > 1 else sum_sqr
+    return np.degrees(2*thetas), mean, variance
+
+def _pair_distance_histograms(xyz, types, bin_width=0.005, max_memory=2**27):
+    """ compute the distances between each pair of atoms, by pair of atom types,
+    in chunks of atoms
     
-    return np.degrees(2*thetas), I
+    Parameters
+    ----------
+    xyz : np.array((N,3))
+        atom coordinates
+    types : np.array((N,))
+        atom types
+    bin_width : float or None
+        width of the distance bins (length units), 
+        if None the exact distances are returned
+    max_memory : int
+        approximate maximum memory (bytes) of the temporary distance arrays
+        
+    Returns
+    -------
+    pair_dists : dict((np.array((M,)), np.array((M,))))
+        distances and number of pairs at that distance (values), 
+        for each pair of atom types (keys), with each atom pair counted once
+    
+    """
+    type_index = dict(type_groups(types))
+    type_list = sorted(type_index)
+    if bin_width is not None:
+        max_dist = np.linalg.norm(np.ptp(xyz, axis=0)) if xyz.shape[0] else 0.
+        num_bins = int(max_dist // bin_width) + 1
+        centres = (np.arange(num_bins) + 0.5) * bin_width
+    
+    pair_dists = {}
+    for a, atype in enumerate(type_list):
+        xyz_a = xyz[type_index[atype]]
+        for btype in type_list[a:]:
+            xyz_b = xyz[type_index[btype]]
+            chunk = max(1, int(max_memory // (4*8*max(1, xyz_b.shape[0]))))
+            dists = []
+            counts = np.zeros(num_bins) if bin_width is not None else None
+            for start in range(0, xyz_a.shape[0], chunk):
+                diff = xyz_a[start:start+chunk, None, :] - xyz_b[None, :, :]
+                d = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+                if atype == btype:
+                    # only count each pair once (j > i)
+                    i = np.arange(start, start + d.shape[0])[:, None]
+                    d = d[i < np.arange(xyz_b.shape[0])[None, :]]
+                else:
+                    d = d.ravel()
+                if bin_width is None:
+                    dists.append(d)
+                else:
+                    counts += np.bincount((d // bin_width).astype(int), minlength=num_bins)
+            if bin_width is None:
+                dists = np.concatenate(dists) if dists else np.zeros(0)
+                pair_dists[(atype, btype)] = (dists, np.ones(dists.shape[0]))
+            else:
+                nonzero = counts > 0
+                pair_dists[(atype, btype)] = (centres[nonzero], counts[nonzero])
+    
+    return pair_dists
+
+def compute_xrd_debye(atoms_df, wlambda, min2theta=1.,max2theta=179., step2theta=0.02,
+                      lp=True, bin_width=0.005, max_memory=2**27):
+    r"""Compute a predicted powder x-ray diffraction pattern for a given wavelength,
+    using the Debye scattering equation
+    
+    Properties
+    ----------
+    atoms_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
+        a dataframe of info for each atom, including columns; x,y,z,type
+    wlambda : float
+        radiation wavelength (length units)
+        typical values are Cu Ka = 1.54, Mo Ka = 0.71 Angstroms
+    min2theta : float
+        minimum 2 theta range to explore (degrees)
+    max2theta : float
+        maximum 2 theta range to explore (degrees)
+    step2theta : float
+        spacing of the 2 theta values (degrees)
+    lp : bool
+        switch to apply Lorentz-polarization factor
+    bin_width : float or None
+        width of the pair distance histogram bins (length units), 
+        if None the exact distances are used (only recommended for small numbers of atoms)
+    max_memory : int
+        approximate maximum memory (bytes) of temporary arrays
+
+    Returns
+    -------
+    2thetas : np.array((N,1))
+        2theta angles (degrees)
+    intensities : np.array((N,1))
+         intensity at each angle
+    
+    Notes
+    -----
+    Unlike compute_xrd, this does not require a periodic cell, 
+    and so is suited to nanoparticles and clusters. 
+    The pairwise distances between atoms are histogrammed once, by pair of atom types, 
+    which is O(N^2), then the orientationally averaged intensity is computed for each 
+    angle, which is O(bins) rather than O(N^2):
+    
+    .. math::
+    
+        I(\mathbf{K}) = \frac{Lp(\theta)}{N} \left[ \sum_{a} N_a f_a^2 + 
+        2 \sum_{a \leq b} f_a f_b \sum_{r} n_{ab}(r) \frac{\sin(2 \pi K r)}{2 \pi K r} \right]
+    
+    where :math:`n_{ab}(r)` is the number of pairs of atoms of types a and b at distance r,
+    and :math:`K = 2\sin(\theta)/\lambda`. 
+    Binning the distances introduces a relative phase error of order 
+    :math:`2\pi K` bin_width, i.e. ~0.02 for bin_width=0.005 and Cu Ka.
+
+    """
+    atoms_df = as_dataframe(atoms_df)
+    min_theta, max_theta = _set_thetas(min2theta,max2theta)
+    thetas = np.radians(np.arange(min2theta, max2theta + 0.5*step2theta, step2theta)) / 2.
+    thetas = thetas[(thetas >= min_theta) & (thetas <= max_theta)]
+    k_mods = 2 * np.sin(thetas) / wlambda
+    
+    xyz = atoms_df[['x','y','z']].values
+    types = atoms_df.type.values
+    struct_factors = _calc_struct_factors(atoms_df, None, k_mods)
+    pair_dists = _pair_distance_histograms(xyz, types, bin_width, max_memory)
+    
+    # self scattering
+    I = np.zeros(k_mods.shape[0])
+    for atype, atype_index in type_groups(types):
+        I += atype_index.shape[0] * struct_factors[atype]**2
+    
+    # pair scattering, sum_r n(r) sin(2 pi K r)/(2 pi K r), in chunks of k-points
+    for (atype, btype), (dists, counts) in pair_dists.items():
+        if dists.shape[0] == 0:
+            continue
+        chunk = max(1, int(max_memory // (8*dists.shape[0])))
+        pair_sum = np.empty(k_mods.shape[0])
+        for start in range(0, k_mods.shape[0], chunk):
+            kr = np.outer(2 * k_mods[start:start+chunk], dists)
+            pair_sum[start:start+chunk] = np.sinc(kr).dot(counts)
+        I += 2 * struct_factors[atype] * struct_factors[btype] * pair_sum
+    
+    if lp:
+        I *= _lp_factor(thetas, k_mods, wlambda)
+    
+    return np.degrees(2*thetas), I/float(atoms_df.shape[0])
+
+def _iter_rmesh_shell(basis, kmax, centre, radius, thickness, chunk_size=2**14):
+    """ generate the reciprocal lattice mesh points within a spherical shell, 
+    and |K| <= kmax (excluding the origin), in chunks
+    
+    the (h,k,l) points are enumerated row by row, computing the range of l 
+    within the outer sphere minus the range within the inner sphere
+    
+    Yields
+    ------
+    imesh : np.array((N,3),dtype=int)
+        integer indices of the k-points
+    rmesh : np.array((N,3))
+        k-points
+    
+    """
+    Knmax = np.floor(kmax * np.linalg.norm(np.linalg.inv(basis), axis=0) + 1e-9).astype(int)
+    r_out = radius + 0.5*thickness
+    r_in = max(radius - 0.5*thickness, 0.)
+    kvals = np.arange(-Knmax[1], Knmax[1]+1)
+    
+    def slabs():
+        for h in range(-Knmax[0], Knmax[0]+1):
+            p = h * basis[0] + np.outer(kvals, basis[1])
+            lmin, lmax, row = _line_sphere(p, basis[2], np.zeros(3), kmax)
+            omin, omax, orow = _line_sphere(p, basis[2], centre, r_out)
+            imin, imax, irow = _line_sphere(p, basis[2], centre, r_in)
+            row &= orow
+            lmin = np.ceil(np.maximum(lmin, omin) - 1e-9).astype(int)[row]
+            lmax = np.floor(np.minimum(lmax, omax) + 1e-9).astype(int)[row]
+            # exclude the range strictly within the inner sphere
+            irow = irow[row]
+            inner_min = np.ceil(imin[row] + 1e-9).astype(int)
+            inner_max = np.floor(imax[row] - 1e-9).astype(int)
+            imesh = np.concatenate((
+                _expand_rows(h, kvals[row], lmin, np.where(irow, np.minimum(lmax, inner_min-1), lmax)),
+                _expand_rows(h, kvals[row], np.where(irow, np.maximum(lmin, inner_max+1), lmax+1), lmax)))
+            
+            rmesh = imesh.dot(basis)
+            dist = np.linalg.norm(rmesh - centre, axis=1)
+            mask = ((np.linalg.norm(rmesh, axis=1) <= kmax) & (dist <= r_out) & (dist >= r_in) 
+                    & np.any(imesh, axis=1))
+            yield imesh[mask], rmesh[mask]
+    
+    return _rechunk(slabs(), chunk_size)
+
+def compute_saed(atoms_df, meta_data, wlambda=0.0251, zone_axis=[0,0,1], kmax=1.7, thickness=0.01,
+                 rspace=[1,1,1], manual=False, periodic=[True,True,True], resolution=501,
+                 max_memory=2**27, n_jobs=1, chunk_size=2**14, precision='double'):
+    r"""Compute a predicted selected area electron diffraction (SAED) pattern, 
+    along a zone axis
+    
+    Properties
+    ----------
+    atoms_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
+        a dataframe of info for each atom, including columns; x,y,z,type
+    meta_data : pandas.Series
+        data of a,b,c crystal vectors (as tuples, e.g. meta_data.a = (0,0,1))
+    wlambda : float
+        radiation wavelength (length units)
+        typical values are 0.0370, 0.0251 and 0.0197 Angstroms for 100, 200 and 300 kV electrons
+    zone_axis : list of floats
+        the incident beam direction [uvw], in terms of the a,b,c crystal vectors
+    kmax : float
+        maximum modulus of the k-points (inverse length units)
+    thickness : float
+        thickness of the Eswald sphere shell (inverse length units), 
+        within which k-points are considered
+    rspace : list of floats
+        parameters to adjust the spacing of the reciprocal lattice nodes 
+        in the h, k, and l directions respectively
+    manual : bool
+        use manual spacing of reciprocal lattice points based on the values of the c parameters 
+    periodic : list of bools
+        whether periodic boundary in the h, k, and l directions respectively
+    resolution : int
+        number of pixels in each dimension of the image
+    max_memory : int
+        approximate maximum memory (bytes) of temporary arrays in the fourier summation
+    n_jobs : int
+        number of threads over which to split the k-points in the fourier summation,
+        if -1 then all processors are used
+    chunk_size : int
+        maximum number of reciprocal lattice points to compute at a time
+    precision : str
+        'single' or 'double' precision of the phase factor computations
+
+    Returns
+    -------
+    image : np.array((resolution,resolution))
+        summed intensity of the k-points in each pixel, 
+        with rows along y and columns along x
+    extent : tuple
+        (xmin, xmax, ymin, ymax) of the image (inverse length units), 
+        i.e. for plotting with imshow(image, origin='lower', extent=extent)
+    
+    Notes
+    -----
+    This is an implementation of the virtual electron diffraction pattern algorithm
+    by Coleman *et al*. [ref1]_ For the short wavelength of electrons 
+    the Eswald's sphere (of radius :math:`1/\lambda`, centered at :math:`-\mathbf{k}_0`, 
+    where :math:`\mathbf{k}_0` is the incident beam along the zone axis) 
+    is almost flat, and only the k-points in a thin shell around it are computed, 
+    i.e. those diffracting near the plane perpendicular to the zone axis, 
+    which are far fewer than the full 3D mesh.
+    The intensity at each k-point is computed as for compute_xrd, 
+    but using electron atomic scattering factors and without the Lorentz-polarization factor.
+    The direct beam (K=0) is excluded.
+    
+    The k-points are projected on to the plane perpendicular to the zone axis, 
+    with x along the (projected) a* reciprocal vector, and y perpendicular to it.
+
+    References
+    ----------
+    
+    .. [ref1] Coleman, S. P., Sichani, M. M. & Spearot, D. E. 
+        A Computational Algorithm to Produce Virtual X-ray and Electron Diffraction 
+        Patterns from Atomistic Simulations. JOM 66, 408–416 (2014).
+
+    """
+    atoms_df = as_dataframe(atoms_df)
+    sim_abc = np.asarray([meta_data.a,meta_data.b,meta_data.c])
+    if not np.any(periodic):
+        raise ValueError('at least one direction must be periodic')
+    basis, _ = _mesh_basis(sim_abc, rspace, manual, periodic)
+    
+    zone = np.asarray(zone_axis, dtype=float).dot(sim_abc)
+    zone /= np.linalg.norm(zone)
+    centre = -zone / wlambda
+    
+    # image axes perpendicular to the zone axis
+    recip = np.linalg.inv(sim_abc).T
+    for vec in recip:
+        x_axis = vec - vec.dot(zone)*zone
+        if np.linalg.norm(x_axis) > 1e-6 * np.linalg.norm(vec):
+            break
+    x_axis /= np.linalg.norm(x_axis)
+    y_axis = np.cross(zone, x_axis)
+    
+    image = np.zeros((resolution, resolution))
+    edges = np.linspace(-kmax, kmax, resolution+1)
+    pool = _thread_pool(n_jobs)
+    try:
+        for imesh, rmesh in _iter_rmesh_shell(basis, kmax, centre, 1./wlambda, thickness, chunk_size):
+            k_mods = np.linalg.norm(rmesh, axis=1)
+            struct_factors = _calc_struct_factors(atoms_df, rmesh, k_mods, radiation='electron')
+            I = _calc_intensities(atoms_df, rmesh, wlambda, struct_factors, use_Lp=False,
+                                  max_memory=max_memory, pool=pool, imesh=imesh, basis=basis,
+                                  precision=precision)
+            image += np.histogram2d(rmesh.dot(y_axis), rmesh.dot(x_axis), bins=(edges, edges), 
+                                    weights=np.real(I))[0]
+    finally:
+        _close_pool(pool)
+    
+    return image, (-kmax, kmax, -kmax, kmax)
+
+def plot_saed(image, extent, cmap='gray', log=True):
+    """ create plot of an electron diffraction pattern
+    
+    Properties
+    ----------
+    image : np.array((N,M))
+        the intensity image (see compute_saed)
+    extent : tuple
+        (xmin, xmax, ymin, ymax) of the image
+    cmap : str
+        the colormap
+    log : bool
+        whether to plot the log of the intensities, i.e. log(1+I)
+    
+    Returns
+    -------
+    plot : ipymd.plotting.Plotting
+        a plot object
+    
+    """
+    plot = plotting.Plotter()
+    plot.axes.imshow(np.log1p(image) if log else image, origin='lower', extent=extent, 
+                     cmap=cmap, interpolation='nearest')
+    plot.axes.set_xlabel(r'$K_x$')
+    plot.axes.set_ylabel(r'$K_y$')
+    return plot
 
 def plot_xrd_hist(ang2thetas, intensities, bins=180*100, wlambda=None,barwidth=None):
     """ create histogram plot of xrd spectrum
@@ -503,4 +1530,132 @@ def plot_xrd_hist(ang2thetas, intensities, bins=180*100, wlambda=None,barwidth=N
         plot.axes.legend(loc='upper right',framealpha=0.5)
     return plot
 
+def _merge_peaks(ang2thetas, intensities, tolerance=1e-6):
+    """ merge peaks at (near) identical angles, summing their intensities
+    
+    Returns
+    -------
+    ang2thetas : np.array((M,))
+        the mean angle of each merged peak
+    intensities : np.array((M,))
+        the summed intensity of each merged peak
+    
+    """
+    order = np.argsort(ang2thetas, kind='mergesort')
+    angles = np.asarray(ang2thetas, dtype=float)[order]
+    weights = np.real(intensities)[order]
+    if angles.shape[0] == 0:
+        return angles, weights
+    starts = np.concatenate(([0], np.nonzero(np.diff(angles) > tolerance)[0] + 1))
+    counts = np.diff(np.append(starts, angles.shape[0]))
+    return np.add.reduceat(angles, starts) / counts, np.add.reduceat(weights, starts)
+
+def _peak_kernel(x, fwhm, shape='gaussian', eta=0.5):
+    """ compute a peak profile of unit area, centred at x=0 """
+    if shape not in ['gaussian', 'lorentzian', 'pseudo-voigt']:
+        raise ValueError("shape must be 'gaussian', 'lorentzian' or 'pseudo-voigt'")
+    gamma = 0.5 * fwhm
+    sigma = fwhm / (2*np.sqrt(2*np.log(2)))
+    gauss = np.exp(-0.5*(x/sigma)**2) / (sigma*np.sqrt(2*np.pi))
+    lorentz = gamma / (np.pi*(x**2 + gamma**2))
+    if shape == 'gaussian':
+        return gauss
+    elif shape == 'lorentzian':
+        return lorentz
+    return eta*lorentz + (1-eta)*gauss
+
+def xrd_profile(ang2thetas, intensities, fwhm=0.1, shape='gaussian', eta=0.5, 
+                step=0.01, min2theta=None, max2theta=None, tolerance=1e-6):
+    """ compute a continuous, peak-broadened, xrd profile
+    
+    the intensities at (near) identical angles are first merged into single peaks, 
+    then interpolated on to a uniform grid and convolved with the peak profile 
+    (by fast fourier transform)
+    
+    Properties
+    ----------
+    ang2thetas : np.array((N,1))
+        2theta angles for each k-point (degrees)
+    intensities : np.array((N,1))
+         intensity for each k-point
+    fwhm : float
+        full width at half maximum of the peak profile (degrees)
+    shape : str
+        the peak profile; 'gaussian', 'lorentzian' or 'pseudo-voigt'
+    eta : float
+        the fraction of lorentzian in the pseudo-voigt profile
+    step : float
+        spacing of the profile 2theta values (degrees)
+    min2theta : float or None
+        minimum 2 theta of the profile (degrees), if None use the minimum angle
+    max2theta : float or None
+        maximum 2 theta of the profile (degrees), if None use the maximum angle
+    tolerance : float
+        maximum difference in angles (degrees) of peaks to merge
+    
+    Returns
+    -------
+    2thetas : np.array((M,))
+        uniformly spaced 2theta angles (degrees)
+    profile : np.array((M,))
+        intensity per degree at each angle
+    
+    """
+    angles, peaks = _merge_peaks(ang2thetas, intensities, tolerance)
+    if min2theta is None:
+        min2theta = angles.min() if angles.shape[0] else 0.
+    if max2theta is None:
+        max2theta = angles.max() if angles.shape[0] else 180.
+    num = int(round((max2theta - min2theta) / step)) + 1
+    grid = min2theta + step * np.arange(num)
+    
+    # interpolate the peaks on to the grid (conserving intensity and centroid)
+    pos = (angles - min2theta) / step
+    lower = np.floor(pos).astype(int)
+    frac = pos - lower
+    deposited = np.zeros(num)
+    for index, weight in ((lower, peaks*(1-frac)), (lower+1, peaks*frac)):
+        inside = (index >= 0) & (index < num)
+        deposited += np.bincount(index[inside], weights=weight[inside], minlength=num)
+    
+    # convolve with the peak kernel, zero padded to avoid wrapping
+    size = _fast_fft_length(2*num)
+    offsets = np.arange(size)
+    offsets = np.where(offsets < size - offsets, offsets, offsets - size) * step
+    kernel = _peak_kernel(offsets, fwhm, shape, eta)
+    profile = np.fft.irfft(np.fft.rfft(deposited, size) * np.fft.rfft(kernel), size)[:num]
+    
+    return grid, profile
+
+def plot_xrd_profile(ang2thetas, profile, wlambda=None, **kwargs):
+    """ create line plot of an xrd profile
+    
+    Properties
+    ----------
+    ang2thetas : np.array((M,))
+        2theta angles (degrees)
+    profile : np.array((M,))
+        intensity at each angle
+    wlambda : float or None
+        the wavelength, for the legend
+    kwargs : 
+        additional keyword arguments for matplotlib.axes.Axes.plot
+    
+    Returns
+    -------
+    plot : ipymd.plotting.Plotting
+        a plot object
+    
+    """
+    plot = plotting.Plotter()
+    plot.axes.plot(ang2thetas, profile, 
+                   label=None if wlambda is None else r'$\lambda = {0}$'.format(wlambda), **kwargs)
+    plot.axes.set_xlabel(r'Scatteting Angle ($2 \theta$)')
+    plot.axes.set_ylabel('Relative Intensity')
+    plot.axes.set_yticklabels([])
+    plot.axes.grid(True) 
+    if wlambda is not None:
+        plot.axes.legend(loc='upper right',framealpha=0.5)
+    return plot
+
 ##TODO identification and classification of peaks    
\ No newline at end of file
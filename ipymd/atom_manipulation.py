@@ -4,15 +4,206 @@ Created on Mon May 16 08:15:13 2016
 
 @author: cjs14
 """
+from collections import deque
+import itertools
+from multiprocessing import cpu_count, Pool
+
 import pandas as pd
 import numpy as np
 from scipy.spatial import ConvexHull
-from matplotlib import cm
+from matplotlib import colormaps
 from matplotlib.colors import Normalize
 from six import string_types
 
-from .shared import atom_data
-from .shared.transformations import transform_to_crystal, rotate_vectors
+from .shared import atom_data, type_codes
+from .shared.colors import rgba_cols, get_rgba, set_rgba, to_rgba_array
+from .shared.transformations import rotate_vectors, Cell
+from .shared.atoms import Atoms
+
+def _default_meta(atom_df):
+    """ construct a unit cell from the min/max x, y, z values """
+    return pd.Series([(atom_df.x.min(),atom_df.y.min(),atom_df.z.min()),
+                      (atom_df.x.max()-atom_df.x.min(),0.,0.),
+                      (0.,atom_df.y.max()-atom_df.y.min(),0.),
+                      (0.,0.,atom_df.z.max()-atom_df.z.min())],
+                      index=['origin','a','b','c'])
+
+def _as_atom_df(atom_df, meta_series=None):
+    """ return (atom_df, meta_series), for an atoms DataFrame or Atoms """
+    if isinstance(atom_df, Atoms):
+        if meta_series is None:
+            meta_series = atom_df.meta
+        atom_df = atom_df.to_dataframe()
+    return atom_df, meta_series
+
+def _map_values(keys, vmap, current=None, default=False):
+    """ map an array of keys to values, by a lookup of the unique keys in vmap,
+    values may be scalars or iterables (e.g. color tuples) 
+    
+    keys : np.array((N,))
+    vmap : dict
+    current : np.array((N,)) or None
+        the values to retain where a key is not in vmap (if default is False)
+    default : various
+        the value to put where a key is not in vmap, if False use current 
+    
+    """
+    codes, uniques = type_codes(keys)
+    keys = [key for key in uniques if key in vmap]
+    lookup = np.asarray(pd.Series([vmap[key] for key in keys] or [np.nan]))
+
+    # map the codes of the unique types to positions in the lookup
+    key_index = np.full(len(uniques), -1, dtype=int)
+    key_index[[key in vmap for key in uniques]] = np.arange(len(keys))
+    row_index = np.where(codes >= 0, key_index[codes], -1)
+    mask = row_index >= 0
+    
+    if mask.all():
+        return lookup[row_index]
+
+    if default is not False:
+        fallback = np.repeat(np.asarray(pd.Series([default])), codes.shape[0])
+    elif current is not None:
+        fallback = np.asarray(current)
+    else:
+        fallback = np.repeat(np.nan, codes.shape[0])
+    values = fallback.astype(np.result_type(fallback, lookup))
+    values[mask] = lookup[row_index[mask]]
+    return values
+
+def _variable_colors(var, cmap='jet', minv=None, maxv=None):
+    """ map numeric values to np.array((N,4),dtype=uint8) rgba colors """
+    colormap = colormaps[cmap]
+    var = np.asarray(var)
+    minval = var.min() if minv is None else minv
+    maxval = var.max() if maxv is None else maxv
+    norm = Normalize(minval, maxval,clip=True)
+    return colormap(norm(var),bytes=True)
+
+def _category_colors(cats, cmap='jet', sort=True):
+    """ map categories to np.array((N,4),dtype=uint8) rgba colors """
+    colormap = colormaps[cmap]
+    cats = np.asarray(cats)
+    unique_cats = pd.unique(cats)
+    if sort:
+        unique_cats = sorted(unique_cats)
+    num_cats = float(len(unique_cats))
+    
+    #potential way to always have a string the same color
+    #for cat in unique_cats:
+        #[(ord(c)-97)/122. for c in cat.lower() if ord(c)>=97 and ord(c)<=122]        
+    
+    cat_colors = colormap(np.arange(len(unique_cats))/num_cats,bytes=True)
+    return cat_colors[pd.Index(unique_cats).get_indexer(cats)]
+
+def _replace_values(values, map_dict):
+    """ replace values according to the map_dict, 
+    for categorical values only the categories are replaced """
+    if isinstance(values, pd.Series):
+        values = values.values
+    if not isinstance(values, pd.Categorical):
+        return np.asarray(pd.Series(values).replace(map_dict))
+    categories = pd.Series(np.asarray(values.categories, dtype=object)).replace(map_dict)
+    # categories mapped to the same value are merged
+    codes, uniques = pd.factorize(categories.values)
+    return pd.Categorical.from_codes(np.append(codes, -1)[values.codes], 
+                                     pd.Index(uniques, dtype=object))
+
+def _update_type_table(meta, vtype, values):
+    """ update the type table of the meta, for changed categorical atom types """
+    if vtype == 'type' and 'types' in meta.index and isinstance(values, pd.Categorical):
+        meta['types'] = tuple(values.categories)
+
+def _map_colors(keys, vmap, current=None, default=False):
+    """ map an array of keys to np.array((N,4),dtype=uint8) rgba colors, 
+    by a lookup of the unique keys in vmap (so each color is only converted once)
+    
+    keys : np.array((N,))
+    vmap : dict
+        key -> color name or (r,g,b[,a]) tuple
+    current : np.array((N,4),dtype=uint8) or None
+        the colors to retain where a key is not in vmap (if default is False)
+    default : various
+        the color to put where a key is not in vmap, if False use current 
+    
+    """
+    codes, uniques = type_codes(keys)
+    keys = [key for key in uniques if key in vmap]
+    lookup = to_rgba_array([vmap[key] if isinstance(vmap[key], string_types) 
+                            else tuple(vmap[key]) for key in keys])
+
+    # map the codes of the unique types to positions in the lookup
+    key_index = np.full(len(uniques), -1, dtype=int)
+    key_index[[key in vmap for key in uniques]] = np.arange(len(keys))
+    row_index = np.where(codes >= 0, key_index[codes], -1)
+    mask = row_index >= 0
+
+    if default is not False:
+        rgba = np.repeat(to_rgba_array([default]), codes.shape[0], axis=0)
+    elif current is not None:
+        rgba = np.array(current, dtype=np.uint8)
+    elif mask.all():
+        rgba = np.empty((codes.shape[0], 4), dtype=np.uint8)
+    else:
+        missing = [key for key in uniques if not key in vmap]
+        raise ValueError('no color for {0} and no current colors or default'.format(missing))
+    rgba[mask] = lookup[row_index[mask]]
+    return rgba
+
+def _slice_mask(abc, fmin, fmax, incl_max=False, delta=0.01):
+    """ mask of fractional coordinates within [fmin, fmax) or [fmin, fmax] """
+    fmin = np.asarray(fmin, dtype=float) - delta
+    fmax = np.asarray(fmax, dtype=float) + delta
+    if incl_max:
+        return ((abc >= fmin) & (abc <= fmax)).all(axis=1)
+    return ((abc >= fmin) & (abc < fmax)).all(axis=1)
+
+def _slice_meta(meta, fmin, fmax):
+    """ update the unit cell (in-place) to match a fractional slice """
+    origin = np.asarray(meta.origin)
+    avec = np.asarray(meta.a)
+    bvec = np.asarray(meta.b)
+    cvec = np.asarray(meta.c)
+    (amin, bmin, cmin), (amax, bmax, cmax) = fmin, fmax
+
+    meta.origin = tuple(origin+amin*avec+bmin*bvec+cmin*cvec)
+    meta.a = avec * (amax-amin)
+    meta.b = bvec * (bmax-bmin)
+    meta.c = cvec * (cmax-cmin)            
+
+def _absolute_to_fraction(meta, amin, amax, bmin, bmax, cmin, cmax):
+    """ convert absolute slice lengths (None for the vector length) to fractions """
+    norms = [np.linalg.norm(meta[v]) for v in 'abc']
+    fmin = [vmin/norm for vmin, norm in zip([amin, bmin, cmin], norms)]
+    fmax = [1. if vmax is None else vmax/norm 
+            for vmax, norm in zip([amax, bmax, cmax], norms)]
+    return fmin, fmax
+
+def _box_mask(xyz, vectors, origin=np.zeros(3), tol=1e-8):
+    """ mask of points inside the box defined by vectors (a,b,c) and origin,
+    or within tol (distance) outside of its faces """
+    cell = Cell(vectors[0], vectors[1], vectors[2], origin)
+    abc = cell.to_fractional(xyz)
+    # the reciprocal vector lengths are the inverse of the spacings between faces
+    abc_tol = tol * np.linalg.norm(cell.reciprocal, axis=1)
+    return ((abc >= -abc_tol) & (abc <= 1 + abc_tol)).all(axis=1)
+
+def _wrap_fractional(frac):
+    """ wrap fractional coordinates (in-place) into [0,1) 
+    and return them with the integer image of each """
+    images = np.floor(frac)
+    frac -= images
+    # values just below zero can round up to 1
+    over = frac >= 1.
+    frac[over] -= 1.
+    images[over] += 1.
+    return frac, images.astype(int)
+
+def _as_list(values):
+    """ ensure single int, float or str values are in a list """
+    if isinstance(values, (int, float) + string_types):
+        return [values]
+    return values
 
 class Atom_Manipulation(object):
     """ a class to manipulate atom data
@@ -23,58 +214,98 @@ class Atom_Manipulation(object):
     def __init__(self, atom_df, meta_series=None,undos=1):
         """ a class to manipulate atom data
         
-        atom_df : pandas.DataFrame
+        atom_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
             containing columns; x, y, z, type
         meta_series : pandas.Series
             containing columns; origin, a, b, c to define unit cell
-            if none it will be constructed from the min/max x, y, z values
+            if none it will be taken from the Atoms cell, or 
+            constructed from the min/max x, y, z values
         undos : int
-            number of past dataframes to save
+            number of past manipulations that can be undone (0 disables the history)
+            
+        Notes
+        -----
+        the original atom_df is referenced (not copied) for revert_to_original, 
+        so should not be modified in-place after initialisation
         """
+        atom_df, meta_series = _as_atom_df(atom_df, meta_series)
         assert set(atom_df.columns).issuperset(['x','y','z','type'])
-        assert undos > 0
+        assert undos >= 0
         
         if meta_series is None:
-            meta_series = pd.Series([(atom_df.x.min(),atom_df.y.min(),atom_df.z.min()),
-                                     (atom_df.x.max()-atom_df.x.min(),0.,0.),
-                                     (0.,atom_df.y.max()-atom_df.y.min(),0.),
-                                     (0.,0.,atom_df.z.max()-atom_df.z.min())],
-                                     index=['origin','a','b','c'])
+            meta_series = _default_meta(atom_df)
         else:
             assert set(meta_series.index).issuperset(['origin','a','b','c'])                
         
         self._atom_df = atom_df.copy()
-        #the one on the left is the newest
-        self._old_atom_df = [None]*undos
-        self._original_atom_df = atom_df.copy()
-
+        self._original_atom_df = atom_df
         self._meta = meta_series.copy()
-        self._old_meta = [None]*undos
         self._original_meta = meta_series.copy()
 
+        #the one on the left is the newest
+        self._undos = undos
+        self._history = deque(maxlen=undos)
+
     @property
     def df(self):
-        return self._atom_df.copy() 
+        """ a copy of the current atom data """
+        return self._atom_df.copy()
     @property
     def meta(self):
         return self._meta.copy() 
+    @property
+    def atoms(self):
+        """ the current atom data and unit cell as an (array-backed) Atoms 
+        (a copy of the internal data) """
+        return Atoms.from_dataframe(self._atom_df, self._meta)
     
-    def _save(self):
-        self._old_atom_df.pop() # remove the oldest (right)
-        self._old_atom_df.insert(0,self._atom_df.copy()) # add newest left
-
-        self._old_meta.pop() # remove the oldest (right)
-        self._old_meta.insert(0,self._meta.copy()) # add newest left
+    def _save(self, columns=None, mask=None):
+        """ save the information required to undo the next manipulation 
         
-    def undo_last(self):
-        if self._old_atom_df[0] is not None:
-               self._atom_df = self._old_atom_df.pop(0) # get newest left
-               self._old_atom_df.append(None)  
-
-               self._meta = self._old_meta.pop(0) # get newest left
-               self._old_meta.append(None)  
+        columns : list
+            the columns that will be changed, only their values are stored
+        mask : np.array(dtype=bool)
+            the rows that will be retained, only the removed rows are stored
+        
+        if neither are given, the current DataFrame is stored by reference,
+        so the manipulation must then replace (not modify in-place) self._atom_df
+        """
+        if self._undos == 0:
+            return
+        if columns is not None:
+            state = ('columns', dict([(col, self._atom_df[col].copy() 
+                                       if col in self._atom_df.columns else None) 
+                                      for col in columns]))
+        elif mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            state = ('mask', (mask, self._atom_df[~mask]))
         else:
+            state = ('frame', self._atom_df)
+        self._history.appendleft((state, self._meta.copy())) # add newest left
+        
+    def undo_last(self):
+        if not self._history:
             raise Exception('No previous dataframes')
+        (kind, state), meta = self._history.popleft() # get newest left
+        
+        if kind == 'columns':
+            # (columns that did not exist may also have been removed, e.g. color)
+            df = self._atom_df.drop([col for col, values in state.items() 
+                                     if values is None], axis=1, errors='ignore')
+            for col, values in state.items():
+                if values is not None:
+                    df[col] = values.values
+        elif kind == 'mask':
+            mask, removed = state
+            # reinsert the removed rows in their original positions
+            order = np.argsort(np.concatenate([np.flatnonzero(mask),
+                                               np.flatnonzero(~mask)]), 
+                               kind='mergesort')
+            df = pd.concat([self._atom_df, removed]).iloc[order]
+        else:
+            df = state
+        self._atom_df = df
+        self._meta = meta
         
     def revert_to_original(self):
         """ revert to original atom_df """
@@ -84,24 +315,15 @@ class Atom_Manipulation(object):
         
     def change_variables(self, map_dict, vtype='type'):
         """ change particular variables according to the map_dict """
-        self._save()
-        self._atom_df.replace({vtype:map_dict}, inplace=True)
+        self._save([vtype])
+        values = _replace_values(self._atom_df[vtype], map_dict)
+        self._atom_df[vtype] = values
+        _update_type_table(self._meta, vtype, values)
 
     def change_type_variable(self, atom_type, variable, value, type_col='type'):
         """ change particular variable for one atom type """
-        self._save()
-        if not hasattr(value, '__iter__'):
-            # there is df.loc, df.at or df.set_value, not sure which ones best
-            self._atom_df.set_value(self._atom_df[type_col]==atom_type, variable, value)
-        else:
-            self._atom_df[variable] = self._atom_df[variable].astype(object) 
-            df = self._atom_df
-            # ensure all indexes are unique
-            df.index.name = 'old_index'
-            df.reset_index(drop=False,inplace=True)
-            for indx in df.loc[df[type_col]==atom_type].index:
-                df.set_value(indx,variable,value)
-            self._atom_df = df.set_index('old_index')                
+        self._save(self._map_save_cols(variable))
+        self._map_column({atom_type:value}, variable, False, type_col)
             
     def apply_map(self, vmap, column, default=False, type_col='type'):
         """ change values in a column, according to a mapping of another column
@@ -122,11 +344,25 @@ class Atom_Manipulation(object):
             df = atom_data()
             vmap = df[vmap].dropna().to_dict()
         
-        self._atom_df = self._atom_df.copy()
-        if default is not False:
-            self._atom_df[column] = default
-        for key, val in vmap.iteritems():
-            self.change_type_variable(key, column, val, type_col)
+        self._save(self._map_save_cols(column))
+        self._map_column(vmap, column, default, type_col)
+
+    def _map_save_cols(self, column):
+        """ the columns changed by _map_column """
+        return [column] + (rgba_cols if column == 'color' else [])
+
+    def _map_column(self, vmap, column, default=False, type_col='type'):
+        """ set column values by a lookup of the type_col values in vmap """
+        if column == 'color':
+            current = None
+            if 'color' in self._atom_df.columns or set(rgba_cols).issubset(self._atom_df.columns):
+                current = get_rgba(self._atom_df)
+            set_rgba(self._atom_df, _map_colors(self._atom_df[type_col].values, vmap, 
+                                                current, default))
+            return
+        current = self._atom_df[column] if column in self._atom_df.columns else None
+        self._atom_df[column] = _map_values(self._atom_df[type_col].values, vmap, 
+                                            current, default)
         
     def color_by_index(self, cmap='jet', minv=None, maxv=None):
         """change colors to map index values 
@@ -137,14 +373,9 @@ class Atom_Manipulation(object):
             optional min, max cmap value, otherwise take min, max value found in column
             
         """
-        colormap = cm.get_cmap(cmap)
-        var = self._atom_df.index
-        minval = var.min() if minv is None else minv
-        maxval = var.max() if maxv is None else maxv
-        norm = Normalize(minval, maxval,clip=True)
-        
-        self._save()
-        self._atom_df.color = [tuple(col[:3]) for col in colormap(norm(var),bytes=True)]
+        rgba = _variable_colors(self._atom_df.index, cmap, minv, maxv)
+        self._save(['color'] + rgba_cols)
+        set_rgba(self._atom_df, rgba)
 
     def color_by_variable(self, colname, cmap='jet', minv=None, maxv=None):
         """change colors to map 
@@ -157,14 +388,9 @@ class Atom_Manipulation(object):
             optional min, max cmap value, otherwise take min, max value found in column
             
         """
-        colormap = cm.get_cmap(cmap)
-        var = self._atom_df[colname]
-        minval = var.min() if minv is None else minv
-        maxval = var.max() if maxv is None else maxv
-        norm = Normalize(minval, maxval,clip=True)
-        
-        self._save()
-        self._atom_df.color = [tuple(col[:3]) for col in colormap(norm(var),bytes=True)]
+        rgba = _variable_colors(self._atom_df[colname], cmap, minv, maxv)
+        self._save(['color'] + rgba_cols)
+        set_rgba(self._atom_df, rgba)
 
     def color_by_categories(self, colname, cmap='jet', sort=True):
         """change colors to map 
@@ -175,37 +401,19 @@ class Atom_Manipulation(object):
             the colormap to apply, see available at http://matplotlib.org/examples/color/colormaps_reference.html
             
         """
-        colormap = cm.get_cmap(cmap)        
-        cats = self._atom_df[colname]   
-        unique_cats = cats.unique()
-        if sort:
-            unique_cats = sorted(unique_cats)
-        num_cats = float(cats.nunique())
-        
-        #potential way to always have a string the same color
-        #for cat in unique_cats:
-            #[(ord(c)-97)/122. for c in cat.lower() if ord(c)>=97 and ord(c)<=122]        
-        
-        color_dict = dict([(cat,colormap(i/num_cats,bytes=True)[:3]) for i,cat in enumerate(unique_cats)])
-        
-        self._save()
-        self._atom_df.color = cats.map(color_dict)
+        rgba = _category_colors(self._atom_df[colname], cmap, sort)
+        self._save(['color'] + rgba_cols)
+        set_rgba(self._atom_df, rgba)
                 
     def filter_variables(self, values, vtype='type'):
-        if isinstance(values, int):
-            values = [values]
-        if isinstance(values, float):
-            values = [values]
-        if isinstance(values, string_types):
-            values = [values]
-        
-        self._save()
-        self._atom_df = self._atom_df[self._atom_df[vtype].isin(values)]        
+        mask = self._atom_df[vtype].isin(_as_list(values)).values
+        self._save(mask=mask)
+        self._atom_df = self._atom_df[mask]
             
 #------------------------
 # Geometric manipulation
             
-    def repeat_cell(self,a=1,b=1,c=1,original_first=False):
+    def repeat_cell(self,a=1,b=1,c=1,original_first=False,image_index=False):
         """ repeat atoms along a, b, c directions (and update unit cell)
     
         a : int or tuple
@@ -216,6 +424,9 @@ class Atom_Manipulation(object):
             repeats in 'c' direction, if tuple then defines repeats in -/+ direction
         original_first: bool
             if True, the original atoms will be first in the DataFrame
+        image_index : bool
+            if True, add columns; source_index (the position of the original atom) 
+            and image_a, image_b, image_c (the integer cell offsets of the image)
         """
         if isinstance(a, int):
             arange = range(0,abs(a)+1)
@@ -234,21 +445,26 @@ class Atom_Manipulation(object):
         bvec = np.asarray(self._meta.b)
         cvec = np.asarray(self._meta.c)        
 
-        dfs = []
+        images = np.array(list(itertools.product(arange, brange, crange)), dtype=int)
         if original_first:
-            dfs.append(self._atom_df.copy())            
-            
-        for i in arange:
-            for j in brange:
-                for k in crange:
-                    if i==0 and j==0 and k==0 and original_first:
-                        continue
-                    atom_copy = self._atom_df.copy()
-                    atom_copy[['x','y','z']] = (atom_copy[['x','y','z']]
-                                + i*avec  + j*bvec + k*cvec)
-                    dfs.append(atom_copy)
+            is_original = (images==0).all(axis=1)
+            images = np.concatenate([images[is_original], images[~is_original]])
+        shifts = images.dot(np.array([avec, bvec, cvec], dtype=float))
+        
+        # a single take of all columns, then broadcast (images, N, 3) coordinates 
+        num_atoms = self._atom_df.shape[0]
+        source = np.tile(np.arange(num_atoms), images.shape[0])
+        xyz = self._atom_df[['x','y','z']].values
+        new_xyz = (xyz[np.newaxis,:,:] + shifts[:,np.newaxis,:]).reshape(-1,3)
+        
+        df = self._atom_df.iloc[source]
+        df = df.assign(x=new_xyz[:,0], y=new_xyz[:,1], z=new_xyz[:,2])
+        if image_index:
+            image_ids = np.repeat(images, num_atoms, axis=0)
+            df = df.assign(source_index=source, image_a=image_ids[:,0],
+                           image_b=image_ids[:,1], image_c=image_ids[:,2])
         self._save()
-        self._atom_df = pd.concat(dfs)
+        self._atom_df = df
         #TODO check for identical atoms and warn
         
         origin = np.asarray(self._meta.origin)
@@ -313,33 +529,15 @@ class Atom_Manipulation(object):
             retain atoms within 'delta' fraction outside of slice plane)
         
         """
-        self._save()
-        
-        abc = transform_to_crystal(self._atom_df[['x','y','z']].values,
-                                 self._meta.a,self._meta.b,self._meta.c,
-                                 self._meta.origin)
-
-        if incl_max:
-            mask = ((abc[:,0]>=amin-delta) & (abc[:,0]<=amax+delta) & 
-                    (abc[:,1]>=bmin-delta) & (abc[:,1]<=bmax+delta) & 
-                    (abc[:,2]>=cmin-delta) & (abc[:,2]<=cmax+delta)) 
-        else:
-            mask = ((abc[:,0]>=amin-delta) & (abc[:,0]<amax+delta) & 
-                    (abc[:,1]>=bmin-delta) & (abc[:,1]<bmax+delta) & 
-                    (abc[:,2]>=cmin-delta) & (abc[:,2]<cmax+delta))  
+        fmin, fmax = [amin, bmin, cmin], [amax, bmax, cmax]
+        abc = Cell.from_meta(self._meta).to_fractional(self._atom_df[['x','y','z']].values)
+        mask = _slice_mask(abc, fmin, fmax, incl_max, delta)
 
+        self._save(mask=mask)
         self._atom_df = self._atom_df[mask] 
         
         if update_uc:
-            origin = np.asarray(self._meta.origin)
-            avec = np.asarray(self._meta.a)
-            bvec = np.asarray(self._meta.b)
-            cvec = np.asarray(self._meta.c)
-            
-            self._meta.origin = tuple(origin+amin*avec+bmin*bvec+cmin*cvec)
-            self._meta.a = avec * (amax-amin)
-            self._meta.b = bvec * (bmax-bmin)
-            self._meta.c = cvec * (cmax-cmin)            
+            _slice_meta(self._meta, fmin, fmax)
         
     def slice_absolute(self, amin=0, amax=None, bmin=0, bmax=None, cmin=0, cmax=None,
                        incl_max=False, update_uc=True, delta=0.01):
@@ -355,44 +553,15 @@ class Atom_Manipulation(object):
             retain atoms within 'delta' fraction outside of slice plane)
             
         """
-        self._save()
-        
-        abc = transform_to_crystal(self._atom_df[['x','y','z']].values,
-                                 self._meta.a,self._meta.b,self._meta.c,
-                                 self._meta.origin)
-        
-        anorm = np.linalg.norm(self._meta.a)
-        bnorm = np.linalg.norm(self._meta.b)
-        cnorm = np.linalg.norm(self._meta.c)
-        
-        amax = anorm if amax is None else amax
-        bmax = anorm if bmax is None else bmax
-        cmax = anorm if cmax is None else cmax                            
-
-        if incl_max:       
-            mask = ((abc[:,0]>=(amin/anorm)-delta) & (abc[:,0]<=(amax/anorm)+delta) & 
-                    (abc[:,1]>=(bmin/bnorm)-delta) & (abc[:,1]<=(bmax/bnorm)+delta) & 
-                    (abc[:,2]>=(cmin/cnorm)-delta) & (abc[:,2]<=(cmax/cnorm)+delta)) 
-        else:
-            mask = ((abc[:,0]>=(amin/anorm)-delta) & (abc[:,0]<(amax/anorm)+delta) & 
-                    (abc[:,1]>=(bmin/bnorm)-delta) & (abc[:,1]<(bmax/bnorm)+delta) & 
-                    (abc[:,2]>=(cmin/cnorm)-delta) & (abc[:,2]<(cmax/cnorm)+delta)) 
+        fmin, fmax = _absolute_to_fraction(self._meta, amin, amax, bmin, bmax, cmin, cmax)
+        abc = Cell.from_meta(self._meta).to_fractional(self._atom_df[['x','y','z']].values)
+        mask = _slice_mask(abc, fmin, fmax, incl_max, delta)
 
-        self._atom_df = self._atom_df[mask]                                          
+        self._save(mask=mask)
+        self._atom_df = self._atom_df[mask]
                                     
         if update_uc:
-            origin = np.asarray(self._meta.origin)
-            avec = np.asarray(self._meta.a)
-            bvec = np.asarray(self._meta.b)
-            cvec = np.asarray(self._meta.c)
-            
-            self._meta.origin = tuple(origin+
-                                      amin*avec/anorm + 
-                                      bmin*bvec/bnorm + 
-                                      cmin*cvec/cnorm)
-            self._meta.a = avec * (amax-amin)/anorm
-            self._meta.b = bvec * (bmax-bmin)/bnorm
-            self._meta.c = cvec * (cmax-cmin)/cnorm            
+            _slice_meta(self._meta, fmin, fmax)
 
     def translate(self, vector, update_uc=True):
         """translate atoms by vector
@@ -404,10 +573,10 @@ class Atom_Manipulation(object):
         
         """
         x,y,z = vector
-        self._save()
-        self._atom_df.x += x
-        self._atom_df.y += y
-        self._atom_df.z += z
+        self._save(['x','y','z'])
+        self._atom_df['x'] = self._atom_df.x + x
+        self._atom_df['y'] = self._atom_df.y + y
+        self._atom_df['z'] = self._atom_df.z + z
         
         if update_uc:
             self._meta.origin = np.array(self._meta.origin) + np.asarray(vector)
@@ -428,7 +597,7 @@ class Atom_Manipulation(object):
         """
         coords = self._atom_df[['x','y','z']].values
         new_coords = rotate_vectors(coords,vector,angle)
-        self._save()
+        self._save(['x','y','z'])
         self._atom_df[['x','y','z']] = new_coords
         
         if update_uc:
@@ -436,55 +605,105 @@ class Atom_Manipulation(object):
             self._meta.b = tuple(rotate_vectors(self._meta.b,vector,angle)[0])
             self._meta.c = tuple(rotate_vectors(self._meta.c,vector,angle)[0])
         
-    def _pnts_in_pointcloud(self, points, new_pts):
+    def wrap(self, image_cols=None):
+        """ wrap atoms back into the unit cell (a,b,c,origin) 
+        
+        image_cols : list of str or None
+            columns of integer image flags along a, b, c (e.g. ['ix','iy','iz']),
+            which will be updated (or created) by the number of cells each atom 
+            is moved, so that the atoms can be unwrapped
+        
+        """
+        image_cols = [] if image_cols is None else list(image_cols)
+        cell = Cell.from_meta(self._meta)
+        frac, images = _wrap_fractional(cell.to_fractional(self._atom_df[['x','y','z']].values))
+        
+        self._save(['x','y','z'] + image_cols)
+        self._atom_df[['x','y','z']] = cell.to_cartesian(frac, out=frac)
+        for dim, col in enumerate(image_cols):
+            if col in self._atom_df.columns:
+                self._atom_df[col] = self._atom_df[col].values + images[:,dim]
+            else:
+                self._atom_df[col] = images[:,dim]
+
+    def unwrap(self, image_cols=('ix','iy','iz')):
+        """ unwrap atoms from the unit cell (a,b,c), according to their image flags, 
+        e.g. as output by LAMMPS (dump ... ix iy iz), the flags are then set to zero
+        
+        image_cols : list of str
+            columns of integer image flags along a, b, c 
+        
+        """
+        image_cols = list(image_cols)
+        cell = Cell.from_meta(self._meta)
+        images = self._atom_df[image_cols].values
+        shifts = cell.to_cartesian(images.astype(float), relative=True)
+        
+        self._save(['x','y','z'] + image_cols)
+        self._atom_df[['x','y','z']] = self._atom_df[['x','y','z']].values + shifts
+        self._atom_df[image_cols] = np.zeros_like(images)
+
+    def _pnts_in_pointcloud(self, points, new_pts, tol=1e-8):
         """2D or 3D
         
+        each facet of the convex hull defines a half-space, n.x + d <= 0, 
+        which are tested against all new points in a single matrix product
+        
+        points : np.array((M,D))
+            points defining the convex hull
+        new_pts : np.array((N,D))
+            points to test
+        tol : float
+            points within tol (distance) outside of the hull are considered inside
+        
         returns np.array(dtype=bool)
         """
         hull = ConvexHull(points)
-        vol = hull.volume
-        
-        inside = []
-        for pt in new_pts:
-            new_hull = ConvexHull(np.append(points, [pt],axis=0))
-            inside.append(vol == new_hull.volume)
-        return np.array(inside)
+        normals, offsets = hull.equations[:,:-1], hull.equations[:,-1]
+        # normals are of unit length, so distances are outward from each facet
+        dists = np.asarray(new_pts, dtype=float).dot(normals.T) + offsets
+        return (dists <= tol).all(axis=1)
     
-    def filter_inside_pts(self, points):
+    def filter_inside_pts(self, points, tol=1e-8):
         """return only atoms inside the bounding shape of a set of points 
 
         points : np.array((N,3))        
+        tol : float
+            retain atoms within tol (distance) outside of the shape
         """ 
-        self._save()
-        inside = self._pnts_in_pointcloud(points, self._atom_df[['x','y','z']].values)
-        self._save()
+        inside = self._pnts_in_pointcloud(points, self._atom_df[['x','y','z']].values, tol)
+        self._save(mask=inside)
         self._atom_df = self._atom_df[inside]
 
-    def filter_inside_box(self, vectors, origin=np.zeros(3)):
+    def filter_inside_box(self, vectors, origin=np.zeros(3), tol=1e-8):
         """return only atoms inside box
         
         vectors : np.array((3,3))
             a, b, c vectors
         origin : np.array((1,3))
+        tol : float
+            retain atoms within tol (distance) outside of the box faces
         
         """
-        a,b,c = vectors + origin
-        points = [origin, a, b, a+b, c, a+c, b+c, a+b+c]
-        self.filter_inside_pts(points)
+        inside = _box_mask(self._atom_df[['x','y','z']].values, vectors, origin, tol)
+        self._save(mask=inside)
+        self._atom_df = self._atom_df[inside]
 
-    def filter_inside_hexagon(self, vectors, origin=np.zeros(3)):
+    def filter_inside_hexagon(self, vectors, origin=np.zeros(3), tol=1e-8):
         """return only atoms inside hexagonal prism
         
         vectors : np.array((2,3))
             a, c vectors
         origin : np.array((1,3))
+        tol : float
+            retain atoms within tol (distance) outside of the prism faces
         
         """
         a, c = vectors
-        points = [self._rotate(a, c, angle) for angle in [0,60,120,180,240,300]]
-        points += [p + c for p in points]
+        points = [rotate_vectors(a, c, angle)[0] for angle in [0,60,120,180,240,300]]
+        points += [p + np.asarray(c) for p in points]
         points = np.array(points) + origin
-        self.filter_inside_pts(points)
+        self.filter_inside_pts(points, tol)
 
     def group_atoms_as_mols(self, atom_ids, name, remove_atoms=True, mean_xyz=True,
                             color='red',transparency=1.,radius=1.):
@@ -499,24 +718,403 @@ class Atom_Manipulation(object):
             use the mean coordinate of atoms for molecule, otherwise use coordinate of first atom
             
         """
-        df = self._atom_df.copy()
+        df = self._atom_df
         # test no atoms in multiple molecules
-        all_atoms = np.asarray(atom_ids).flatten()  
+        natoms = np.array([len(atoms) for atoms in atom_ids], dtype=int)
+        if natoms.shape[0] == 0:
+            return
+        all_atoms = np.concatenate([np.asarray(atoms) for atoms in atom_ids])
         assert len(set(all_atoms))==len(all_atoms), 'atoms in multiple molecules'
 
-        mol_data = []
-        for atoms in atom_ids:
-            if mean_xyz:
-                x,y,z = df.loc[atoms,['x','y','z']].mean().values
-            else:
-                x,y,z = df.loc[atoms[0],['x','y','z']].values
-            mol_data.append([name,x,y,z,radius,color,transparency])
+        mol_xyz = df.loc[all_atoms,['x','y','z']].values
+        if mean_xyz:
+            mol_index = np.repeat(np.arange(natoms.shape[0]), natoms)
+            mol_xyz = np.array([np.bincount(mol_index, weights=mol_xyz[:,dim]) 
+                                for dim in range(3)]).T / natoms[:,np.newaxis]
+        else:
+            mol_xyz = mol_xyz[np.cumsum(natoms) - natoms]
             
-            if remove_atoms:
-                df.drop(atoms, inplace=True)
+        if remove_atoms:
+            df = df.drop(all_atoms)
 
-        if mol_data:
-            moldf = pd.DataFrame(mol_data,columns=['type','x','y','z','radius','color','transparency'])
-            df = pd.concat([df,moldf])
+        moldf = pd.DataFrame({'type':name, 'x':mol_xyz[:,0], 'y':mol_xyz[:,1],
+                              'z':mol_xyz[:,2], 'radius':radius, 
+                              'color':[color]*mol_xyz.shape[0],
+                              'transparency':transparency},
+                             columns=['type','x','y','z','radius','color','transparency'])
+        df = pd.concat([df,moldf])
         self._save()
-        self._atom_df = df
\ No newline at end of file
+        self._atom_df = df
+
+class _Pipeline_State(object):
+    """ the (lazy) state of a configuration, part way through an Atom_Pipeline 
+    
+    rather than copying the atom data at each step, the state holds; 
+    the composed affine transform of the coordinates, the indexes of the 
+    selected atoms and any new column values (for the selected atoms)
+    """
+    def __init__(self, atom_df, meta):
+        self.atom_df = atom_df
+        self.meta = meta.copy()
+        self.index = np.arange(atom_df.shape[0])
+        self.affine = np.identity(4)
+        self.columns = {}
+        self.dropped = set()
+        self._xyz = atom_df[['x','y','z']].values
+        self._coords = None
+        
+    def coords(self):
+        """ the transformed coordinates of the selected atoms """
+        if self._coords is None:
+            self._coords = (self._xyz[self.index].dot(self.affine[:3,:3].T) 
+                            + self.affine[:3,3])
+        return self._coords
+
+    def column(self, name):
+        """ the current values of a column for the selected atoms """
+        if name in ['x','y','z']:
+            return self.coords()[:,['x','y','z'].index(name)]
+        if name in self.columns:
+            return self.columns[name]
+        values = self.atom_df[name].values
+        if isinstance(values, pd.Categorical):
+            return values[self.index]
+        return np.asarray(values[self.index])
+        
+    def select(self, mask):
+        self.index = self.index[mask]
+        self.columns = dict([(name, values[mask]) for name, values in self.columns.items()])
+        if self._coords is not None:
+            self._coords = self._coords[mask]
+        
+    def transform(self, affine):
+        self.affine = affine.dot(self.affine)
+        self._coords = None
+    
+    def filter_variables(self, values, vtype='type'):
+        self.select(pd.Series(self.column(vtype)).isin(_as_list(values)).values)
+
+    def slice_fraction(self, amin=0, amax=1, bmin=0, bmax=1, cmin=0, cmax=1,
+                       incl_max=False, update_uc=True,delta=0.01):
+        fmin, fmax = [amin, bmin, cmin], [amax, bmax, cmax]
+        abc = Cell.from_meta(self.meta).to_fractional(self.coords())
+        self.select(_slice_mask(abc, fmin, fmax, incl_max, delta))
+        if update_uc:
+            _slice_meta(self.meta, fmin, fmax)
+
+    def slice_absolute(self, amin=0, amax=None, bmin=0, bmax=None, cmin=0, cmax=None,
+                       incl_max=False, update_uc=True, delta=0.01):
+        fmin, fmax = _absolute_to_fraction(self.meta, amin, amax, bmin, bmax, cmin, cmax)
+        self.slice_fraction(fmin[0], fmax[0], fmin[1], fmax[1], fmin[2], fmax[2],
+                            incl_max, update_uc, delta)
+        
+    def filter_inside_box(self, vectors, origin=np.zeros(3), tol=1e-8):
+        self.select(_box_mask(self.coords(), vectors, origin, tol))
+
+    def translate(self, vector, update_uc=True):
+        affine = np.identity(4)
+        affine[:3,3] = vector
+        self.transform(affine)
+        if update_uc:
+            self.meta.origin = np.array(self.meta.origin) + np.asarray(vector)
+
+    def rotate(self, angle, vector=[1,0,0], update_uc=True):
+        # the rows are the rotated x, y, z unit vectors
+        rotation = rotate_vectors(np.identity(3), vector, angle)
+        affine = np.identity(4)
+        affine[:3,:3] = rotation.T
+        self.transform(affine)
+        if update_uc:
+            self.meta.a = tuple(np.asarray(self.meta.a, dtype=float).dot(rotation))
+            self.meta.b = tuple(np.asarray(self.meta.b, dtype=float).dot(rotation))
+            self.meta.c = tuple(np.asarray(self.meta.c, dtype=float).dot(rotation))
+
+    def change_variables(self, map_dict, vtype='type'):
+        self.columns[vtype] = _replace_values(self.column(vtype), map_dict)
+        _update_type_table(self.meta, vtype, self.columns[vtype])
+        
+    def apply_map(self, vmap, column, default=False, type_col='type'):
+        if isinstance(vmap, string_types):
+            vmap = atom_data()[vmap].dropna().to_dict()
+        current = None
+        if column == 'color':
+            if all([self._has(col) for col in rgba_cols]):
+                current = np.column_stack([self.column(col) for col in rgba_cols])
+            elif self._has(column):
+                current = to_rgba_array(self.column(column))
+            self._set_rgba(_map_colors(self.column(type_col), vmap, current, default))
+            return
+        if self._has(column):
+            current = self.column(column)
+        self.dropped.discard(column)
+        self.columns[column] = _map_values(self.column(type_col), vmap, current, default)
+
+    def _has(self, name):
+        return name in self.columns or (name in self.atom_df.columns and 
+                                        not name in self.dropped)
+
+    def _drop(self, names):
+        for name in names:
+            self.columns.pop(name, None)
+            self.dropped.add(name)
+            
+    def _set_rgba(self, rgba):
+        self._drop(['color'])
+        for i, col in enumerate(rgba_cols):
+            self.dropped.discard(col)
+            self.columns[col] = rgba[:,i]
+
+    def color_by_index(self, cmap='jet', minv=None, maxv=None):
+        self._set_rgba(_variable_colors(self.atom_df.index.values[self.index],
+                                        cmap, minv, maxv))
+        
+    def color_by_variable(self, colname, cmap='jet', minv=None, maxv=None):
+        self._set_rgba(_variable_colors(self.column(colname), cmap, minv, maxv))
+
+    def color_by_categories(self, colname, cmap='jet', sort=True):
+        self._set_rgba(_category_colors(self.column(colname), cmap, sort))
+    
+    def result(self):
+        """ return the manipulated atom data (with a single copy) and meta data """
+        xyz = self.coords()
+        atom_df = self.atom_df.iloc[self.index]
+        atom_df = atom_df.assign(x=xyz[:,0], y=xyz[:,1], z=xyz[:,2])
+        atom_df = atom_df.drop([name for name in self.dropped if name in atom_df.columns], 
+                               axis=1)
+        for name, values in self.columns.items():
+            atom_df[name] = values
+        return atom_df, self.meta
+
+def _run_pipeline(operations, atom_df, meta_series=None):
+    """ apply a list of (method name, kwargs) operations to a configuration """
+    atom_df, meta_series = _as_atom_df(atom_df, meta_series)
+    assert set(atom_df.columns).issuperset(['x','y','z','type'])
+    if meta_series is None:
+        meta_series = _default_meta(atom_df)
+    else:
+        assert set(meta_series.index).issuperset(['origin','a','b','c'])                
+
+    state = _Pipeline_State(atom_df, meta_series)
+    for name, kwargs in operations:
+        getattr(state, name)(**kwargs)
+    return state.result()
+
+_pipeline_worker_operations = []
+
+def _pipeline_worker_init(operations):
+    """ store the pipeline operations in a worker process """
+    _pipeline_worker_operations[:] = operations
+
+def _pipeline_worker(frame):
+    """ apply the pipeline to a single (atom_df, meta) frame in a worker process """
+    return _run_pipeline(_pipeline_worker_operations, *frame)
+
+class Atom_Pipeline(object):
+    """ a lazy pipeline of atom manipulations, which can be defined once 
+    and then applied to many configurations (e.g. the frames of a trajectory)
+    
+    the manipulation methods mirror those of Atom_Manipulation, but only record 
+    the operation (and return the pipeline, so that they can be chained). 
+    When applied, the operations are fused; rotations and translations are 
+    composed into a single affine transform, and filters into a single 
+    selection of the atoms, so that the atom data is only copied once 
+    
+    Examples
+    --------
+    >>> pipe = Atom_Pipeline().filter_variables('Na').slice_fraction(cmax=0.5)
+    >>> pipe = pipe.rotate(90,[0,0,1]).color_by_variable('z')
+    >>> atom_df, meta = pipe.apply(atom_df, meta)
+    >>> for atom_df, meta in pipe.iterate(data_input, processes=4):
+    ...     pass
+    
+    """
+    def __init__(self):
+        self._operations = []
+        
+    def _record(self, name, **kwargs):
+        self._operations.append((name, kwargs))
+        return self
+    
+    @property
+    def operations(self):
+        """ list of recorded (method name, kwargs) """
+        return list(self._operations)
+        
+    def filter_variables(self, values, vtype='type'):
+        """ see Atom_Manipulation.filter_variables """
+        return self._record('filter_variables', values=values, vtype=vtype)
+
+    def slice_fraction(self, amin=0, amax=1, bmin=0, bmax=1, cmin=0, cmax=1,
+                       incl_max=False, update_uc=True,delta=0.01):
+        """ see Atom_Manipulation.slice_fraction """
+        return self._record('slice_fraction', amin=amin, amax=amax, bmin=bmin, bmax=bmax,
+                            cmin=cmin, cmax=cmax, incl_max=incl_max, 
+                            update_uc=update_uc, delta=delta)
+
+    def slice_absolute(self, amin=0, amax=None, bmin=0, bmax=None, cmin=0, cmax=None,
+                       incl_max=False, update_uc=True, delta=0.01):
+        """ see Atom_Manipulation.slice_absolute """
+        return self._record('slice_absolute', amin=amin, amax=amax, bmin=bmin, bmax=bmax,
+                            cmin=cmin, cmax=cmax, incl_max=incl_max, 
+                            update_uc=update_uc, delta=delta)
+
+    def filter_inside_box(self, vectors, origin=np.zeros(3), tol=1e-8):
+        """ see Atom_Manipulation.filter_inside_box """
+        return self._record('filter_inside_box', vectors=vectors, origin=origin, tol=tol)
+
+    def translate(self, vector, update_uc=True):
+        """ see Atom_Manipulation.translate """
+        return self._record('translate', vector=vector, update_uc=update_uc)
+
+    def rotate(self, angle, vector=[1,0,0], update_uc=True):
+        """ see Atom_Manipulation.rotate """
+        return self._record('rotate', angle=angle, vector=vector, update_uc=update_uc)
+
+    def change_variables(self, map_dict, vtype='type'):
+        """ see Atom_Manipulation.change_variables """
+        return self._record('change_variables', map_dict=map_dict, vtype=vtype)
+
+    def apply_map(self, vmap, column, default=False, type_col='type'):
+        """ see Atom_Manipulation.apply_map """
+        return self._record('apply_map', vmap=vmap, column=column, 
+                            default=default, type_col=type_col)
+
+    def color_by_index(self, cmap='jet', minv=None, maxv=None):
+        """ see Atom_Manipulation.color_by_index """
+        return self._record('color_by_index', cmap=cmap, minv=minv, maxv=maxv)
+
+    def color_by_variable(self, colname, cmap='jet', minv=None, maxv=None):
+        """ see Atom_Manipulation.color_by_variable """
+        return self._record('color_by_variable', colname=colname, cmap=cmap, 
+                            minv=minv, maxv=maxv)
+
+    def color_by_categories(self, colname, cmap='jet', sort=True):
+        """ see Atom_Manipulation.color_by_categories """
+        return self._record('color_by_categories', colname=colname, cmap=cmap, sort=sort)
+        
+    def apply(self, atom_df, meta_series=None):
+        """ apply the pipeline to a configuration
+        
+        Properties
+        ----------
+        atom_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
+            containing columns; x, y, z, type
+        meta_series : pandas.Series
+            containing columns; origin, a, b, c to define unit cell
+            if none it will be taken from the Atoms cell, or 
+            constructed from the min/max x, y, z values
+        
+        Returns
+        -------
+        atom_df : pandas.DataFrame
+        meta : pandas.Series
+        
+        """
+        return _run_pipeline(self._operations, atom_df, meta_series)
+    
+    def iterate(self, data_input, configs=None, processes=1):
+        """ apply the pipeline to each configuration of the data input 
+        (a generator, so only the current frame(s) are held in memory)
+        
+        Properties
+        ----------
+        data_input : ipymd.data_input.base.DataInput
+            the (setup) data input
+        configs : list of int or None
+            the configurations to compute, if None then all configurations are computed
+        processes : int
+            number of processes over which to split the frames, 
+            if -1 then all processors are used
+        
+        Yields
+        ------
+        atom_df : pandas.DataFrame
+        meta : pandas.Series
+        
+        """
+        if configs is None:
+            configs = range(1, data_input.count_configs()+1)
+        configs = list(configs)
+        if processes == -1:
+            processes = cpu_count()
+        
+        if processes > 1:
+            pool = Pool(processes, initializer=_pipeline_worker_init, 
+                        initargs=(self._operations,))
+            try:
+                # read the frames in batches, so that only one per process is held in memory
+                for start in range(0, len(configs), processes):
+                    frames = [(data_input.get_atom_data(config), data_input.get_meta_data(config))
+                              for config in configs[start:start+processes]]
+                    for result in pool.map(_pipeline_worker, frames):
+                        yield result
+                    del frames
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for config in configs:
+                yield self.apply(data_input.get_atom_data(config), 
+                                 data_input.get_meta_data(config))
+
+def unwrap_trajectory(data_input, configs=None, id_col='id', image_cols=None):
+    """ unwrap the coordinates of each configuration of a trajectory
+    
+    if image_cols are given, the atoms are unwrapped by these image flags,
+    otherwise the crossings of the periodic boundaries (a,b,c) are tracked 
+    between consecutive configurations, i.e. assuming that atoms move less 
+    than half the cell length between configurations (the cell may change)
+    
+    Properties
+    ----------
+    data_input : ipymd.data_input.base.DataInput
+        the (setup) trajectory data
+    configs : list of int or None
+        the configurations to compute, if None then all configurations are computed
+    id_col : str or None
+        column by which to match atoms between configurations, 
+        if None the atoms are assumed to be in the same order
+    image_cols : list of str or None
+        columns of integer image flags along a, b, c (e.g. ['ix','iy','iz'])
+    
+    Yields
+    ------
+    config : int
+        the configuration
+    df : pandas.Dataframe
+        the atom data with unwrapped x, y, z
+    
+    """
+    if configs is None:
+        configs = range(1, data_input.count_configs()+1)
+    
+    prev_ids, prev_frac, prev_images = None, None, None
+    for config in configs:
+        df = data_input.get_atom_data(config)
+        cell = Cell.from_meta(data_input.get_meta_data(config))
+        
+        if image_cols is not None:
+            images = df[list(image_cols)].values
+            shifts = cell.to_cartesian(images.astype(float), relative=True)
+            df[['x','y','z']] = df[['x','y','z']].values + shifts
+            yield config, df
+            continue
+            
+        frac = cell.to_fractional(df[['x','y','z']].values)
+        ids = None if id_col is None else df[id_col].values
+        images = np.zeros(frac.shape, dtype=int)
+        if prev_frac is not None:
+            if ids is None:
+                prev_pos = np.arange(frac.shape[0])
+                prev_pos[prev_pos >= prev_frac.shape[0]] = -1
+            else:
+                prev_pos = pd.Index(prev_ids).get_indexer(ids)
+            found = prev_pos >= 0
+            # a jump of more than half a cell is a crossing of the boundary
+            jumps = np.round(frac[found] - prev_frac[prev_pos[found]]).astype(int)
+            images[found] = prev_images[prev_pos[found]] - jumps
+        prev_ids, prev_frac, prev_images = ids, frac.copy(), images
+        
+        frac += images
+        df[['x','y','z']] = cell.to_cartesian(frac, out=frac)
+        yield config, df
@@ -5,7 +5,9 @@ Created on Sun May  1 22:49:20 2016
 @author: cjs14
 """
 import itertools
-from ..shared import colors
+import numpy as np
+from ..shared import colors, get_float_dtype, encode_types
+from ..shared.atoms import Atoms
 
 class DataInput(object):
     """data input base class
@@ -21,33 +23,69 @@ class DataInput(object):
         
             - atom is a series of tables, one for each timestep, containing variables (columns) for each atom (rows)
             - meta is a table containing variables (columns) for each configuration (rows)
+            
+        atom types are categorical, with codes indexing a type table shared by all configurations
+        (built from all configurations, so the codes do not depend on the order they are read)
         """
         self._data_set = False
+        self._type_table = []
+        self._type_table_built = False
 
     def setup_data(self):
         """a method to setup the data and variables """
         self._data_set = True
 
-    def get_atom_data(self, config=1):
-        """ return pandas.DataFrame of atomic data """
+    def get_atom_data(self, config=1, precision='double'):
+        """ return pandas.DataFrame of atomic data 
+        
+        Properties
+        ----------
+        config : int
+            the configuration
+        precision : str
+            'single' or 'double', the precision of the float columns 
+            (single precision halves the memory of the coordinates)
+        
+        """
         if not self._data_set:
             raise RuntimeError('must call setup_data method first')
         if config>self.count_configs():
             raise ValueError('only {} configurations available'.format(
                                                             self.count_configs()))
-        return self._get_atom_data(config)
+        dtype = get_float_dtype(precision)
+        self._build_type_table()
+        atom_df = self._get_atom_data(config)
+        self._encode_types(atom_df)
+        if dtype != np.float64:
+            float_cols = atom_df.select_dtypes(include=[np.float64]).columns
+            atom_df[float_cols] = atom_df[float_cols].astype(dtype)
+        return atom_df
 
     def _get_atom_data(self, config):
         raise NotImplemented        
 
+    def get_atoms(self, config=1, precision='double'):
+        """ return ipymd.shared.atoms.Atoms (array-backed) of the atomic data 
+        and unit cell, see get_atom_data """
+        atom_df = self.get_atom_data(config, precision)
+        return Atoms.from_dataframe(atom_df, self.get_meta_data(config))
+
     def get_meta_data(self, config=1):
-        """ return pandas.Series of meta data for the atomic configuration """
+        """ return pandas.Series of meta data for the atomic configuration 
+        
+        this includes 'types'; the type table (atom type of each type code),
+        which is the same for all configurations
+        
+        """
         if not self._data_set:
             raise RuntimeError('must call setup_data method first')
         if config>self.count_configs():
             raise ValueError('only {} configurations available'.format(
                                                             self.count_configs()))
-        return self._get_meta_data(config)
+        self._build_type_table()
+        meta = self._get_meta_data(config)
+        meta['types'] = tuple(self._type_table)
+        return meta
             
     def _get_meta_data(self, config):
         raise NotImplemented
@@ -79,6 +117,27 @@ class DataInput(object):
     def _count_configs(self):
         raise NotImplemented
 
+    def _get_types(self, config):
+        """ return the atom types of a configuration, 
+        subclasses may override this with a faster method """
+        return self._get_atom_data(config)['type']
+
+    def _build_type_table(self):
+        """ build the type table (once) from the atom types of all configurations, 
+        in order of appearance, so it does not depend on the order configurations are read """
+        if self._type_table_built:
+            return
+        table = []
+        for config in range(1, self.count_configs()+1):
+            table = list(encode_types(self._get_types(config), table).categories)
+        self._type_table = table
+        self._type_table_built = True
+
+    def _encode_types(self, atom_df):
+        """ encode atom types (in-place) as categorical, with codes from the type table """
+        atom_df['type'] = encode_types(atom_df['type'], self._type_table)
+        self._type_table = list(atom_df['type'].cat.categories)
+
     def _add_radii(self, atom_df):
         atom_df['radius'] = 1.
         
@@ -88,10 +147,13 @@ class DataInput(object):
 
         atom_df['transparency'] = 1.
         
+        # color by type code, so types have the same color in each configuration
+        self._encode_types(atom_df)
         col_keys = colors.col_dict.keys()
         col_cycle = itertools.cycle(col_keys)
-        for typ in atom_df['type'].unique():            
-            atom_df.loc[atom_df['type']==typ,'color'] = colors.col_dict[col_cycle.next()][0]
+        type_colors = colors.to_rgba_array([colors.col_dict[next(col_cycle)][0] 
+                                            for typ in self._type_table])
+        colors.set_rgba(atom_df, type_colors[atom_df['type'].cat.codes.values])
         
     def _skiplines(self, f, num=1):
         """ skip line(s) in an open file """
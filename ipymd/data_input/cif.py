@@ -13,6 +13,7 @@ import numpy as np
 import pandas as pd
     
 from .base import DataInput
+from ..shared.transformations import Cell
 
 class CIF(DataInput):
     """ Build a crystal from  a Crystallographic Information File (.cif)
@@ -367,31 +368,9 @@ class CIF(DataInput):
         b = np.array([bx,by,0])
         c = np.array([cx,cy,cz])
     
-        for i in range(len(atoms)):
-        
-            # Get label and fractional coordinates.
-            label,xf,yf,zf,oc = atoms[i]
-        
-            xa = xf * ax  # contribution of a-vector to the x-coordinate of this atom
-            #ya = 0       # a-vector has no y-component, so does not affect y of atom
-            #za = 0       # a-vector has no z-component, so does not affect z of atom
-            
-            xb = yf * bx  # contribution of b-vector to the x-coordinate of this atom
-            yb = yf * by  # contribution of b-vector to the y-coordinate of this atom
-            #zb = 0       # b-vector has no z-component, so does not affect z of atom
-        
-            xc = zf * cx  # contribution of c-vector to the x-coordinate of this atom
-            yc = zf * cy  # contribution of c-vector to the y-coordinate of this atom
-            zc = zf * cz  # contribution of c-vector to the z-coordinate of this atom
-        
-            # Add all contributions.
-            xn = xa + xb + xc
-            yn = yb + yc
-            zn = zc
-        
-            atoms[i] = (label, xn, yn, zn,oc)
-        
         df = pd.DataFrame(atoms, columns=['type', 'x', 'y', 'z','occupancy'])
+        if df.shape[0] > 0:
+            df[['x','y','z']] = Cell(a, b, c).to_cartesian(df[['x','y','z']].values)
     
         return df,(0.,0.,0.),tuple(a),tuple(b),tuple(c)
         
@@ -9,10 +9,13 @@ ASE https://wiki.fysik.dtu.dk/ase/
 Copyright (C) 2010, Jesper Friis
 
 """
+import itertools
+
 import numpy as np
 import pandas as pd
 
 from ..shared import get_data_path
+from ..shared.transformations import Cell
 from . import spacegroup
 from .spacegroup.spacegroup import Spacegroup
 from .spacegroup.cell import cellpar_to_cell
@@ -79,25 +82,21 @@ class Crystal(DataInput):
         
         nx, ny, nz = repetitions
         
-        atoms = []
-        aid = 1
-        
         c1,c2,c3,c4,c5,c6 = cellpar 
         a,b,c = cellpar_to_cell([c1,c2,c3,c4,c5,c6])
         
         self._meta = pd.Series([(0.,0.,0.), tuple(a*nx), tuple(b*ny), tuple(c*nz)],
                                 index=['origin','a','b','c'])
         
-        for rx in range(nx):
-            for ry in range(ny):
-                for rz in range(nz):
-                    for s, ki in zip(sites, kind):
-                        atype = atom_type[ki]
-                        x,y,z = s[0]*a +s[1]*b + s[2]*c + a*rx + b*ry + c*rz
-                        atoms.append([aid,atype,x,y,z])
-                        aid+=1
+        # fractional coordinates of the sites in each repeat (ordered rx, ry, rz, site)
+        repeats = np.array(list(itertools.product(range(nx), range(ny), range(nz))), dtype=float)
+        frac = (repeats[:,np.newaxis,:] + np.asarray(sites)[np.newaxis,:,:]).reshape(-1,3)
+        xyz = Cell(a, b, c).to_cartesian(frac)
+        types = np.tile([atom_type[ki] for ki in kind], repeats.shape[0])
                 
-        self._atoms = pd.DataFrame(atoms,columns=['id','type','x','y','z'])
+        self._atoms = pd.DataFrame({'id':np.arange(1, xyz.shape[0]+1), 'type':types,
+                                    'x':xyz[:,0], 'y':xyz[:,1], 'z':xyz[:,2]},
+                                   columns=['id','type','x','y','z'])
         
         if mass_map:
             self._atoms['mass'] = np.nan
@@ -18,6 +18,7 @@ import glob
 import re
 
 from .base import DataInput
+from ..shared.transformations import Cell
         
 class LAMMPS_Input(DataInput):
     """ file format according to http://lammps.sandia.gov/doc/read_data.html """
@@ -372,11 +373,49 @@ class LAMMPS_Output(DataInput):
         a,b,c = np.array([[xhi-xlo,0.,0.],[xy,yhi-ylo,0.],[xz,yz,zhi-zlo]])
         origin = np.array([xlo,ylo,zlo])
         
-        new_coords = (np.array([atoms_df['x'].values]).transpose() * a + 
-               np.array([atoms_df['y'].values]).transpose() * b + 
-               np.array([atoms_df['z'].values]).transpose() * c + 
-               origin) 
-        atoms_df[['x','y','z']] = new_coords
+        cell = Cell(a, b, c, origin)
+        atoms_df[['x','y','z']] = cell.to_cartesian(atoms_df[['x','y','z']].values)
+
+    def _get_types(self, step):
+        """ return the atom types, without reading the full atom data """
+        if self._single_atom_file:
+            current_step = 1
+            with open(self._atom_path, 'r') as f:
+                for line in f:
+                    if 'ITEM: TIMESTEP' in line: 
+                        
+                        if step==current_step:
+                            return self._extract_atom_types(f)
+                        else:
+                            current_step+=1
+                            # find the number of atoms and skip that many lines
+                            line = self._skiplines(f, 3)
+                            self._skiplines(f, int(line.split()[0])+5) 
+            
+            if current_step>1:
+                raise IOError("timestep {0} exceeds maximum ({1})".format(
+                                                        step, current_step-1))
+            else:
+                raise IOError("atom file of wrong format")
+        else:
+            if len(self._atom_path) < step:
+                raise IOError("timestep {0} exceeds maximum ({1})".format
+                                                (step, len(self._atom_path)-1))
+            with open(self._atom_path[step-1], 'r') as f:
+                for line in f:
+                    if 'ITEM: TIMESTEP' in line: 
+                        return self._extract_atom_types(f)
+            raise IOError("atom file of wrong format")
+
+    def _extract_atom_types(self, f):
+        """ """
+        line = self._skiplines(f, 3) # to number of atoms
+        num_atoms = int(line.split()[0])
+        line = self._skiplines(f, 5) # to atom headers
+        col = line.split()[2:].index('type')
+        # as float, consistent with _extract_atom_data
+        return np.array([self._skiplines(f, 1).split()[col] for atom in range(num_atoms)], 
+                        dtype=float)
 
     def _get_atom_timestep(self, step):
         """ return simulation step, according to atom data """
@@ -267,13 +267,18 @@ class Spacegroup(object):
                [ 0,  0, -2]])
         """
         hkl = np.array(hkl, dtype=int, ndmin=2)
-        normalised = np.empty(hkl.shape, int)
+        if len(hkl) == 0:
+            return hkl.copy()
         R = self.get_rotations().transpose(0, 2, 1)
-        for i, g in enumerate(hkl):
-            gsym = np.dot(R, g)
-            j = np.lexsort(gsym.T)[0]
-            normalised[i,:] = gsym[j]
-        return normalised
+        # all equivalent reflections, gsym[i, j] = dot(R[j], hkl[i])
+        gsym = np.einsum('jkl,il->ijk', R, hkl)
+        # rank them in the same order as lexsort (last index primary), 
+        # by combining the shifted indices into a single integer
+        shifted = gsym - gsym.min()
+        base = np.int64(shifted.max() + 1)
+        rank = (shifted[..., 2]*base + shifted[..., 1])*base + shifted[..., 0]
+        j = rank.argmin(axis=1)
+        return gsym[np.arange(len(hkl)), j]
 
     def unique_reflections(self, hkl):
         """Returns a subset *hkl* containing only the symmetry-unique
@@ -400,7 +405,7 @@ class Spacegroup(object):
                [ 0.,  0.,  0.]])
         """
         scaled = np.array(scaled_positions, ndmin=2)
-        normalised = np.empty(scaled.shape, np.float)
+        normalised = np.empty(scaled.shape, float)
         rot, trans = self.get_op()
         for i, pos in enumerate(scaled):
             sympos = np.dot(rot, pos) + trans
@@ -457,7 +462,7 @@ class Spacegroup(object):
         scaled %= 1.0
         scaled %= 1.0
         tags = -np.ones((len(scaled), ), dtype=int)
-        mask = np.ones((len(scaled), ), dtype=np.bool)
+        mask = np.ones((len(scaled), ), dtype=bool)
         rot, trans = self.get_op()
         i = 0
         while mask.any():
@@ -555,18 +560,18 @@ def _read_datafile_entry(spg, no, symbol, setting, f):
     f.readline()
     spg._reciprocal_cell = np.array([list(map(int, f.readline().split())) 
                                         for i in range(3)],
-                                       dtype=np.int)
+                                       dtype=int)
     # subtranslations
     spg._nsubtrans = int(f.readline().split()[0])
     spg._subtrans = np.array([list(map(float, f.readline().split())) 
                               for i in range(spg._nsubtrans)],
-                             dtype=np.float)
+                             dtype=float)
     # symmetry operations
     nsym = int(f.readline().split()[0])
     symop = np.array([list(map(float, f.readline().split())) for i in range(nsym)],
-                     dtype=np.float)
+                     dtype=float)
     spg._nsymop = nsym
-    spg._rotations = np.array(symop[:,:9].reshape((nsym,3,3)), dtype=np.int)
+    spg._rotations = np.array(symop[:,:9].reshape((nsym,3,3)), dtype=int)
     spg._translations = symop[:,9:]
 
 
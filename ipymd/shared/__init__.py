@@ -2,6 +2,7 @@
 
 import os
 import inspect
+import numpy as np
 import pandas as pd
 from six import string_types
 
@@ -26,6 +27,85 @@ def get_data_path(data, check_exists=False, module=test_data):
     
     return dirpath
     
+def get_float_dtype(precision='double'):
+    """return the numpy float type for a precision
+
+    precision : str
+        'single' (float32) or 'double' (float64)
+    """
+    if precision == 'single':
+        return np.float32
+    elif precision == 'double':
+        return np.float64
+    raise ValueError("precision must be 'single' or 'double'")
+    
+def encode_types(types, table=()):
+    """return atom types as a pandas.Categorical, 
+    where the codes index a type table (categories)
+
+    types : array_like
+        the atom type of each atom
+    table : list
+        the (shared) type table, new types are appended in order of appearance
+    """
+    codes, uniques = type_codes(types)
+    table = list(table)
+    known = set(table)
+    table += [typ for typ in uniques if not typ in known]
+    if not len(uniques):
+        return pd.Categorical.from_codes(codes, pd.Index(table, dtype=object))
+    table_index = pd.Index(table, dtype=object)
+    # map the codes of the unique types to the type table (-1 for missing types)
+    new_codes = np.append(table_index.get_indexer(pd.Index(uniques, dtype=object)), -1)
+    return pd.Categorical.from_codes(new_codes[codes], table_index)
+
+def type_codes(types):
+    """return (codes, types) for atom types, where types[codes] gives the type 
+    of each atom (codes are -1 for missing types)
+
+    types : array_like
+        the atom type of each atom, if categorical the categories are used
+    """
+    if isinstance(types, pd.Series):
+        types = types.values
+    if isinstance(types, pd.Categorical):
+        return np.asarray(types.codes), types.categories
+    types = np.asarray(types)
+    if types.dtype.kind in 'SU':
+        types = types.astype(object)
+    return pd.factorize(types)
+
+def type_lookup(types, vmap, default=np.nan):
+    """return a np.array of per atom values, by a lookup of each unique 
+    atom type in vmap
+
+    types : array_like
+        the atom type of each atom
+    vmap : dict or pandas.Series
+        a value for each atom type
+    default : various
+        the value for types not in vmap
+    """
+    codes, uniques = type_codes(types)
+    values = [vmap[typ] if typ in vmap else default for typ in uniques]
+    # the last value is for missing types (code -1)
+    lookup = np.asarray(pd.Series(values + [default]))
+    return lookup[codes]
+
+def type_groups(types):
+    """yield (type, indices) for each atom type present in types
+
+    types : array_like
+        the atom type of each atom
+    """
+    codes, uniques = type_codes(types)
+    order = np.argsort(codes, kind='stable')
+    ends = np.searchsorted(codes[order], np.arange(len(uniques)), side='right')
+    starts = np.append(np.searchsorted(codes[order], 0), ends[:-1])
+    for typ, start, end in zip(uniques, starts, ends):
+        if end > start:
+            yield typ, order[start:end]
+    
 def atom_data():
     """return a dataframe of atomic data
     """
@@ -37,9 +117,9 @@ def atom_data():
     green = df.Green*255
     blue = df.Blue*255
     
-    df['color'] = zip(red.values.astype(int),
+    df['color'] = list(zip(red.values.astype(int),
                       green.values.astype(int),
-                      blue.values.astype(int))
+                      blue.values.astype(int)))
                       
     df.drop(['Red','Green','Blue'],axis=1,inplace=True)
     
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+an array-backed (struct of arrays) container of atoms,
+as a lightweight alternative to an atoms pandas.DataFrame
+
+"""
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from . import encode_types
+from .transformations import Cell
+
+class Atoms(object):
+    """ a lightweight container of atoms, holding a numpy array per variable
+
+    selecting atoms by a slice returns views of the arrays,
+    and conversion to a pandas.DataFrame does not copy the per-atom arrays,
+    whereas conversion from a DataFrame copies them (so that they are writable, 
+    and changing them does not alter the DataFrame)
+
+    Properties
+    ----------
+    positions : np.array((N,3),dtype=float)
+        C-contiguous x, y, z coordinates (e.g. for cKDTree or OpenGL buffers)
+    type_codes : np.array((N,),dtype=int)
+        the code of each atom type, indexing type_table (-1 for missing types)
+    type_table : tuple
+        the atom type of each type code
+    arrays : OrderedDict
+        other per-atom variables, name -> np.array((N,))
+    cell : ipymd.shared.transformations.Cell or None
+        the unit cell
+    index : pandas.Index or None
+        the atom labels (as a DataFrame index)
+
+    Examples
+    --------
+    >>> atoms = Atoms([[0,0,0],[1,1,1]], ['Na','Cl'], arrays={'q':[1.,-1.]})
+    >>> len(atoms), atoms.type_table
+    (2, ('Na', 'Cl'))
+    >>> atoms[atoms.type_codes == 1].to_dataframe()[['type','x','q']].values.tolist()
+    [['Cl', 1.0, -1.0]]
+
+    """
+    __slots__ = ('positions', 'type_codes', 'type_table', 'arrays', 'cell', 'index')
+
+    def __init__(self, positions, types=None, arrays=None, cell=None,
+                 type_table=(), index=None):
+        positions = np.ascontiguousarray(positions, dtype=float).reshape(-1, 3)
+        num_atoms = positions.shape[0]
+        if types is None:
+            types = np.full(num_atoms, np.nan, dtype=object)
+        types = encode_types(types, type_table)
+        if len(types) != num_atoms:
+            raise ValueError('types must have the same length as positions')
+
+        self.positions = positions
+        self.type_codes = np.asarray(types.codes)
+        self.type_table = tuple(types.categories)
+        self.arrays = OrderedDict()
+        for name, values in (arrays or {}).items():
+            self.arrays[name] = self._as_array(values, num_atoms, name)
+        self.cell = cell
+        self.index = None if index is None else pd.Index(index)
+
+    @staticmethod
+    def _as_array(values, num_atoms, name):
+        if not isinstance(values, pd.api.extensions.ExtensionArray):
+            values = np.asarray(values)
+        if len(values) != num_atoms:
+            raise ValueError('{} must have the same length as positions'.format(name))
+        return values
+
+    @classmethod
+    def _from_arrays(cls, positions, type_codes, type_table, arrays, cell, index):
+        """ construct without validating or copying the arrays """
+        atoms = cls.__new__(cls)
+        atoms.positions = positions
+        atoms.type_codes = type_codes
+        atoms.type_table = type_table
+        atoms.arrays = arrays
+        atoms.cell = cell
+        atoms.index = index
+        return atoms
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    def __repr__(self):
+        return 'Atoms(num_atoms={0}, types={1}, arrays={2})'.format(
+                    len(self), self.type_table, list(self.arrays.keys()))
+
+    def __getitem__(self, index):
+        """ select atoms by a slice (views), boolean mask or integer indices """
+        if isinstance(index, pd.Series):
+            index = index.values
+        return self._from_arrays(self.positions[index], self.type_codes[index], self.type_table,
+                                 OrderedDict([(name, values[index])
+                                              for name, values in self.arrays.items()]),
+                                 self.cell, None if self.index is None else self.index[index])
+
+    def copy(self):
+        """ return a (deep) copy """
+        return self._from_arrays(self.positions.copy(), self.type_codes.copy(), self.type_table,
+                                 OrderedDict([(name, values.copy())
+                                              for name, values in self.arrays.items()]),
+                                 self.cell, self.index)
+
+    @property
+    def types(self):
+        """ the atom types as a pandas.Categorical """
+        return pd.Categorical.from_codes(self.type_codes, pd.Index(self.type_table, dtype=object))
+
+    @property
+    def meta(self):
+        """ the unit cell as a meta data pandas.Series (or None) """
+        if self.cell is None:
+            return None
+        return pd.Series([tuple(self.cell.origin.tolist()), tuple(self.cell.a.tolist()),
+                          tuple(self.cell.b.tolist()), tuple(self.cell.c.tolist()), 
+                          self.type_table],
+                          index=['origin','a','b','c','types'])
+
+    @classmethod
+    def from_dataframe(cls, atoms_df, meta=None):
+        """ create from a DataFrame with columns x, y, z, type (and optionally others),
+        and the unit cell from a meta data pandas.Series (with origin, a, b, c)
+        
+        the arrays are copies, since those of a DataFrame may be read-only views 
+        (with copy-on-write) """
+        types = atoms_df['type'].values if 'type' in atoms_df.columns else None
+        type_table = meta['types'] if meta is not None and 'types' in meta.index else ()
+        arrays = OrderedDict([(col, atoms_df[col].values.copy()) for col in atoms_df.columns
+                              if not col in ['x','y','z','type']])
+        cell = None if meta is None else Cell.from_meta(meta)
+        return cls(np.array(atoms_df[['x','y','z']].values, dtype=float, order='C'), 
+                   types, arrays, cell, type_table, atoms_df.index)
+
+    def to_dataframe(self):
+        """ return a DataFrame with columns type, x, y, z and the other arrays """
+        data = OrderedDict([('type', self.types), ('x', self.positions[:,0]),
+                            ('y', self.positions[:,1]), ('z', self.positions[:,2])])
+        data.update(self.arrays)
+        return pd.DataFrame(data, index=self.index, copy=False)
+
+def as_dataframe(atoms_df, copy=False):
+    """ return an atoms DataFrame, for an atoms DataFrame or Atoms 
+    
+    if copy, a DataFrame is copied, whereas Atoms are always converted 
+    to a new DataFrame (without copying the arrays), e.g. to add result columns to
+    """
+    if isinstance(atoms_df, Atoms):
+        return atoms_df.to_dataframe()
+    return atoms_df.copy() if copy else atoms_df
+
+def as_positions(atoms_df):
+    """ return the np.array((N,3)) C-contiguous positions,
+    for an atoms DataFrame or Atoms """
+    if isinstance(atoms_df, Atoms):
+        return atoms_df.positions
+    return np.ascontiguousarray(atoms_df[['x','y','z']].values, dtype=float)
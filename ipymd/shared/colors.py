@@ -37,6 +37,8 @@ def available_colors():
     return col_dict.copy()
 
 import numpy as np
+import pandas as pd
+from six import string_types
 # X11 colors!!
 
 # Pink colors
@@ -276,6 +278,61 @@ def get(name):
         
     return color
 
+rgba_cols = ['color_r', 'color_g', 'color_b', 'color_a']
+
+def to_rgba_array(values):
+    """ convert a sequence of colors (names or (r,g,b[,a]) tuples), 
+    to a np.array((N,4),dtype=uint8), each unique color is only converted once """
+    if isinstance(values, np.ndarray) and values.ndim == 2:
+        rgba = np.full((values.shape[0], 4), 255, dtype=np.uint8)
+        rgba[:,:values.shape[1]] = values
+        return rgba
+    if not isinstance(values, (np.ndarray, pd.Series)):
+        values = pd.Series(list(values), dtype=object)
+    values = np.asarray(values, dtype=object)
+    rgba = np.empty((values.shape[0], 4), dtype=np.uint8)
+    if values.shape[0] == 0:
+        return rgba
+    codes, uniques = pd.factorize(values)
+    lookup = np.empty((len(uniques), 4), dtype=np.uint8)
+    for i, color in enumerate(uniques):
+        if isinstance(color, string_types):
+            color = get(color)
+            if color is None:
+                raise ValueError('one or more colors not found')
+        color = tuple(color)
+        lookup[i] = color + (255,) if len(color) == 3 else color
+    if (codes < 0).any():
+        raise ValueError('one or more colors not found')
+    rgba[:] = lookup[codes]
+    return rgba
+
+def get_rgba(df, column='color'):
+    """ return the colors of a DataFrame as a np.array((N,4),dtype=uint8), 
+    taken from the rgba_cols (if present) or converted from column """
+    num_rows = df.shape[0]
+    rgba = np.empty((num_rows, 4), dtype=np.uint8)
+    found = np.zeros(num_rows, dtype=bool)
+    if set(rgba_cols).issubset(df.columns):
+        values = df[rgba_cols].values
+        # e.g. rows concatenated from a DataFrame with only column
+        found = ~pd.isnull(values).any(axis=1)
+        rgba[found] = values[found]
+    if not found.all():
+        if not column in df.columns:
+            raise ValueError('no colors found, requires {0} or {1}'.format(column, rgba_cols))
+        rgba[~found] = to_rgba_array(df[column].values[~found])
+    return rgba
+
+def set_rgba(df, rgba, column='color'):
+    """ set the colors of a DataFrame (in-place) as uint8 rgba_cols, 
+    removing column (if present) """
+    rgba = np.asarray(rgba, dtype=np.uint8)
+    for i, col in enumerate(rgba_cols):
+        df[col] = rgba[:,i]
+    if column in df.columns:
+        del df[column]
+
 def mix(a, b, ratio=0.5):
     ca = get(a)
     cb = get(b)
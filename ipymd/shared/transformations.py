@@ -1982,38 +1982,9 @@ def transform_to_crystal(coords, a, b, c,origin=[0,0,0]):
         v={\sqrt {1-\cos ^{2}(\alpha )-\cos ^{2}(\beta )-\cos ^{2}(\gamma )+2\cos(\alpha )\cos(\beta )\cos(\gamma )}}
         
     """
-    # move to origin
-    coords = numpy.asarray(coords) - numpy.asarray(origin)
-    
-    # create transform matrix
-    a_norm = numpy.linalg.norm(a)
-    b_norm = numpy.linalg.norm(b)
-    c_norm = numpy.linalg.norm(c)
-
-    alpha = angle_between_vectors(b,c)
-    beta = angle_between_vectors(a,c)
-    gamma = angle_between_vectors(a,b)
-    
-    if alpha==0 or beta==0 or gamma==0:
-        raise ValueError('a,b,c do not form a basis')
-    
-    sin, cos = math.sin, math.cos
-    cos_a = cos(alpha)
-    cos_b = cos(beta)
-    cos_g = cos(gamma)
-    sin_g = sin(gamma)
-    
-    v = math.sqrt(1-cos_a**2-cos_b**2-cos_g**2+2*cos_a*cos_b*cos_g)
-    
-    conv_matrix = numpy.array([
-        [1/a_norm, -(cos_g/(a_norm*sin_g)),(cos_a*cos_g-cos_b)/(a_norm*v*sin_g)],
-        [0,        1/(b_norm*sin_g),       (cos_b*cos_g-cos_a)/(b_norm*v*sin_g)],
-        [0,        0,                      sin_g/(c_norm*v)]])
-    
-    # transform        
-    new_coords = numpy.dot(conv_matrix,coords.T).T
-    
-    return new_coords
+    # the a-along-x matrix above is equivalent to the inverse of the (rows) a,b,c matrix,
+    # which is also valid for arbitrary cell orientations
+    return Cell(a, b, c, origin).to_fractional(numpy.asarray(coords, dtype=numpy.float64))
 
 def transform_from_crytal(coords, a, b, c,origin=[0,0,0]):
     r""" transform from crystal fractional coordinates to cartesian
@@ -2047,40 +2018,7 @@ def transform_from_crytal(coords, a, b, c,origin=[0,0,0]):
         v={\sqrt {1-\cos ^{2}(\alpha )-\cos ^{2}(\beta )-\cos ^{2}(\gamma )+2\cos(\alpha )\cos(\beta )\cos(\gamma )}}
         
     """
-    coords = numpy.asarray(coords)
-    
-    # create transform matrix
-    a_norm = numpy.linalg.norm(a)
-    b_norm = numpy.linalg.norm(b)
-    c_norm = numpy.linalg.norm(c)
-
-    alpha = angle_between_vectors(b,c)
-    beta = angle_between_vectors(a,c)
-    gamma = angle_between_vectors(a,b)
-    
-    if alpha==0 or beta==0 or gamma==0:
-        raise ValueError('a,b,c do not form a basis')
-    
-    sin, cos = math.sin, math.cos
-    cos_a = cos(alpha)
-    cos_b = cos(beta)
-    cos_g = cos(gamma)
-    sin_g = sin(gamma)
-    
-    v = math.sqrt(1-cos_a**2-cos_b**2-cos_g**2+2*cos_a*cos_b*cos_g)
-    
-    conv_matrix = numpy.array([
-        [a_norm,  b_norm*cos_g,       c_norm*cos_b                    ],
-        [0,       b_norm*sin_g,       c_norm*(cos_a-cos_b*cos_a)/sin_g],
-        [0,       0,                  c_norm*v/sin_g                  ]])
-    
-    # transform        
-    new_coords = numpy.dot(conv_matrix,coords.T).T
-
-    # move relative to origin
-    coords = numpy.asarray(coords) + numpy.asarray(origin)
-    
-    return new_coords
+    return Cell(a, b, c, origin).to_cartesian(numpy.asarray(coords, dtype=numpy.float64))
 
 def rotate_vectors(vector, axis, theta):
     """rotate the vector v clockwise about the given axis vector 
@@ -2111,6 +2049,141 @@ def rotate_vectors(vector, axis, theta):
     return numpy.array(numpy.einsum('ij,...j->...i',rotation_matrix,vector),ndmin=2)        
 
 
+class Cell(object):
+    """ a unit cell, defined by vectors a, b, c and an origin 
+    (in any orientation), with the cartesian <-> fractional transformation
+    matrices computed once 
+    
+    Properties
+    ----------
+    a : numpy.array(3)
+    b : numpy.array(3)
+    c : numpy.array(3)
+    origin : numpy.array(3)
+    
+    Examples
+    --------
+    >>> cell = Cell([2,0,0],[0,2,0],[1,0,2],origin=[1,1,1])
+    >>> frac = cell.to_fractional([[2,2,1],[4,1,3]])
+    >>> numpy.allclose(frac, [[0.5,0.5,0],[1,0,1]])
+    True
+    >>> numpy.allclose(cell.to_cartesian(frac), [[2,2,1],[4,1,3]])
+    True
+    
+    """
+    _cache = {}
+    _cache_size = 32
+    
+    def __init__(self, a, b, c, origin=(0.,0.,0.)):
+        matrix = numpy.array([a, b, c], dtype=numpy.float64)
+        if matrix.shape != (3,3):
+            raise ValueError('a,b,c must be 3d vectors')
+        if abs(numpy.linalg.det(matrix)) < 1e-12 * numpy.prod(vector_norm(matrix, axis=1)):
+            raise ValueError('a,b,c do not form a basis')
+        self._matrix = matrix
+        self._inverse = numpy.linalg.inv(matrix)
+        self._origin = numpy.array(origin, dtype=numpy.float64).reshape(3)
+        for array in [self._matrix, self._inverse, self._origin]:
+            array.flags.writeable = False
+    
+    @classmethod
+    def from_meta(cls, meta):
+        """ return the (cached) cell of a meta data series, with origin, a, b, c """
+        key = tuple(numpy.concatenate([numpy.asarray(meta[v], dtype=numpy.float64).ravel()
+                                       for v in ['a','b','c','origin']]))
+        cell = cls._cache.get(key)
+        if cell is None:
+            if len(cls._cache) >= cls._cache_size:
+                cls._cache.clear()
+            cell = cls._cache[key] = cls(meta['a'], meta['b'], meta['c'], meta['origin'])
+        return cell
+        
+    @property
+    def matrix(self):
+        """ the a, b, c vectors as rows of a (3,3) array, 
+        such that xyz = abc.dot(matrix) + origin """
+        return self._matrix
+    @property
+    def inverse(self):
+        """ the inverse of matrix, such that abc = (xyz - origin).dot(inverse) """
+        return self._inverse
+    @property
+    def reciprocal(self):
+        """ the reciprocal vectors (without the 2pi factor) as rows of a (3,3) array,
+        the length of each is the inverse of the spacing between the cell faces """
+        return self._inverse.T
+    @property
+    def origin(self):
+        return self._origin
+    @property
+    def a(self):
+        return self._matrix[0]
+    @property
+    def b(self):
+        return self._matrix[1]
+    @property
+    def c(self):
+        return self._matrix[2]
+    @property
+    def volume(self):
+        return abs(numpy.linalg.det(self._matrix))
+    
+    @staticmethod
+    def _transform(coords, matrix, pre_shift, post_shift, out, chunk_size):
+        """ compute (coords - pre_shift).dot(matrix) + post_shift in chunks, 
+        so that temporary arrays are at most (chunk_size,3) """
+        coords = numpy.asarray(coords)
+        if coords.ndim == 1:
+            out = numpy.empty(3) if out is None else out
+            out[:] = (coords - pre_shift).dot(matrix) + post_shift
+            return out
+        if out is None:
+            out = numpy.empty(coords.shape, dtype=numpy.result_type(coords.dtype, numpy.float32))
+        elif out.shape != coords.shape:
+            raise ValueError('out must have the same shape as coords')
+        for start in range(0, coords.shape[0], chunk_size):
+            end = start + chunk_size
+            chunk = coords[start:end] - pre_shift
+            out[start:end] = chunk.dot(matrix)
+            out[start:end] += post_shift
+        return out
+        
+    def to_fractional(self, coords, out=None, relative=False, chunk_size=2**16):
+        """ transform cartesian coordinates to fractional coordinates
+        
+        coords : numpy.array((N,3))
+        out : numpy.array((N,3))
+            array to place the result in, this may be coords (in-place)
+        relative : bool
+            whether coords are vectors (i.e. not relative to the origin)
+        chunk_size : int
+            maximum number of coordinates to transform at a time
+        """
+        shift = 0. if relative else self._origin
+        return self._transform(coords, self._inverse, shift, 0., out, chunk_size)
+
+    def to_cartesian(self, coords, out=None, relative=False, chunk_size=2**16):
+        """ transform fractional coordinates to cartesian coordinates
+        
+        coords : numpy.array((N,3))
+        out : numpy.array((N,3))
+            array to place the result in, this may be coords (in-place)
+        relative : bool
+            whether coords are vectors (i.e. not relative to the origin)
+        chunk_size : int
+            maximum number of coordinates to transform at a time
+        """
+        shift = 0. if relative else self._origin
+        return self._transform(coords, self._matrix, 0., shift, out, chunk_size)
+
+    def minimum_image(self, vectors, out=None):
+        """ return the minimum image of each vector (N,3), 
+        i.e. with fractional components in [-0.5,0.5] """
+        frac = self.to_fractional(vectors, relative=True)
+        frac -= numpy.round(frac)
+        return self.to_cartesian(frac, out=out, relative=True)
+
+
 #_import_module('_transformations')
 
 if __name__ == "__main__":
@@ -6,12 +6,13 @@ Created on Sun May  1 23:47:03 2016
 """
 from io import BytesIO
 import numpy as np
-from six import string_types
 
 from IPython.display import Image as ipy_Image
 from PIL import Image, ImageChops, ImageDraw, ImageFont
 
 from ..shared.colors import get as str_to_colour
+from ..shared.colors import get_rgba
+from ..shared.atoms import as_dataframe, as_positions
 from ..shared import fonts
 from ..shared import get_data_path
 from .opengl.qtviewer import QtViewer
@@ -72,7 +73,7 @@ class Visualise_Sim(object):
     def add_atoms(self, atoms_df, spheres=True, illustrate=False):
         """ add atoms to visualisation
 
-        atoms_df : pandas.DataFrame
+        atoms_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
             a table of atom data, must contain columns;  
             x, y, z, radius, color and transparency
         spheres : bool
@@ -80,19 +81,14 @@ class Visualise_Sim(object):
         illustrate : str
             if True, atom shading is more indicative of an illustration
         """
-        assert set(['x','y','z','radius','color','transparency']).issubset(set(atoms_df.columns))
-        
-        r_array = np.array(atoms_df[['x','y','z']])
-        r_array = self._unit_conversion(r_array, 'distance')
+        r_array = self._unit_conversion(as_positions(atoms_df), 'distance')
+        atoms_df = as_dataframe(atoms_df)
+        assert set(['x','y','z','radius','transparency']).issubset(set(atoms_df.columns))
         
         radii = np.array(atoms_df['radius'])
         radii = self._unit_conversion(radii, 'distance')
         
-        cols = atoms_df['color'].apply(
-                lambda x: str_to_colour(x) if isinstance(x,string_types) else list(x) + [255]).tolist()
-        if None in cols:
-            raise ValueError('one or more colors not found')
-        cols = np.array(cols)
+        cols = get_rgba(atoms_df)
         alphas = np.array(atoms_df['transparency'])
         
         #type_array = atoms_df['type'].map(lambda x: type_map.get(x,x)).tolist()
@@ -115,7 +111,7 @@ class Visualise_Sim(object):
                   cylinders=False, illustrate=False, linewidth=5):
         """ add bonds to visualisation
 
-        atoms_df : pandas.DataFrame
+        atoms_df : pandas.DataFrame or ipymd.shared.atoms.Atoms
             a table of atom data, must contain columns; x, y, z
         bonds_df : list
             a table of bond data, must contain; start, end, radius, color, transparency
@@ -125,13 +121,11 @@ class Visualise_Sim(object):
         illustrate : str
             if True, atom shading is more indicative of an illustration
         """
-        assert set(['x','y','z','radius','color','transparency']).issubset(set(atoms_df.columns))
         assert set(['start','end','radius','transparency']).issubset(set(bonds_df.columns))
         assert (set(['color']).issubset(set(bonds_df.columns)) or 
                 set(['color_start','color_end']).issubset(set(bonds_df.columns)))       
         
-        r_array = np.array(atoms_df[['x','y','z']])
-        r_array = self._unit_conversion(r_array, 'distance')
+        r_array = self._unit_conversion(as_positions(atoms_df), 'distance')
         
         #bounds = np.empty((bonds_df.shape[0], 2, 3))   
         #bounds[:, 0, :] = r_array[bonds_df.start.values]
@@ -143,12 +137,7 @@ class Visualise_Sim(object):
         radii = self._unit_conversion(radii, 'distance')
 
         def get_colors(name):       
-            cols = bonds_df[name].apply(
-                    lambda x: str_to_colour(x) if isinstance(x,string_types) else list(x) + [255]).tolist()
-            if None in cols:
-                raise ValueError('one or more colors not found')
-            cols = np.array(cols)
-            return cols
+            return get_rgba(bonds_df, name)
         
         if 'color_start' in bonds_df.columns and 'color_end' in bonds_df.columns:
             col_start = get_colors('color_start')
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial import Delaunay
+
+from ipymd.atom_manipulation import Atom_Manipulation, Atom_Pipeline, unwrap_trajectory
+from ipymd.data_input import lammps
+from ipymd.data_input.base import DataInput
+from ipymd.shared import get_data_path
+from ipymd.shared.colors import rgba_cols, get_rgba
+from ipymd.shared.transformations import rotate_vectors, Cell
+
+def _atoms_df(color=None):
+    atoms_df = pd.DataFrame({'type':['Na','Cl','Na','Cl'],
+                             'x':[0.,1.,2.,3.], 'y':[0.,1.,0.,1.], 'z':[0.,0.,1.,1.],
+                             'q':[1.,-1.,1.,-1.]})
+    if color is not None:
+        atoms_df['color'] = [color] * atoms_df.shape[0]
+    return atoms_df
+
+_color_methods = [('color_by_index', {}),
+                  ('color_by_variable', {'colname':'q'}),
+                  ('color_by_categories', {'colname':'type'})]
+
+@pytest.mark.parametrize('color', [None, 'red'])
+@pytest.mark.parametrize('method, kwargs', _color_methods)
+def test_undo_color_by(method, kwargs, color):
+    atoms_df = _atoms_df(color)
+    manip = Atom_Manipulation(atoms_df)
+    getattr(manip, method)(**kwargs)
+    assert set(rgba_cols).issubset(manip.df.columns)
+    assert not 'color' in manip.df.columns
+    manip.undo_last()
+    pd.testing.assert_frame_equal(manip.df, atoms_df, check_like=True)
+
+def test_apply_map_color_uint8():
+    manip = Atom_Manipulation(_atoms_df('red'))
+    manip.apply_map({'Na':(0,0,255)}, 'color')
+    assert not 'color' in manip.df.columns
+    assert all([manip.df[col].dtype == np.uint8 for col in rgba_cols])
+    # unmapped types retain their color
+    assert get_rgba(manip.df).tolist() == [[0,0,255,255], [255,0,0,255]] * 2
+
+    manip.change_type_variable('Cl', 'color', 'blue')
+    assert get_rgba(manip.df).tolist() == [[0,0,255,255]] * 4
+    manip.undo_last()
+    assert get_rgba(manip.df).tolist() == [[0,0,255,255], [255,0,0,255]] * 2
+
+def test_apply_map_color_default():
+    manip = Atom_Manipulation(_atoms_df())
+    manip.apply_map({'Na':'red'}, 'color', default=(0,255,0))
+    assert get_rgba(manip.df).tolist() == [[255,0,0,255], [0,255,0,255]] * 2
+    with pytest.raises(ValueError):
+        Atom_Manipulation(_atoms_df()).apply_map({'Na':'red'}, 'color')
+
+def _meta():
+    return pd.Series([np.zeros(3), np.array([4.,0.,0.]), np.array([0.,2.,0.]), 
+                      np.array([0.,0.,2.])], index=['origin','a','b','c'])
+
+_undo_methods = [('filter_variables', (['Na'],), {}),
+                 ('repeat_cell', (1, (1,1), 0), {'image_index':True}),
+                 ('rotate', (30, [1,1,0]), {})]
+
+@pytest.mark.parametrize('method, args, kwargs', _undo_methods)
+def test_undo_manipulation(method, args, kwargs):
+    atoms_df, meta = _atoms_df(), _meta()
+    manip = Atom_Manipulation(atoms_df, meta)
+    getattr(manip, method)(*args, **kwargs)
+    changed_df, changed_meta = manip.df, manip.meta
+    # modifying the returned data does not change the internal (or saved) data
+    atoms_view = manip.df
+    atoms_view['x'] += 1.
+    atoms_view['type'] = 'X'
+    _assert_frame_equal(manip.df, changed_df)
+    
+    manip.undo_last()
+    pd.testing.assert_frame_equal(manip.df, atoms_df, check_like=True)
+    _assert_meta_equal(manip.meta, meta)
+    with pytest.raises(Exception):
+        manip.undo_last()
+
+def test_df_copy():
+    manip = Atom_Manipulation(_atoms_df())
+    atoms_df = manip.df
+    atoms_df['x'] += 1.
+    atoms_df.iloc[0, atoms_df.columns.get_loc('y')] = 10.
+    pd.testing.assert_frame_equal(manip.df, _atoms_df(), check_like=True)
+
+@pytest.mark.parametrize('original_first', [False, True])
+@pytest.mark.parametrize('repeats, ranges', [((1,1,1), ([0,1], [0,1], [0,1])),
+                                             (((1,1),(2,0),0), ([-1,0,1], [-2,-1,0], [0]))])
+def test_repeat_cell(repeats, ranges, original_first):
+    atoms_df = _atoms_df()
+    vectors = np.array([[4.,0.,0.], [1.,2.,0.], [0.5,0.5,3.]])
+    meta = pd.Series([np.array([1.,2.,3.]), vectors[0], vectors[1], vectors[2]], 
+                     index=['origin','a','b','c'])
+    manip = Atom_Manipulation(atoms_df, meta)
+    manip.repeat_cell(*repeats, original_first=original_first, image_index=True)
+    df = manip.df
+    
+    images = list(itertools.product(*ranges))
+    assert df.shape[0] == atoms_df.shape[0] * len(images)
+    # each atom is copied once to each image
+    copies = sorted(zip(df.source_index, df.image_a, df.image_b, df.image_c))
+    assert copies == sorted([(i,) + image for i in range(atoms_df.shape[0]) for image in images])
+    source = atoms_df.iloc[df.source_index.values]
+    shifts = df[['image_a','image_b','image_c']].values.dot(vectors)
+    assert np.allclose(df[['x','y','z']].values, source[['x','y','z']].values + shifts)
+    assert df.type.tolist() == source.type.tolist()
+    assert df.q.tolist() == source.q.tolist()
+    if original_first:
+        assert (df[['image_a','image_b','image_c']].values[:atoms_df.shape[0]] == 0).all()
+        assert df.source_index.tolist()[:atoms_df.shape[0]] == list(range(atoms_df.shape[0]))
+    
+    new_meta = manip.meta
+    mins = [r[0] for r in ranges]
+    assert np.allclose(new_meta.origin, meta.origin + np.dot(mins, vectors))
+    for vec, name, r in zip(vectors, ['a','b','c'], ranges):
+        assert np.allclose(new_meta[name], vec*len(r))
+
+def _triclinic_meta():
+    return pd.Series([np.array([1.,-2.,0.5]), np.array([4.,0.,0.]), np.array([1.,3.,0.]), 
+                      np.array([-0.5,1.,5.])], index=['origin','a','b','c'])
+
+@pytest.mark.parametrize('flags', [False, True])
+def test_wrap_unwrap(flags):
+    meta = _triclinic_meta()
+    rs = np.random.RandomState(0)
+    xyz = rs.uniform(-15, 15, size=(50,3))
+    atoms_df = pd.DataFrame({'type':'A', 'x':xyz[:,0], 'y':xyz[:,1], 'z':xyz[:,2]})
+    image_cols = ['ix','iy','iz']
+    if flags:
+        # existing flags are updated, and unwrapped from
+        atoms_df[image_cols] = rs.randint(-2, 3, size=(50,3))
+        cell = Cell.from_meta(meta)
+        xyz = xyz + cell.to_cartesian(atoms_df[image_cols].values.astype(float), relative=True)
+    manip = Atom_Manipulation(atoms_df, meta)
+    manip.wrap(image_cols)
+    frac = Cell.from_meta(meta).to_fractional(manip.df[['x','y','z']].values)
+    assert ((frac >= 0) & (frac < 1)).all()
+    assert not np.allclose(manip.df[['x','y','z']].values, xyz)
+    
+    manip.unwrap(image_cols)
+    assert np.allclose(manip.df[['x','y','z']].values, xyz, rtol=0, atol=1e-10)
+    assert (manip.df[image_cols].values == 0).all()
+
+class _Frames(DataInput):
+    """ a trajectory of in-memory configurations (with a fixed cell) """
+    def setup_data(self, frames, meta):
+        self._frames = frames
+        self._meta = meta
+        self._data_set = True
+    def _get_atom_data(self, config):
+        return self._frames[config-1].copy()
+    def _get_meta_data(self, config):
+        return self._meta.copy()
+    def _count_configs(self):
+        return len(self._frames)
+
+@pytest.mark.parametrize('id_col, image_cols', [('id', None), (None, None), 
+                                                ('id', ['ix','iy','iz'])])
+def test_unwrap_trajectory(id_col, image_cols):
+    meta = _triclinic_meta()
+    cell = Cell.from_meta(meta)
+    start = np.array([[0.5,0.5,0.5], [0.1,0.9,0.5], [0.9,0.2,0.05]])
+    velocity = np.array([[0.3,0.,0.], [0.,-0.35,0.1], [0.2,0.45,-0.4]])
+    rs = np.random.RandomState(0)
+    frames, expected = [], []
+    for step in range(8):
+        # atoms crossing the boundaries (in both directions) along a, b and c
+        frac = start + step*velocity
+        images = np.floor(frac).astype(int)
+        xyz = cell.to_cartesian(frac - images)
+        frame = pd.DataFrame({'id':[1,2,3], 'type':'A', 'x':xyz[:,0], 'y':xyz[:,1], 'z':xyz[:,2],
+                              'ix':images[:,0], 'iy':images[:,1], 'iz':images[:,2]})
+        if id_col is not None:
+            frame = frame.iloc[rs.permutation(3)].reset_index(drop=True)
+        frames.append(frame)
+        expected.append(pd.DataFrame(cell.to_cartesian(frac), columns=['x','y','z'], 
+                                     index=[1,2,3]))
+    assert any([(frame[['ix','iy','iz']].values < 0).any() for frame in frames])
+    assert any([(frame[['ix','iy','iz']].values > 0).any() for frame in frames])
+    data = _Frames()
+    data.setup_data(frames, meta)
+    
+    results = list(unwrap_trajectory(data, id_col=id_col, image_cols=image_cols))
+    assert [config for config, df in results] == list(range(1, 9))
+    for (config, df), exp in zip(results, expected):
+        df = df.set_index('id')
+        assert np.allclose(df[['x','y','z']].values, exp.loc[df.index].values, 
+                           rtol=0, atol=1e-10)
+
+def _box_faces(vectors, origin):
+    """ (centre, outward unit normal) of each face of a box """
+    faces = []
+    for i, j, k in [(0,1,2), (1,2,0), (2,0,1)]:
+        u, v, w = vectors[i], vectors[j], vectors[k]
+        normal = np.cross(u, v)
+        normal *= np.sign(normal.dot(w)) / np.linalg.norm(normal)
+        centre = origin + 0.5*(u + v)
+        faces += [(centre, -normal), (centre + w, normal)]
+    return faces, origin + np.array(list(itertools.product([0,1], repeat=3))).dot(vectors)
+
+def _hexagon_faces(vectors, origin):
+    """ (centre, outward unit normal) of each face of a hexagonal prism """
+    a, c = vectors
+    base = np.array([rotate_vectors(a, c, angle)[0] for angle in [0,60,120,180,240,300]])
+    unit_c = c / np.linalg.norm(c)
+    faces = [(origin, -unit_c), (origin + c, unit_c)]
+    for p1, p2 in zip(base, np.roll(base, -1, axis=0)):
+        mid = 0.5*(p1 + p2)
+        faces.append((origin + mid + 0.5*c, mid / np.linalg.norm(mid)))
+    return faces, origin + np.concatenate([base, base + c])
+
+_box = np.array([[3.,0.,0.], [1.,2.5,0.], [0.5,-0.5,2.]])
+_filters = [('filter_inside_box', _box_faces, _box),
+            ('filter_inside_pts', _box_faces, _box),
+            ('filter_inside_hexagon', _hexagon_faces, np.array([[2.,0.,0.], [0.,0.,3.]]))]
+
+@pytest.mark.parametrize('method, get_faces, vectors', _filters)
+def test_filter_inside_hull(method, get_faces, vectors):
+    origin, tol = np.array([0.5,-1.,2.]), 1e-3
+    faces, corners = get_faces(vectors, origin)
+    
+    # random points, away from the faces, against a delaunay triangulation
+    pts = np.random.RandomState(0).rand(500, 3)
+    pts = corners.min(axis=0) - 0.5 + pts * (np.ptp(corners, axis=0) + 1.)
+    dists = np.array([(pts - centre).dot(normal) for centre, normal in faces])
+    pts = pts[(np.abs(dists) > 2*tol).all(axis=0)]
+    expected = [Delaunay(corners).find_simplex(pts) >= 0]
+    # points on, just inside and just outside of each face
+    for scale, inside in [(0., True), (-2*tol, True), (0.5*tol, True), (2*tol, False)]:
+        face_pts = np.array([centre + scale*normal for centre, normal in faces])
+        pts = np.concatenate([pts, face_pts])
+        expected.append(np.full(len(faces), inside))
+    expected = np.concatenate(expected)
+    assert expected.any() and not expected.all()
+    
+    atoms_df = pd.DataFrame({'type':'A', 'x':pts[:,0], 'y':pts[:,1], 'z':pts[:,2]})
+    manip = Atom_Manipulation(atoms_df)
+    if method == 'filter_inside_pts':
+        manip.filter_inside_pts(corners, tol=tol)
+    else:
+        getattr(manip, method)(vectors, origin, tol=tol)
+    assert manip.df.index.tolist() == np.flatnonzero(expected).tolist()
+
+def _chain(manip):
+    manip.filter_variables([1.])
+    manip.slice_fraction(amax=0.5, cmin=0.25)
+    manip.rotate(30, [0,0,1])
+    manip.translate([1.,-2.,0.5])
+    manip.color_by_variable('z')
+    return manip
+
+def _assert_meta_equal(meta, expected):
+    assert list(meta.index) == list(expected.index)
+    for key in expected.index:
+        if key == 'types':
+            assert tuple(meta[key]) == tuple(expected[key])
+        else:
+            assert np.allclose(np.asarray(meta[key], dtype=float), 
+                               np.asarray(expected[key], dtype=float), rtol=0, atol=1e-10)
+
+def _assert_frame_equal(atoms_df, expected):
+    pd.testing.assert_frame_equal(atoms_df, expected, check_like=True,
+                                  check_exact=False, rtol=0, atol=1e-10)
+
+def test_pipeline_matches_manipulation():
+    data = lammps.LAMMPS_Output()
+    data.setup_data(get_data_path(['atom_dump','atoms_*.dump']))
+    configs = [1, 2, 3]
+    expected = []
+    for config in configs:
+        manip = _chain(Atom_Manipulation(data.get_atom_data(config), data.get_meta_data(config)))
+        expected.append((manip.df, manip.meta))
+    
+    pipe = _chain(Atom_Pipeline())
+    for config, (exp_df, exp_meta) in zip(configs, expected):
+        atoms_df, meta = pipe.apply(data.get_atom_data(config), data.get_meta_data(config))
+        _assert_frame_equal(atoms_df, exp_df)
+        _assert_meta_equal(meta, exp_meta)
+    
+    results = list(pipe.iterate(data, configs, processes=2))
+    assert len(results) == len(configs)
+    for (atoms_df, meta), (exp_df, exp_meta) in zip(results, expected):
+        _assert_frame_equal(atoms_df, exp_df)
+        _assert_meta_equal(meta, exp_meta)
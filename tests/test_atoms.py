@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+from ipymd.shared.atoms import Atoms, as_dataframe
+from ipymd.data_input import crystal
+from ipymd.atom_analysis import nearest_neighbour
+
+def _nacl():
+    data = crystal.Crystal()
+    data.setup_data([[0,0,0],[0.5,0.5,0.5]], ['Na','Cl'], 225,
+                    cellpar=[5.4,5.4,5.4,90,90,90], repetitions=[2,2,2])
+    return data
+
+def test_from_dataframe_writable_copies():
+    atoms_df = _nacl().get_atom_data()
+    atoms = Atoms.from_dataframe(atoms_df)
+    assert atoms.positions.flags.writeable and atoms.positions.flags.c_contiguous
+    atoms.positions[0] = 100.
+    atoms.arrays['radius'][0] = 100.
+    assert (atoms_df[['x','y','z','radius']].values < 100.).all()
+
+def test_as_dataframe_copy():
+    atoms_df = _nacl().get_atom_data()
+    df = as_dataframe(atoms_df, copy=True)
+    df['new'] = 1.
+    df.loc[0, 'x'] = 100.
+    assert not 'new' in atoms_df.columns and atoms_df.x[0] < 100.
+
+def test_crystal_atom_data_independent():
+    data = _nacl()
+    atoms_df = data.get_atom_data()
+    atoms_df.loc[0, 'x'] = 100.
+    assert data.get_atom_data().x[0] < 100.
+
+def test_analyses_atoms_input():
+    data = _nacl()
+    atoms_df, meta = data.get_atom_data(), data.get_meta_data()
+    atoms = data.get_atoms()
+    for func, kwargs in [(nearest_neighbour.centrosymmetry, {'num_neighbours':6}),
+                         (nearest_neighbour.steinhardt_order, {'max_dist':3.}),
+                         (nearest_neighbour.cluster_atoms, {'max_dist':3.})]:
+        expected = func(atoms_df, repeat_meta=meta, **kwargs)
+        result = func(atoms, repeat_meta=meta, **kwargs)
+        if isinstance(expected, tuple):
+            expected, result = expected[0], result[0]
+        pd.testing.assert_frame_equal(result, expected, check_like=True)
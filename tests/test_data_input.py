@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from ipymd.data_input import crystal, lammps
+
+def test_get_atom_data_single_precision():
+    data = crystal.Crystal()
+    data.setup_data([[0,0,0],[0.5,0.5,0.5]], ['Na','Cl'], 225,
+                    cellpar=[5.4,5.4,5.4,90,90,90], repetitions=[2,2,2])
+    double = data.get_atom_data()
+    single = data.get_atom_data(precision='single')
+    float_cols = double.select_dtypes(include=[np.float64]).columns
+    assert list(float_cols) and (single[float_cols].dtypes == np.float32).all()
+    assert single.drop(float_cols, axis=1).equals(double.drop(float_cols, axis=1))
+    # float32 rounding is within half a unit in the last place (relative 2^-24)
+    assert np.allclose(single[float_cols].values, double[float_cols].values, 
+                       rtol=2.**-24, atol=0)
+
+def _write_dump(path, types):
+    lines = ['ITEM: TIMESTEP', '0', 'ITEM: NUMBER OF ATOMS', str(len(types)),
+             'ITEM: BOX BOUNDS pp pp pp', '0 10', '0 10', '0 10', 'ITEM: ATOMS id type xs ys zs']
+    lines += ['{0} {1} 0.{0} 0.5 0.5'.format(i+1, typ) for i, typ in enumerate(types)]
+    path.write_text('\n'.join(lines) + '\n')
+
+@pytest.mark.parametrize('single_file', [False, True])
+def test_type_table_read_order(tmp_path, single_file):
+    types = [[3, 3], [1, 3, 2], [2, 1]]
+    if single_file:
+        texts = []
+        for typs in types:
+            _write_dump(tmp_path / 'part', typs)
+            texts.append((tmp_path / 'part').read_text())
+        (tmp_path / 'atoms.dump').write_text(''.join(texts))
+        atom_path = str(tmp_path / 'atoms.dump')
+    else:
+        for i, typs in enumerate(types):
+            _write_dump(tmp_path / 'atoms_{}.dump'.format(i+1), typs)
+        atom_path = str(tmp_path / 'atoms_*.dump')
+
+    results = []
+    for order in [[1, 2, 3], [3, 2, 1]]:
+        data = lammps.LAMMPS_Output()
+        data.setup_data(atom_path)
+        result = {}
+        for config in order:
+            atom_df = data.get_atom_data(config)
+            result[config] = (tuple(data.get_meta_data(config)['types']), 
+                              atom_df['type'].cat.codes.tolist(), atom_df['type'].tolist())
+        results.append(result)
+    
+    assert results[0] == results[1]
+    for config, typs in enumerate(types):
+        table, codes, atypes = results[0][config+1]
+        assert table == (3., 1., 2.)
+        assert atypes == typs
+        assert codes == [table.index(typ) for typ in typs]
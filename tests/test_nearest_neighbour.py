@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from ipymd.data_input import crystal
+from ipymd.atom_analysis import nearest_neighbour
+
+def _box_meta(length):
+    return pd.Series([(0.,0.,0.), (length,0.,0.), (0.,length,0.), (0.,0.,length)],
+                     index=['origin','a','b','c'])
+
+def test_cluster_atoms_periodic_centre_wrapped():
+    df = pd.DataFrame({'type':['S','S'], 'x':[9.9,0.9], 'y':[5.,5.], 'z':[5.,5.]})
+    df, clusters_df = nearest_neighbour.cluster_atoms(df, max_dist=2., 
+                                                      repeat_meta=_box_meta(10.))
+    assert clusters_df.shape[0] == 1
+    assert np.allclose(clusters_df[['x','y','z']].values, [[0.4,5.,5.]])
+
+def test_group_molecules_periodic_inside_box():
+    df = pd.DataFrame({'type':['S','S'], 'x':[9.9,0.9], 'y':[5.,5.], 'z':[5.,5.]})
+    mol_df = nearest_neighbour.group_molecules(df, ['S','S'], maxdist=2., 
+                                               repeat_meta=_box_meta(10.))
+    xyz = mol_df[['x','y','z']].values
+    assert xyz.shape[0] == 1
+    assert np.all((xyz >= 0) & (xyz < 10.))
+
+def _fcc(offset=0., noise=0.05):
+    data = crystal.Crystal()
+    data.setup_data([[0,0,0]], ['Cu'], 225, cellpar=[3.6,3.6,3.6,90,90,90], repetitions=[3,3,3])
+    df, meta = data.get_atom_data(), data.get_meta_data()
+    df[['x','y','z']] += np.random.RandomState(0).normal(scale=noise, size=(df.shape[0],3))
+    df[['x','y','z']] += offset
+    meta['origin'] = tuple(np.asarray(meta.origin) + offset)
+    return df, meta
+
+# single precision order parameters are within 1e-5 of double (see steinhardt_order)
+@pytest.mark.parametrize('offset', [0., 1000.])
+def test_steinhardt_order_single_precision(offset):
+    df, meta = _fcc(offset)
+    cols = ['q4','q6','w6','q4_avg','q6_avg','w6_avg']
+    double = nearest_neighbour.steinhardt_order(df, max_dist=3., repeat_meta=meta, averaged=True)
+    single = nearest_neighbour.steinhardt_order(df, max_dist=3., repeat_meta=meta, averaged=True,
+                                                precision='single')
+    assert np.allclose(single[cols].values, double[cols].values, rtol=0, atol=1e-5)
+
+# single precision centrosymmetry is within 1e-5 A^2 of double
+@pytest.mark.parametrize('offset', [0., 1000.])
+def test_centrosymmetry_single_precision(offset):
+    df, meta = _fcc(offset)
+    double = nearest_neighbour.centrosymmetry(df, repeat_meta=meta)
+    single = nearest_neighbour.centrosymmetry(df, repeat_meta=meta, precision='single')
+    assert single.csp.dtype == np.float32
+    assert np.allclose(single.csp.values, double.csp.values, rtol=0, atol=1e-5)
+
+def test_steinhardt_order_fcc():
+    df, meta = _fcc(noise=0.)
+    df = nearest_neighbour.steinhardt_order(df, max_dist=3., repeat_meta=meta, averaged=True)
+    for col, value in [('q4', 0.1909), ('q6', 0.5745), ('w6', -0.01316)]:
+        assert np.allclose(df[col], value, rtol=0, atol=1e-4)
+        # all neighbours are equivalent, so averaging does not change the values
+        assert np.allclose(df[col+'_avg'], value, rtol=0, atol=1e-4)
+
+def test_steinhardt_order_averaged_noise():
+    df, meta = _fcc(noise=0.1)
+    df = nearest_neighbour.steinhardt_order(df, max_dist=3., repeat_meta=meta, averaged=True)
+    # averaging over the neighbours reduces the spread of the values
+    for col in ['q4', 'q6', 'w6']:
+        assert df[col+'_avg'].std() < 0.5 * df[col].std()
+
+def test_centrosymmetry_perfect_fcc():
+    df, meta = _fcc(noise=0.)
+    df = nearest_neighbour.centrosymmetry(df, repeat_meta=meta)
+    assert np.allclose(df.csp, 0., atol=1e-10)
+
+def test_displacements_minimum_image():
+    ref_df = pd.DataFrame({'id':[1,2], 'type':['S','S'], 
+                           'x':[9.8,5.], 'y':[5.,5.], 'z':[0.3,5.]})
+    df = pd.DataFrame({'id':[2,1,3], 'type':['S','S','S'], 
+                       'x':[5.5,0.1,1.], 'y':[5.,5.,1.], 'z':[5.,9.9,1.]})
+    df = nearest_neighbour.displacements(df, ref_df, repeat_meta=_box_meta(10.))
+    assert np.allclose(df[['dx','dy','dz']].values[:2], [[0.5,0.,0.], [0.3,0.,-0.4]])
+    assert np.allclose(df.displacement.values[:2], [0.5, 0.5])
+    # atoms not in the reference are nan
+    assert df[['dx','dy','dz','displacement']].iloc[2].isnull().all()
+    # without the periodic boundary
+    df = nearest_neighbour.displacements(df, ref_df)
+    assert np.allclose(df[['dx','dy','dz']].values[1], [-9.7,0.,9.6])
+
+def test_bond_angle_distribution_water():
+    angle = np.radians(104.52)
+    df = pd.DataFrame({'type':['O','H','H'], 'x':[0., 0.9572, 0.9572*np.cos(angle)],
+                       'y':[0., 0., 0.9572*np.sin(angle)], 'z':[0.,0.,0.]})
+    edges, hists = nearest_neighbour.bond_angle_distribution(df, max_dist=1.2, max_neighbours=4)
+    # only the H-O-H angle (the H atoms only have one bond)
+    assert list(hists.keys()) == [('H','O','H')]
+    assert hists[('H','O','H')].sum() == 1
+    assert edges[np.argmax(hists[('H','O','H')])] == 104.
+
+def test_bond_angle_distribution_fcc():
+    df, meta = _fcc(noise=0.)
+    hists = {}
+    for _ in range(2):
+        edges, hists = nearest_neighbour.bond_angle_distribution(df, max_dist=3., 
+                                        max_neighbours=12, repeat_meta=meta, accumulate=hists)
+    counts = hists[('Cu','Cu','Cu')]
+    centres = 0.5*(edges[1:] + edges[:-1])
+    # pairs of the 12 neighbours of each atom, for two (accumulated) configurations
+    for angle, num in [(60., 24), (90., 12), (120., 24), (180., 6)]:
+        assert counts[np.abs(centres - angle) < 1.].sum() == 2 * num * df.shape[0]
+    assert counts.sum() == 2 * 66 * df.shape[0]
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from ipymd.data_input import crystal
+from ipymd.data_input.base import DataInput
+from ipymd.atom_analysis import spectral
+from ipymd.shared import atom_data
+
+def _nacl(repetitions=(2,2,2)):
+    data = crystal.Crystal()
+    data.setup_data([[0,0,0],[0.5,0.5,0.5]], ['Na','Cl'], 225,
+                    cellpar=[5.4,5.4,5.4,90,90,90], repetitions=list(repetitions))
+    return data.get_atom_data(), data.get_meta_data()
+
+class _CountingPool(object):
+    """ a serial stand-in for a ThreadPool, recording the number of tasks """
+    def __init__(self):
+        self.tasks = []
+    def map(self, func, iterable):
+        iterable = list(iterable)
+        self.tasks.append(len(iterable))
+        return list(map(func, iterable))
+
+def test_structure_sum_fixed_fine_tiles():
+    xyz = np.random.RandomState(0).rand(50, 3) * 10
+    kpts = np.random.RandomState(1).rand(1000, 3)
+    pool = _CountingPool()
+    S_pool = spectral._structure_sum(xyz, kpts, pool=pool)
+    S = spectral._structure_sum(xyz, kpts)
+    assert pool.tasks == [4]
+    assert np.array_equal(S, S_pool)
+
+def test_compute_xrd_threads_identical():
+    atoms_df, meta = _nacl()
+    thetas, I = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=90, 
+                                     cache=False, chunk_size=2**10)
+    thetas2, I2 = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=90, 
+                                       cache=False, chunk_size=2**10, n_jobs=2)
+    assert np.array_equal(thetas, thetas2)
+    assert np.array_equal(I, I2)
+
+def test_struct_factors_electron_ionic_type():
+    atoms_df = pd.DataFrame({'type':['Na1+', 'Cl'], 'x':[0.,1.], 'y':[0.,1.], 'z':[0.,1.]})
+    k_mods = np.array([0.5, 1.])
+    factors = spectral._calc_struct_factors(atoms_df, None, k_mods, radiation='electron')
+    na = spectral._calc_struct_factors(atoms_df.replace('Na1+', 'Na'), None, k_mods,
+                                       radiation='electron')
+    assert np.allclose(factors['Na1+'], na['Na'])
+
+@pytest.mark.parametrize('atype', [1, 'xx', '1+'])
+def test_struct_factors_electron_unknown_type(atype):
+    atoms_df = pd.DataFrame({'type':[atype], 'x':[0.], 'y':[0.], 'z':[0.]})
+    with pytest.raises(ValueError, match='atom type'):
+        spectral._calc_struct_factors(atoms_df, None, np.array([0.5]), radiation='electron')
+
+def test_compute_xrd_cache_opt_in():
+    atoms_df, meta = _nacl((1,1,1))
+    cache = spectral.XRDCache(max_items=1)
+    spectral.xrd_cache.clear()
+    thetas, I = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=60)
+    assert len(spectral.xrd_cache._results) == 0
+    thetas2, I2 = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=60, cache=cache)
+    assert len(cache._results) == 1
+    thetas3, I3 = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=60, cache=cache)
+    assert np.array_equal(I, I2) and np.array_equal(I2, I3)
+
+# single precision intensities are within 1e-6 of the largest peak (see compute_xrd),
+# independent of the absolute coordinates (the phases use fractional coordinates)
+@pytest.mark.parametrize('offset', [0., 1000.])
+def test_compute_xrd_single_precision(offset):
+    atoms_df, meta = _nacl((3,3,3))
+    atoms_df[['x','y','z']] += np.random.RandomState(0).normal(scale=0.1, size=(atoms_df.shape[0],3))
+    atoms_df[['x','y','z']] += offset
+    meta['origin'] = tuple(np.asarray(meta.origin) + offset)
+    thetas, I = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=120)
+    thetas32, I32 = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=120, precision='single')
+    assert np.array_equal(thetas, thetas32)
+    assert np.abs(I32 - I).max() < 1e-6 * np.abs(I).max()
+
+# the fft method tolerances, relative to the largest peak (see compute_xrd)
+@pytest.mark.parametrize('fft_order, fft_oversample, tol', [(8, 2., 1e-5), (8, 3., 2e-7), 
+                                                            (12, 3., 1e-9)])
+def test_compute_xrd_fft_matches_direct(fft_order, fft_oversample, tol):
+    atoms_df, meta = _nacl((2,2,2))
+    atoms_df[['x','y','z']] += np.random.RandomState(0).normal(scale=0.1, size=(atoms_df.shape[0],3))
+    thetas, I = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=150)
+    thetas_fft, I_fft = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=150, method='fft',
+                                             fft_order=fft_order, fft_oversample=fft_oversample)
+    assert np.array_equal(thetas, thetas_fft)
+    assert np.abs(I_fft - I).max() < tol * np.abs(I).max()
+
+@pytest.mark.parametrize('symmetry', ['friedel', 225])
+def test_compute_xrd_symmetry_matches_full_mesh(symmetry):
+    atoms_df, meta = _nacl((2,2,2))
+    thetas, I = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=150)
+    thetas_sym, I_sym = spectral.compute_xrd(atoms_df, meta, 1.54, max2theta=150, 
+                                             symmetry=symmetry)
+    assert thetas_sym.shape[0] < thetas.shape[0]
+    # the intensities binned by angle are equal
+    angles, peaks = spectral._merge_peaks(thetas, I, 1e-6)
+    angles_sym, peaks_sym = spectral._merge_peaks(thetas_sym, I_sym, 1e-6)
+    assert np.allclose(angles_sym, angles, rtol=0, atol=1e-8)
+    assert np.allclose(peaks_sym, peaks, rtol=1e-10, atol=1e-10*peaks.max())
+
+def _cube_mesh_sphere(sim_abc, wlambda, min_theta, max_theta, rspace, manual, periodic):
+    """ the k-points within the Eswald's sphere, by brute force from a cube of indices """
+    basis, _ = spectral._mesh_basis(sim_abc, rspace, manual, periodic)
+    Kmax = 2 * np.sin(max_theta) / wlambda
+    nmax = np.ceil(Kmax * np.linalg.norm(np.linalg.inv(basis), axis=0)).astype(int) + 2
+    imesh = np.mgrid[-nmax[0]:nmax[0]+1, -nmax[1]:nmax[1]+1, 
+                     -nmax[2]:nmax[2]+1].reshape(3,-1).T
+    mask, _, _ = spectral._restrict_mask(imesh.dot(basis), wlambda, min_theta, max_theta)
+    return imesh[mask]
+
+@pytest.mark.parametrize('cellpar, periodic, rspace, manual', [
+    ([5.4,5.4,5.4,90,90,90], [True,True,True], [1.,1.,1.], False),
+    ([4.,5.,6.,70,80,110], [True,True,True], [1.,1.,1.], False),
+    ([4.,5.,6.,70,80,110], [True,False,True], [1.,1.,1.], False),
+    ([4.,5.,6.,70,80,110], [False,True,False], [0.5,1.,2.], False),
+    ([4.,5.,6.,70,80,110], [True,True,True], [0.2,0.3,0.25], True)])
+def test_iter_rmesh_sphere_matches_cube_mesh(cellpar, periodic, rspace, manual):
+    data = crystal.Crystal()
+    data.setup_data([[0,0,0]], ['Na'], 1, cellpar=cellpar)
+    meta = data.get_meta_data()
+    sim_abc = np.asarray([meta.a, meta.b, meta.c])
+    min_theta, max_theta = np.radians(10.)/2, np.radians(120.)/2
+    expected = _cube_mesh_sphere(sim_abc, 1.54, min_theta, max_theta, rspace, manual, periodic)
+    
+    chunks = list(spectral._iter_rmesh_sphere(sim_abc, 1.54, min_theta, max_theta, rspace, manual, 
+                                              periodic, chunk_size=100))
+    imesh = np.concatenate([chunk[0] for chunk in chunks])
+    assert all([chunk[0].shape[0] <= 100 for chunk in chunks])
+    assert imesh.shape[0] == expected.shape[0] > 0
+    assert set(map(tuple, imesh)) == set(map(tuple, expected))
+    
+    # the Friedel half-space holds each pair once
+    half = np.concatenate([chunk[0] for chunk in spectral._iter_rmesh_sphere(
+                sim_abc, 1.54, min_theta, max_theta, rspace, manual, periodic, friedel=True)])
+    assert set(map(tuple, half)) == set(map(tuple, expected[spectral._friedel_mask(expected)]))
+
+def _debye_exact(atoms_df, wlambda, ang2thetas):
+    """ the Debye scattering equation, summed over every pair of atoms """
+    thetas = np.radians(ang2thetas) / 2.
+    k_mods = 2 * np.sin(thetas) / wlambda
+    factors = spectral._calc_struct_factors(atoms_df, None, k_mods)
+    f = np.array([factors[atype] for atype in atoms_df.type])
+    xyz = atoms_df[['x','y','z']].values
+    dists = np.linalg.norm(xyz[:,None,:] - xyz[None,:,:], axis=2)
+    I = np.einsum('ik,jk,ijk->k', f, f, np.sinc(2 * k_mods[None,None,:] * dists[:,:,None]))
+    Lp = (1 + np.cos(2*thetas)**2) / (np.cos(thetas) * np.sin(thetas)**2)
+    return Lp * I / atoms_df.shape[0]
+
+@pytest.mark.parametrize('bin_width, tol', [(None, 1e-10), (1e-4, 1e-5), (0.005, 1e-3)])
+def test_compute_xrd_debye_exact(bin_width, tol):
+    rs = np.random.RandomState(0)
+    atoms_df = pd.DataFrame({'type':['Na','Cl']*10, 'x':rs.rand(20)*8, 
+                             'y':rs.rand(20)*8, 'z':rs.rand(20)*8})
+    ang2thetas, I = spectral.compute_xrd_debye(atoms_df, 1.54, 10., 120., step2theta=0.5, 
+                                               bin_width=bin_width)
+    assert np.allclose(ang2thetas, np.arange(10., 120.1, 0.5))
+    expected = _debye_exact(atoms_df, 1.54, ang2thetas)
+    assert np.abs(I - expected).max() < tol * np.abs(expected).max()
+
+class _Frames(DataInput):
+    """ a trajectory of in-memory configurations (with a fixed cell) """
+    def setup_data(self, frames, meta):
+        self._frames = frames
+        self._meta = meta
+        self._data_set = True
+    def _get_atom_data(self, config):
+        return self._frames[config-1].copy()
+    def _get_meta_data(self, config):
+        return self._meta.copy()
+    def _count_configs(self):
+        return len(self._frames)
+
+@pytest.mark.parametrize('method', ['direct', 'fft'])
+def test_compute_xrd_trajectory(method):
+    atoms_df, meta = _nacl((1,1,1))
+    rs = np.random.RandomState(0)
+    frames = []
+    for _ in range(3):
+        frame = atoms_df.copy()
+        frame[['x','y','z']] += rs.normal(scale=0.1, size=(atoms_df.shape[0],3))
+        frames.append(frame)
+    data = _Frames()
+    data.setup_data(frames, meta)
+    
+    results = [spectral.compute_xrd(frame, meta, 1.54, max2theta=120, method=method) 
+               for frame in frames]
+    I_frames = np.real(np.array([I for _, I in results]))
+    thetas, mean, var = spectral.compute_xrd_trajectory(data, None, 1.54, max2theta=120, 
+                                                        method=method)
+    assert np.array_equal(thetas, results[0][0])
+    assert np.allclose(mean, np.mean(I_frames, axis=0), rtol=1e-12, atol=0)
+    # the (sample) variance
+    assert np.allclose(var, np.var(I_frames, axis=0, ddof=1), rtol=1e-8, atol=1e-12*mean.max())
+    
+    thetas2, mean2, var2 = spectral.compute_xrd_trajectory(data, [1,2,3], 1.54, max2theta=120, 
+                                                           method=method, processes=2)
+    assert np.array_equal(thetas, thetas2)
+    assert np.array_equal(mean, mean2) and np.array_equal(var, var2)
+    
+    # a single configuration has zero variance
+    thetas3, mean3, var3 = spectral.compute_xrd_trajectory(data, [2], 1.54, max2theta=120, 
+                                                           method=method)
+    assert np.allclose(mean3, I_frames[1], rtol=1e-12, atol=0) and not var3.any()
+
+def _mott_bethe(atype, s):
+    """ electron scattering factor, from the x-ray factors by the Mott-Bethe formula """
+    coeffs = spectral.get_sf_coeffs('xray')
+    coeffs = coeffs[~coeffs.index.duplicated()].loc[atype]
+    fx = coeffs['C'] + sum([coeffs['A{}'.format(i)]*np.exp(-coeffs['B{}'.format(i)]*s**2) 
+                            for i in range(1, 5)])
+    Z = atom_data().loc[atype, 'Num']
+    return 0.023934 * (Z - fx) / s**2
+
+def test_electron_sf_coeffs_mott_bethe():
+    s = np.linspace(0.05, 2, 400)
+    coeffs = spectral.get_sf_coeffs('electron')
+    for atype, row in coeffs.iterrows():
+        fe = sum([row['A{}'.format(i)]*np.exp(-row['B{}'.format(i)]*s**2) for i in range(1, 6)])
+        f_mb = _mott_bethe(atype, s)
+        assert np.abs(fe - f_mb).max() < 0.005 * f_mb.max(), atype
+
+def test_compute_saed_reflection_mott_bethe():
+    atoms_df, meta = _nacl((1,1,1))
+    image, extent = spectral.compute_saed(atoms_df, meta, zone_axis=[0,0,1], 
+                                          kmax=1.7, resolution=501)
+    edges = np.linspace(-1.7, 1.7, 502)
+    # the (200) reflection, with all atoms scattering in phase
+    kx = 2. / 5.4
+    ix, iy = np.searchsorted(edges, [kx, 0.]) - 1
+    F = 4 * (_mott_bethe('Na', kx/2.) + _mott_bethe('Cl', kx/2.))
+    assert np.isclose(image[iy, ix], F**2 / 8, rtol=0.01)
+
+@pytest.mark.parametrize('shape', ['gaussian', 'lorentzian'])
+def test_xrd_profile_single_peak(shape):
+    angle, fwhm, step = 50.003, 0.2, 0.01
+    grid, profile = spectral.xrd_profile([angle], [10.], fwhm=fwhm, shape=shape, 
+                                         step=step, min2theta=0., max2theta=100.)
+    if shape == 'gaussian':
+        expected = 10.
+    else:
+        # the lorentzian tails outside of the profile range are lost
+        gamma = 0.5 * fwhm
+        expected = 10. * (np.arctan((100.-angle)/gamma) + np.arctan(angle/gamma)) / np.pi
+    assert np.isclose(profile.sum() * step, expected, rtol=1e-6)
+    assert np.isclose((grid*profile).sum() / profile.sum(), angle, rtol=0, atol=1e-4)
+    assert np.isclose(grid[np.argmax(profile)], angle, rtol=0, atol=step)
+
+def test_merge_peaks_tolerance():
+    angles, intensities = spectral._merge_peaks([30., 20.+5e-7, 20., 30.1], 
+                                                [1., 2., 3., 4.], tolerance=1e-6)
+    assert np.allclose(angles, [20.+2.5e-7, 30., 30.1])
+    assert np.allclose(intensities, [5., 1., 4.])
+    
+    # merged peaks give the same profile as a single peak
+    grid, profile = spectral.xrd_profile([20., 20.+5e-7], [3., 2.], 
+                                         min2theta=10., max2theta=40.)
+    grid2, profile2 = spectral.xrd_profile([20.+2.5e-7], [5.], 
+                                           min2theta=10., max2theta=40.)
+    assert np.allclose(profile, profile2, rtol=0, atol=1e-10)